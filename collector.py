@@ -1,11 +1,27 @@
 from flask import Flask, request, Response
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST, make_wsgi_app
+from prometheus_client import (Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST, make_wsgi_app,
+                               CollectorRegistry, REGISTRY, multiprocess)
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
+import os
 import json
 import time
 
 app = Flask(__name__)
 
+# Produção: gunicorn -c gunicorn.conf.py collector:app (vários workers).
+# Com PROMETHEUS_MULTIPROC_DIR definido, cada worker grava suas métricas em
+# arquivos mmap e o /metrics agrega todos os processos.
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+def metrics_registry():
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+METRICS_REGISTRY = metrics_registry()
+
 # === MÉTRICAS ESPECÍFICAS PARA NI-FI + SCRAPER ===
 NIFI_RECORDS_TOTAL = Counter(
     'nifi_records_total',
@@ -110,15 +126,16 @@ def health():
 
 @app.route('/metrics')
 def metrics():
-    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(METRICS_REGISTRY), mimetype=CONTENT_TYPE_LATEST)
 
 
 # Monta /metrics via DispatcherMiddleware (opcional, mas útil se for expandir)
 app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
-    '/metrics': make_wsgi_app()
+    '/metrics': make_wsgi_app(METRICS_REGISTRY)
 })
 
 
 if __name__ == '__main__':
+    # modo desenvolvimento (um processo); produção usa gunicorn.conf.py
     # CORRIGIDO: host='0.0.0.0' (não '0.0.0')
     app.run(host='0.0.0.0', port=9000, debug=False)
\ No newline at end of file
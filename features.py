@@ -0,0 +1,220 @@
+"""
+features.py
+
+Feature store incremental para ML (`features_crypto`), alimentado por `raw_crypto`:
+- log return, volatilidade (desvio padrão dos log returns), média móvel,
+  RSI e z-score de volume para cada janela em FEATURE_WINDOWS
+- Cálculo vetorizado (pandas rolling) apenas para as barras novas + o lookback
+  mínimo (max(janelas) + 1 barras) — custo por ciclo O(barras novas), não O(histórico)
+- Janelas novas viram colunas novas (ALTER TABLE idempotente)
+
+Uso típico: chamado pelo yahoo_scraper.py / run_once.py logo após o upsert.
+"""
+
+import os
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import profiling
+from write_buffer import upsert_rows
+
+# -------------------- Config (ENV-friendly) --------------------
+FEATURE_WINDOWS = [int(w) for w in os.getenv("FEATURE_WINDOWS", "24,168").split(",") if w.strip()]
+FEATURE_BATCH_ROWS = int(os.getenv("FEATURE_BATCH_ROWS", "500"))
+# --------------------------------------------------------------
+
+TABLE = "features_crypto"
+
+# passo do grid de cada intervalo (s); seleciona em raw_crypto só as barras alinhadas
+INTERVAL_SECONDS = {"1m": 60, "2m": 120, "5m": 300, "15m": 900, "30m": 1800,
+                    "1h": 3600, "60m": 3600, "1d": 86400}
+
+logger = logging.getLogger("pipeline.features")
+
+
+def feature_columns(windows: Sequence[int]) -> List[str]:
+    cols = ["log_return"]
+    for w in windows:
+        cols += ["ma_%d" % w, "volatility_%d" % w, "rsi_%d" % w, "volume_z_%d" % w]
+    return cols
+
+def grid_clause(interval: str) -> str:
+    """Filtro SQL das barras alinhadas ao intervalo (independe do time_zone da sessão)."""
+    step = INTERVAL_SECONDS[interval]
+    return "MOD(TIMESTAMPDIFF(SECOND, '1970-01-01', `timestamp`), %d) = 0" % step
+
+
+# ---------- Schema ----------
+def ensure_features_table(cursor, windows: Sequence[int] = FEATURE_WINDOWS) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS features_crypto (
+            symbol VARCHAR(20) NOT NULL,
+            bar_interval VARCHAR(8) NOT NULL,
+            `timestamp` DATETIME(6) NOT NULL,
+            `close` DECIMAL(20,8),
+            log_return DOUBLE,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY (symbol, bar_interval, `timestamp`)
+        ) ENGINE=InnoDB
+        """
+    )
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (TABLE,),
+    )
+    existing = {r[0] for r in cursor.fetchall()}
+    missing = [c for c in feature_columns(windows) if c not in existing]
+    if missing:
+        cursor.execute(
+            "ALTER TABLE %s %s" % (TABLE, ", ".join("ADD COLUMN `%s` DOUBLE" % c for c in missing))
+        )
+        logger.info("Added feature columns %s", missing)
+
+
+# ---------- Cálculo (vetorizado) ----------
+def compute_features(bars: pd.DataFrame, windows: Sequence[int] = FEATURE_WINDOWS) -> pd.DataFrame:
+    """
+    `bars`: index = timestamp (ordenado), colunas `close` e `volume`.
+    Janelas usam min_periods=w, então as primeiras barras sem lookback ficam NaN.
+    RSI usa médias simples (Cutler) para ser reprodutível com lookback finito.
+    """
+    close = bars["close"].astype("float64")
+    volume = bars["volume"].astype("float64")
+    out = pd.DataFrame(index=bars.index)
+    out["close"] = close
+    log_ret = np.log(close.where(close > 0)).diff()
+    out["log_return"] = log_ret
+    delta = close.diff()
+    gain = delta.clip(lower=0)
+    loss = -delta.clip(upper=0)
+    for w in windows:
+        out["ma_%d" % w] = close.rolling(w, min_periods=w).mean()
+        out["volatility_%d" % w] = log_ret.rolling(w, min_periods=w).std()
+        avg_gain = gain.rolling(w, min_periods=w).mean()
+        avg_loss = loss.rolling(w, min_periods=w).mean()
+        rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+        out["rsi_%d" % w] = rsi.where(avg_loss != 0, 100.0)
+        vol_mean = volume.rolling(w, min_periods=w).mean()
+        vol_std = volume.rolling(w, min_periods=w).std()
+        out["volume_z_%d" % w] = (volume - vol_mean) / vol_std.where(vol_std != 0)
+    return out
+
+
+# ---------- Leitura incremental ----------
+def _load_bars(cursor, symbol: str, interval: str, since: Optional[datetime], lookback: int) -> pd.DataFrame:
+    """Barras >= since + as `lookback` barras anteriores (ou todo o histórico se since=None)."""
+    grid = grid_clause(interval)
+    rows = []
+    if since is None:
+        start_clause = ""
+        params = (symbol,)
+        if interval != "1d":
+            # barras diárias do backfill (00:00) também caem no grid intraday;
+            # o primeiro build intraday começa na primeira barra realmente intraday
+            cursor.execute(
+                "SELECT MIN(`timestamp`) FROM raw_crypto WHERE symbol = %s AND TIME(`timestamp`) <> '00:00:00'",
+                (symbol,),
+            )
+            (first,) = cursor.fetchone()
+            if first is None:
+                return pd.DataFrame(columns=["close", "volume"])
+            start_clause = " AND `timestamp` >= %s"
+            params = (symbol, first)
+        cursor.execute(
+            "SELECT `timestamp`, price_usd, volume_24h_usd FROM raw_crypto "
+            "WHERE symbol = %s AND " + grid + start_clause + " ORDER BY `timestamp`",
+            params,
+        )
+        rows = cursor.fetchall()
+    else:
+        cursor.execute(
+            "SELECT `timestamp`, price_usd, volume_24h_usd FROM raw_crypto "
+            "WHERE symbol = %s AND `timestamp` < %s AND " + grid + " ORDER BY `timestamp` DESC LIMIT %s",
+            (symbol, since, lookback),
+        )
+        rows = list(reversed(cursor.fetchall()))
+        cursor.execute(
+            "SELECT `timestamp`, price_usd, volume_24h_usd FROM raw_crypto "
+            "WHERE symbol = %s AND `timestamp` >= %s AND " + grid + " ORDER BY `timestamp`",
+            (symbol, since),
+        )
+        rows += cursor.fetchall()
+    df = pd.DataFrame(rows, columns=["timestamp", "close", "volume"]).set_index("timestamp")
+    df["close"] = pd.to_numeric(df["close"], errors="coerce")
+    df["volume"] = pd.to_numeric(df["volume"], errors="coerce")
+    return df
+
+
+def _upsert_sql(cols: List[str]) -> str:
+    names = ["symbol", "bar_interval", "`timestamp`", "`close`"] + ["`%s`" % c for c in cols] + ["updated_at"]
+    updates = ", ".join("`{0}` = VALUES(`{0}`)".format(c) for c in ["close"] + cols + ["updated_at"])
+    return "INSERT INTO %s (%s) VALUES (%s) ON DUPLICATE KEY UPDATE %s" % (
+        TABLE, ", ".join(names), ", ".join(["%s"] * len(names)), updates)
+
+
+def incremental_start(last_feature: Optional[datetime], changed: Optional[datetime]) -> Optional[datetime]:
+    """
+    Primeira barra a recalcular: a última com features (inclusive — a barra corrente pode
+    ter mudado) ou, se antes dela, a barra mais antiga reescrita neste ciclo (um upsert
+    pode corrigir barras já calculadas). None = símbolo sem features ainda (build completo).
+    """
+    if last_feature is None or changed is None:
+        return last_feature
+    return min(last_feature, changed)
+
+def update_features(pool, symbols: Iterable[str], interval: str = "1h",
+                    windows: Sequence[int] = FEATURE_WINDOWS,
+                    since: Optional[datetime] = None,
+                    changed: Optional[Dict[str, datetime]] = None) -> Dict[str, int]:
+    """
+    Atualiza `features_crypto` para os símbolos dados. Por símbolo, recalcula a partir
+    de incremental_start (`changed` = barra mais antiga gravada no ciclo, por símbolo)
+    ou de `since` se informado. Retorna {symbol: linhas gravadas}.
+    """
+    windows = sorted(set(windows))
+    cols = feature_columns(windows)
+    lookback = max(windows) + 1
+    sql = _upsert_sql(cols)
+    now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    written: Dict[str, int] = {}
+
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_features_table(cursor, windows)
+        for symbol in symbols:
+            start = since
+            # só as leituras: a escrita já conta io("db") dentro do upsert_rows
+            with profiling.io("db"):
+                if start is None:
+                    cursor.execute(
+                        "SELECT MAX(`timestamp`) FROM features_crypto WHERE symbol = %s AND bar_interval = %s",
+                        (symbol, interval),
+                    )
+                    (last,) = cursor.fetchone()
+                    start = incremental_start(last, (changed or {}).get(symbol))
+                bars = _load_bars(cursor, symbol, interval, start, lookback)
+            if bars.empty:
+                written[symbol] = 0
+                continue
+            feats = compute_features(bars, windows)
+            if start is not None:
+                feats = feats[feats.index >= start]
+            feats = feats.astype(object).where(feats.notna(), None)
+            rows = [
+                (symbol, interval, ts, r[0], *r[1:], now)
+                for ts, r in zip(feats.index.to_pydatetime(), feats[["close"] + cols].itertuples(index=False, name=None))
+            ]
+            n, errs = upsert_rows(pool, sql, rows, FEATURE_BATCH_ROWS)
+            written[symbol] = 0 if errs else len(rows)
+    finally:
+        cursor.close()
+        conn.close()
+    logger.info("Features updated interval=%s rows=%s", interval, written)
+    return written
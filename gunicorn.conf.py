@@ -0,0 +1,42 @@
+"""
+gunicorn.conf.py
+
+Modo de produção do collector.py (vários workers, um por core):
+
+    gunicorn -c gunicorn.conf.py collector:app
+
+- PROMETHEUS_MULTIPROC_DIR: métricas compartilhadas entre workers (mmap);
+  montado num volume para os counters sobreviverem a restarts
+- on_starting: compacta os arquivos de execuções anteriores (metrics_store.py)
+- child_exit: limpa os gauges "live" do worker que morreu
+"""
+
+import os
+import multiprocessing
+
+# precisa estar no ambiente antes dos workers importarem prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/var/lib/collector_metrics")
+
+# -------------------- Config (ENV-friendly) --------------------
+bind = "0.0.0.0:%s" % os.getenv("COLLECTOR_PORT", "9000")
+workers = int(os.getenv("COLLECTOR_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("COLLECTOR_THREADS", "4"))
+keepalive = int(os.getenv("COLLECTOR_KEEPALIVE_SEC", "5"))
+timeout = int(os.getenv("COLLECTOR_TIMEOUT_SEC", "30"))
+accesslog = os.getenv("COLLECTOR_ACCESS_LOG") or None
+# --------------------------------------------------------------
+
+# o master não importa o app: assim não cria arquivos de métricas próprios
+preload_app = False
+
+
+def on_starting(server):
+    import metrics_store
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    server.log.info("Metrics snapshot compaction: %s", metrics_store.compact(directory))
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+loadtest_collector.py
+
+Gerador de carga local para o POST /ingest do collector.py:
+- Replay de eventos de um arquivo JSONL (um payload de /ingest por linha, no
+  formato que o scraper envia) ou eventos sintéticos com cardinalidade de
+  labels configurável (símbolos x flows x regiões)
+- Malha aberta numa taxa alvo (eventos/s); várias taxas em sequência com
+  --rate 200,500,1000. A latência é medida a partir do horário AGENDADO do
+  envio, então fila no gerador/collector aparece nos percentis (sem
+  "coordinated omission")
+- Relatório por taxa: throughput, p50/p99/p999, taxa de erro e RSS do
+  collector (processo + filhos, ex.: workers do gunicorn) via /proc
+- Baseline de regressão: --save-baseline grava o relatório; --baseline compara
+  e sai com código 1 se throughput/p99/erros piorarem além da tolerância
+
+Exemplos:
+    python loadtest_collector.py --rate 500 --duration 30 --pid $(cat gunicorn.pid)
+    python loadtest_collector.py --events samples.jsonl --rate 200,1000 --save-baseline base.json
+    python loadtest_collector.py --rate 200,1000 --baseline base.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+# -------------------- Config (ENV-friendly) --------------------
+LOADTEST_URL = os.getenv("LOADTEST_URL", "http://localhost:9000")
+LOADTEST_CONCURRENCY = int(os.getenv("LOADTEST_CONCURRENCY", "32"))
+LOADTEST_TIMEOUT_SEC = float(os.getenv("LOADTEST_TIMEOUT_SEC", "5"))
+# piora relativa aceita contra o baseline (0.10 = 10%)
+LOADTEST_TOLERANCE = float(os.getenv("LOADTEST_TOLERANCE", "0.10"))
+# --------------------------------------------------------------
+
+INGEST_FIELDS = ("flow_name", "symbol", "records_total", "errors", "latencia_ms", "status")
+STATUSES = ("success", "success", "success", "failure")
+ERROR_TYPES = ("scraper_error", "circuit_open", "timeout")
+
+
+# ---------- Eventos ----------
+def load_events(path: str) -> List[Dict]:
+    """Payloads de /ingest de um JSONL; linhas que não têm cara de payload são ignoradas."""
+    events, skipped = [], 0
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if isinstance(obj, dict) and any(k in obj for k in INGEST_FIELDS):
+                events.append(obj)
+            else:
+                skipped += 1
+    if skipped:
+        print("warning: %d lines in %s are not /ingest payloads and were skipped" % (skipped, path), file=sys.stderr)
+    if not events:
+        raise ValueError("nenhum payload de /ingest em %s" % path)
+    return events
+
+def synth_events(n: int, symbols: int, flows: int, regions: int, seed: int = 42) -> List[Dict]:
+    """Eventos no formato do payload do scraper com cardinalidade symbols x flows x regions."""
+    rnd = random.Random(seed)
+    events = []
+    for _ in range(n):
+        status = rnd.choice(STATUSES)
+        failed = status != "success"
+        events.append({
+            "flow_name": "flow_%d" % rnd.randrange(flows),
+            "symbol": "SYM%d-USD" % rnd.randrange(symbols),
+            "records_total": rnd.randint(1, 500),
+            "errors": rnd.randint(1, 3) if failed else 0,
+            "latencia_ms": round(rnd.lognormvariate(6, 1), 3),
+            "status": status,
+            "error_type": rnd.choice(ERROR_TYPES) if failed else "none",
+            "regiao_origem": "region_%d" % rnd.randrange(regions),
+        })
+    return events
+
+
+# ---------- RSS do collector ----------
+def _children(pid: int) -> List[int]:
+    out = []
+    task_dir = "/proc/%d/task" % pid
+    try:
+        for tid in os.listdir(task_dir):
+            with open(os.path.join(task_dir, tid, "children")) as f:
+                out += [int(c) for c in f.read().split()]
+    except OSError:
+        pass
+    return out
+
+def tree_rss_bytes(pid: int) -> Optional[int]:
+    """VmRSS somado do processo e descendentes (master + workers). None se indisponível."""
+    total, found, stack, seen = 0, False, [pid], set()
+    while stack:
+        p = stack.pop()
+        if p in seen:
+            continue
+        seen.add(p)
+        try:
+            with open("/proc/%d/status" % p) as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        found = True
+                        break
+        except OSError:
+            continue
+        stack += _children(p)
+    return total if found else None
+
+class RssSampler(threading.Thread):
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[int] = []
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            rss = tree_rss_bytes(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            self._done.wait(self.interval)
+
+    def stop(self) -> Dict:
+        self._done.set()
+        self.join()
+        if not self.samples:
+            return {}
+        return {"rss_start_bytes": self.samples[0], "rss_end_bytes": self.samples[-1],
+                "rss_max_bytes": max(self.samples)}
+
+
+# ---------- Execução ----------
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentil nearest-rank (q em 0..100)."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(q / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+def run_stage(url: str, events: List[Dict], rate: float, duration: float,
+              concurrency: int = LOADTEST_CONCURRENCY, timeout: float = LOADTEST_TIMEOUT_SEC,
+              pid: Optional[int] = None) -> Dict:
+    """Envia rate*duration eventos em malha aberta e retorna as métricas do estágio."""
+    endpoint = url.rstrip("/") + "/ingest"
+    total = max(1, int(rate * duration))
+    local = threading.local()
+    latencies: List[float] = []
+    errors = {"http": 0, "exception": 0}
+    lock = threading.Lock()
+
+    def send(i: int, scheduled: float):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        kind = None
+        try:
+            resp = session.post(endpoint, json=events[i % len(events)], timeout=timeout)
+            if resp.status_code != 200:
+                kind = "http"
+        except requests.RequestException:
+            kind = "exception"
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            latencies.append(elapsed)
+            if kind:
+                errors[kind] += 1
+
+    sampler = RssSampler(pid) if pid else None
+    if sampler:
+        sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            scheduled = start + i / rate
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(send, i, scheduled)
+    elapsed = time.perf_counter() - start
+
+    lat = sorted(latencies)
+    failed = errors["http"] + errors["exception"]
+    result = {
+        "target_rate": rate,
+        "sent": total,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+        "error_rate": round(failed / total, 6),
+        "errors": errors,
+        "p50_ms": round(percentile(lat, 50) * 1000, 3),
+        "p99_ms": round(percentile(lat, 99) * 1000, 3),
+        "p999_ms": round(percentile(lat, 99.9) * 1000, 3),
+        "max_ms": round(lat[-1] * 1000, 3) if lat else 0.0,
+    }
+    if sampler:
+        result.update(sampler.stop())
+    return result
+
+
+# ---------- Baseline ----------
+def compare(report: Dict, baseline: Dict, tolerance: float = LOADTEST_TOLERANCE) -> List[str]:
+    """Lista de regressões do report contra o baseline (estágios casados pela taxa alvo)."""
+    base_stages = {s["target_rate"]: s for s in baseline.get("stages", [])}
+    problems = []
+    for s in report["stages"]:
+        b = base_stages.get(s["target_rate"])
+        if b is None:
+            continue
+        rate = s["target_rate"]
+        if s["throughput_rps"] < b["throughput_rps"] * (1 - tolerance):
+            problems.append("rate=%s throughput %.1f < baseline %.1f" % (rate, s["throughput_rps"], b["throughput_rps"]))
+        for key in ("p99_ms", "p999_ms"):
+            if s[key] > b[key] * (1 + tolerance):
+                problems.append("rate=%s %s %.3f > baseline %.3f" % (rate, key, s[key], b[key]))
+        if s["error_rate"] > b["error_rate"] + tolerance / 100:
+            problems.append("rate=%s error_rate %.4f > baseline %.4f" % (rate, s["error_rate"], b["error_rate"]))
+        if b.get("rss_max_bytes") and s.get("rss_max_bytes", 0) > b["rss_max_bytes"] * (1 + tolerance):
+            problems.append("rate=%s rss_max %d > baseline %d" % (rate, s["rss_max_bytes"], b["rss_max_bytes"]))
+    return problems
+
+
+# ------------------ CLI ------------------
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load test for collector.py /ingest")
+    parser.add_argument("--url", default=LOADTEST_URL)
+    parser.add_argument("--rate", default="200", help="Eventos/s; lista separada por vírgula roda um estágio por taxa")
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos por estágio")
+    parser.add_argument("--concurrency", type=int, default=LOADTEST_CONCURRENCY)
+    parser.add_argument("--events", help="JSONL de payloads de /ingest para replay (default: sintético)")
+    parser.add_argument("--symbols", type=int, default=50, help="Cardinalidade sintética de symbol")
+    parser.add_argument("--flows", type=int, default=3, help="Cardinalidade sintética de flow_name")
+    parser.add_argument("--regions", type=int, default=2, help="Cardinalidade sintética de regiao_origem")
+    parser.add_argument("--pid", type=int, help="PID do collector (master do gunicorn) para medir RSS")
+    parser.add_argument("--save-baseline", help="Grava o relatório como baseline neste caminho")
+    parser.add_argument("--baseline", help="Compara com este baseline; sai com 1 em caso de regressão")
+    parser.add_argument("--tolerance", type=float, default=LOADTEST_TOLERANCE)
+    args = parser.parse_args()
+
+    events = load_events(args.events) if args.events else synth_events(10000, args.symbols, args.flows, args.regions)
+    rates = [float(r) for r in args.rate.split(",") if r.strip()]
+    report = {
+        "url": args.url,
+        "events": args.events or "synthetic(symbols=%d,flows=%d,regions=%d)" % (args.symbols, args.flows, args.regions),
+        "concurrency": args.concurrency,
+        "duration_sec": args.duration,
+        "stages": [run_stage(args.url, events, r, args.duration, args.concurrency, pid=args.pid) for r in rates],
+    }
+    print(json.dumps(report, indent=1))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for p in problems:
+            print("REGRESSION: %s" % p, file=sys.stderr)
+        sys.exit(1 if problems else 0)
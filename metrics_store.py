@@ -0,0 +1,105 @@
+"""
+metrics_store.py
+
+Persistência das métricas do collector em modo multi-processo
+(prometheus_client multiprocess, PROMETHEUS_MULTIPROC_DIR):
+- Cada worker grava counter_<pid>.db / histogram_<pid>.db; o /metrics soma todos
+- Os arquivos de counters/histogramas NÃO são apagados no restart: assim os
+  totais continuam de onde pararam e o rate() do Prometheus não vê resets
+- compact() roda no master do gunicorn antes de subir os workers: junta os
+  arquivos de pids antigos num único <tipo>_snapshot.db, para o /metrics não
+  ficar mais lento a cada restart; gauges de processos mortos são descartados
+
+A compactação é segura contra crash: os arquivos de origem são movidos para
+_compact_<tipo>/ antes do merge e só apagados depois que o snapshot novo está no lugar
+(marcador DONE). Se o processo morrer no meio, a próxima compactação refaz o merge.
+"""
+
+import os
+import glob
+import shutil
+import logging
+from typing import Dict, List
+
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# -------------------- Config (ENV-friendly) --------------------
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+# --------------------------------------------------------------
+
+# tipos cujos valores são somados entre processos (podem ser compactados)
+ACCUMULATED_TYPES = ("counter", "histogram", "summary")
+WORK_DIR = "_compact"
+DONE_MARKER = "DONE"
+
+logger = logging.getLogger("pipeline.metrics_store")
+
+
+def _write_snapshot(path: str, files: List[str]) -> int:
+    """Merge (sem acumular buckets) de `files` num único arquivo mmap. Retorna nº de séries."""
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    series = 0
+    store = MmapedDict(tmp)
+    try:
+        for metric in MultiProcessCollector.merge(files, accumulate=False):
+            for s in metric.samples:
+                key = mmap_key(metric.name, s.name, list(s.labels), list(s.labels.values()), metric.documentation)
+                store.write_value(key, s.value, 0.0)
+                series += 1
+    finally:
+        store.close()
+    os.replace(tmp, path)
+    return series
+
+
+def compact(directory: str = PROMETHEUS_MULTIPROC_DIR) -> Dict:
+    """
+    Compacta counters/histogramas de todos os pids em <tipo>_snapshot.db e remove
+    gauges órfãos. Deve rodar sem workers vivos (hook on_starting do gunicorn).
+    Retorna {"files_merged": n, "series": n, "gauges_removed": n}.
+    """
+    result = {"files_merged": 0, "series": 0, "gauges_removed": 0}
+    if not directory:
+        return result
+    os.makedirs(directory, exist_ok=True)
+
+    for typ in ACCUMULATED_TYPES:
+        work = os.path.join(directory, "%s_%s" % (WORK_DIR, typ))
+        if os.path.exists(os.path.join(work, DONE_MARKER)):
+            # crash depois do snapshot novo: as origens já estão contabilizadas
+            shutil.rmtree(work)
+        sources = glob.glob(os.path.join(directory, "%s_*.db" % typ))
+        pending = glob.glob(os.path.join(work, "*.db"))
+        if not pending and len(sources) <= 1:
+            continue  # nada a juntar (no máximo o próprio snapshot)
+        os.makedirs(work, exist_ok=True)
+        for f in sources:
+            os.replace(f, os.path.join(work, os.path.basename(f)))
+        files = sorted(glob.glob(os.path.join(work, "*.db")))
+        result["series"] += _write_snapshot(os.path.join(directory, "%s_snapshot.db" % typ), files)
+        result["files_merged"] += len(files)
+        open(os.path.join(work, DONE_MARKER), "w").close()
+        shutil.rmtree(work)
+
+    # gauges são por pid e valem só enquanto o processo vive
+    for f in glob.glob(os.path.join(directory, "gauge_*.db")):
+        os.remove(f)
+        result["gauges_removed"] += 1
+
+    if result["files_merged"] or result["gauges_removed"]:
+        logger.info("Compacted metrics in %s: %s", directory, result)
+    return result
+
+
+# ------------------ CLI ------------------
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Compact prometheus_client multiprocess files into snapshots")
+    parser.add_argument("--dir", default=PROMETHEUS_MULTIPROC_DIR, required=not PROMETHEUS_MULTIPROC_DIR)
+    args = parser.parse_args()
+    print(compact(args.dir))
@@ -0,0 +1,99 @@
+"""
+negative_cache.py
+
+Cache negativo persistido para tickers que voltam vazios (deslistados, renomeados,
+digitados errado no --tickers):
+- Chave (ticker, interval), guarda quantos resultados vazios seguidos houve
+- A partir de NEG_CACHE_THRESHOLD vazios seguidos o ticker é pulado e só
+  re-sondado num agendamento exponencial: BASE, 2*BASE, 4*BASE... até MAX
+- Qualquer resultado com dados remove o ticker do cache
+
+Persistido em JSON (NEG_CACHE_PATH), gravado de forma atômica no fim do ciclo.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+# -------------------- Config (ENV-friendly) --------------------
+NEG_CACHE_PATH = os.getenv("NEG_CACHE_PATH", ".negative_cache.json")
+NEG_CACHE_THRESHOLD = int(os.getenv("NEG_CACHE_THRESHOLD", "2"))
+NEG_CACHE_BASE_SEC = float(os.getenv("NEG_CACHE_BASE_SEC", "3600"))
+NEG_CACHE_MAX_SEC = float(os.getenv("NEG_CACHE_MAX_SEC", str(7 * 86400)))
+# --------------------------------------------------------------
+
+logger = logging.getLogger("pipeline.negative_cache")
+
+
+class NegativeCache:
+
+    def __init__(self, path: Optional[str] = NEG_CACHE_PATH, threshold: int = NEG_CACHE_THRESHOLD,
+                 base_sec: float = NEG_CACHE_BASE_SEC, max_sec: float = NEG_CACHE_MAX_SEC):
+        self.path = path
+        self.threshold = max(1, threshold)
+        self.base_sec = base_sec
+        self.max_sec = max_sec
+        self.entries: Dict[str, Dict] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key(ticker: str, interval: str) -> str:
+        return "%s|%s" % (ticker, interval)
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            # cache corrompido não pode travar a coleta: começa vazio
+            logger.warning("Ignoring unreadable negative cache %s: %s", self.path, e)
+            self.entries = {}
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(self.entries, f, indent=1, sort_keys=True)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                # chamado em finally: não pode mascarar a exceção do ciclo; tenta de novo no próximo
+                logger.warning("Could not save negative cache %s: %s", self.path, e)
+                return
+            self._dirty = False
+
+    def should_skip(self, ticker: str, interval: str, now: Optional[float] = None) -> bool:
+        entry = self.entries.get(self.key(ticker, interval))
+        if not entry or entry["empty_count"] < self.threshold:
+            return False
+        return (time.time() if now is None else now) < entry["next_probe"]
+
+    def record_empty(self, ticker: str, interval: str, now: Optional[float] = None) -> Dict:
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self.entries.setdefault(self.key(ticker, interval), {"empty_count": 0, "first_empty": now})
+            entry["empty_count"] += 1
+            entry["last_probe"] = now
+            over = entry["empty_count"] - self.threshold
+            delay = 0.0 if over < 0 else min(self.max_sec, self.base_sec * (2 ** over))
+            entry["next_probe"] = now + delay
+            self._dirty = True
+        if delay:
+            logger.info("Negative-caching %s (%s) after %d empty results; next probe in %.0fs",
+                        ticker, interval, entry["empty_count"], delay)
+        return entry
+
+    def record_hit(self, ticker: str, interval: str) -> None:
+        with self._lock:
+            if self.entries.pop(self.key(ticker, interval), None) is not None:
+                self._dirty = True
+                logger.info("%s (%s) returned data again; removed from negative cache", ticker, interval)
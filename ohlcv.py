@@ -0,0 +1,39 @@
+"""
+ohlcv.py
+
+Agregação de barras OHLCV compartilhada entre yahoo_scraper.py e run_once.py:
+raw_crypto guarda uma barra por (symbol, hora) (ou 00:00 UTC no diário), então
+barras sub-hora (1m/5m/15m...) são agregadas para a hora antes do upsert.
+"""
+
+import logging
+
+import pandas as pd
+
+# granularidade intradiária gravada em raw_crypto
+STORE_FREQ = "1h"
+OHLCV_AGG = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+logger = logging.getLogger("pipeline.ohlcv")
+
+
+def resample_ohlcv(df: pd.DataFrame, freq: str = STORE_FREQ) -> pd.DataFrame:
+    """
+    Agrega barras para `freq` (início da barra, UTC): primeiro Open, maior High,
+    menor Low, último Close e soma do Volume. Vetorizado (groupby no índice truncado);
+    só cria barras para períodos que tiveram dados.
+    Se as barras já estão alinhadas e sem repetição, devolve o próprio df.
+    """
+    if df is None or df.empty:
+        return df
+    idx = df.index.tz_localize("UTC") if df.index.tz is None else df.index.tz_convert("UTC")
+    floored = idx.floor(freq)
+    if (floored == idx).all() and floored.is_unique:
+        return df
+    agg = {c: f for c, f in OHLCV_AGG.items() if c in df.columns}
+    out = df[list(agg)].groupby(floored).agg(agg)
+    out.index.name = df.index.name
+    if "Volume" in out.columns:
+        out["Volume"] = out["Volume"].astype("Int64")
+    logger.debug("Resampled %d bars -> %d (%s)", len(df), len(out), freq)
+    return out
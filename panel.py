@@ -0,0 +1,255 @@
+"""
+panel.py
+
+Painel alinhado multi-ticker (timestamps x símbolos) lido direto de `raw_crypto`:
+- Uma única query em lote por carga (sem loop por ticker, sem sets de Python)
+- Alinhamento 'intersection' (só timestamps presentes em todos os símbolos)
+  ou 'ffill' (união de timestamps com forward-fill por símbolo)
+- Cache em disco como .npy memory-mapped (um subdiretório por versão; meta.json
+  aponta a versão corrente e é trocado por último), estendido incrementalmente:
+  só as barras a partir do último timestamp em cache são buscadas no MySQL;
+  linhas antigas regravadas (backfill, correção; via ingested_at) fazem
+  rebuscar a partir delas, e linhas sumidas (retenção) reconstroem o cache
+
+Exemplo:
+    from panel import load_panel
+    closes = load_panel(POOL, ["BTC-USD", "ETH-USD"], field="price_usd",
+                        interval="1h", align="intersection")
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from features import INTERVAL_SECONDS, grid_clause
+
+# -------------------- Config (ENV-friendly) --------------------
+PANEL_CACHE_DIR = os.getenv("PANEL_CACHE_DIR", ".panel_cache")
+# folga do watermark de ingested_at (transações que commitam atrasadas)
+PANEL_SETTLE_SEC = int(os.getenv("PANEL_SETTLE_SEC", "300"))
+# --------------------------------------------------------------
+
+FIELDS = ("price_usd", "volume_24h_usd", "change_24h_percent")
+ALIGNMENTS = ("intersection", "ffill", "none")
+
+logger = logging.getLogger("pipeline.panel")
+
+
+# ---------- Query em lote ----------
+def _empty_panel(symbols: Sequence[str]) -> pd.DataFrame:
+    return pd.DataFrame(index=pd.DatetimeIndex([], name="timestamp"), columns=list(symbols), dtype="float64")
+
+def _query(pool, symbols: Sequence[str], field: str, interval: str,
+           start: Optional[datetime], end: Optional[datetime]) -> pd.DataFrame:
+    """Uma query para todos os símbolos; pivot vetorizado para (timestamps x símbolos)."""
+    if field not in FIELDS:
+        raise ValueError("field deve ser um de %s" % (FIELDS,))
+    if not symbols:
+        return _empty_panel(symbols)
+    where = ["symbol IN (%s)" % ", ".join(["%s"] * len(symbols)), grid_clause(interval)]
+    params: List = list(symbols)
+    if start is not None:
+        where.append("`timestamp` >= %s")
+        params.append(start)
+    if end is not None:
+        where.append("`timestamp` < %s")
+        params.append(end)
+    sql = "SELECT `timestamp`, symbol, %s FROM raw_crypto WHERE %s ORDER BY `timestamp`" % (
+        field, " AND ".join(where))
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    long = pd.DataFrame(rows, columns=["timestamp", "symbol", "value"])
+    long["value"] = pd.to_numeric(long["value"], errors="coerce").astype("float64")
+    wide = long.pivot(index="timestamp", columns="symbol", values="value")
+    return wide.reindex(columns=list(symbols)).astype("float64")
+
+
+# ---------- Alinhamento ----------
+def align_panel(wide: pd.DataFrame, align: str = "intersection") -> pd.DataFrame:
+    if align not in ALIGNMENTS:
+        raise ValueError("align deve ser um de %s" % (ALIGNMENTS,))
+    if align == "intersection":
+        return wide[wide.notna().all(axis=1).to_numpy()]
+    if align == "ffill":
+        return wide.ffill()
+    return wide
+
+
+# ---------- Cache memory-mapped ----------
+def _cache_path(cache_dir: str, symbols: Sequence[str], field: str, interval: str) -> str:
+    key = hashlib.sha1(",".join(symbols).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, "%s_%s_%s" % (field, interval, key))
+
+def _read_cache(path: str) -> Optional[Tuple[np.ndarray, np.ndarray, Dict]]:
+    meta_file = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if "version" not in meta:
+        return None  # layout antigo (index/values soltos, sem troca atômica): reconstrói
+    version_dir = os.path.join(path, meta["version"])
+    index = np.load(os.path.join(version_dir, "index.npy"), mmap_mode="r")
+    values = np.load(os.path.join(version_dir, "values.npy"), mmap_mode="r")
+    return index, values, meta
+
+def _write_cache(path: str, index: np.ndarray, values: np.ndarray, meta: Dict) -> None:
+    """
+    Grava index/values num subdiretório de versão novo e só então troca o meta.json
+    (os.replace): leitores veem a versão anterior inteira ou a nova inteira, nunca
+    index de uma com values da outra. Mantém a versão anterior (leitor que acabou de
+    abrir o meta.json antigo) e apaga as mais velhas.
+    """
+    os.makedirs(path, exist_ok=True)
+    version = "v%d" % time.time_ns()
+    version_dir = os.path.join(path, version)
+    os.makedirs(version_dir)
+    np.save(os.path.join(version_dir, "index.npy"), index)
+    np.save(os.path.join(version_dir, "values.npy"), values)
+    previous = _current_version(path)
+    tmp = os.path.join(path, "meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump({**meta, "version": version}, f)
+    os.replace(tmp, os.path.join(path, "meta.json"))
+    for name in os.listdir(path):
+        if name in ("index.npy", "values.npy"):
+            os.remove(os.path.join(path, name))  # sobras do layout antigo
+        elif name.startswith("v") and name not in (version, previous):
+            # Windows não apaga arquivo ainda mapeado: fica para o próximo refresh
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+def _current_version(path: str) -> Optional[str]:
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+def _fetchone(pool, sql: str, params: Sequence) -> tuple:
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, list(params))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+def _changed_since(pool, symbols: Sequence[str], interval: str,
+                   watermark: Optional[str]) -> Tuple[Optional[datetime], str]:
+    """
+    (menor timestamp gravado/alterado depois do watermark, novo watermark).
+    ON UPDATE do ingested_at só muda quando a linha muda de fato: barra reenviada
+    igual não conta.
+    """
+    if watermark is None:
+        (mark,) = _fetchone(pool, "SELECT NOW(6) - INTERVAL %s SECOND", [PANEL_SETTLE_SEC])
+        return None, str(mark)
+    where = "symbol IN (%s) AND %s" % (", ".join(["%s"] * len(symbols)), grid_clause(interval))
+    changed, mark = _fetchone(
+        pool,
+        "SELECT (SELECT MIN(`timestamp`) FROM raw_crypto WHERE " + where + " AND ingested_at > %s), "
+        "NOW(6) - INTERVAL %s SECOND",
+        [*symbols, watermark, PANEL_SETTLE_SEC],
+    )
+    return changed, str(mark)
+
+def _prefix_matches(pool, symbols: Sequence[str], field: str, interval: str, since: datetime,
+                    index: np.ndarray, values: np.ndarray) -> bool:
+    """O trecho em cache antes de `since` ainda bate com o banco (mesmo MIN(timestamp) e contagem)?"""
+    where = "symbol IN (%s) AND %s AND `timestamp` < %%s" % (", ".join(["%s"] * len(symbols)), grid_clause(interval))
+    first, count = _fetchone(pool, "SELECT MIN(`timestamp`), COUNT(%s) FROM raw_crypto WHERE %s" % (field, where),
+                             [*symbols, since])
+    cached_first = int(index[0]) if len(index) else None
+    db_first = pd.Timestamp(first).value if first is not None else None
+    # COUNT(campo) ignora NULL, como o NaN do pivot
+    return db_first == cached_first and int(count or 0) == int(np.count_nonzero(~np.isnan(values)))
+
+def refresh_cache(pool, symbols: Sequence[str], field: str = "price_usd", interval: str = "1h",
+                  cache_dir: str = PANEL_CACHE_DIR) -> str:
+    """
+    Cria ou estende o cache do painel bruto (união de timestamps, NaN onde falta barra).
+    Rebusca a partir da última barra em cache (a barra corrente pode ter sido
+    atualizada) ou da barra mais antiga regravada desde o último refresh; se o
+    trecho mantido não bate mais com o banco (linhas apagadas), reconstrói tudo.
+    Retorna o diretório do cache.
+    """
+    symbols = list(symbols)
+    path = _cache_path(cache_dir, symbols, field, interval)
+    cached = _read_cache(path)
+    if cached is not None and "watermark" not in cached[2]:
+        cached = None  # cache de versão anterior: sem watermark não dá para validar
+    since = None
+    changed, watermark = _changed_since(pool, symbols, interval, cached[2]["watermark"] if cached else None)
+    if cached is not None and len(cached[0]):
+        since = pd.Timestamp(int(cached[0][-1])).to_pydatetime()
+        if changed is not None and changed < since:
+            logger.info("Panel cache %s: rows rewritten since %s, refetching from there", path, changed)
+            since = changed
+        old_index, old_values, _ = cached
+        keep = old_index < np.int64(pd.Timestamp(since).value)
+        if not _prefix_matches(pool, symbols, field, interval, since, old_index[keep], old_values[keep]):
+            logger.warning("Panel cache %s no longer matches raw_crypto, rebuilding", path)
+            cached, since = None, None
+    fresh = _query(pool, symbols, field, interval, since, None)
+    if cached is None:
+        index = fresh.index.values.astype("datetime64[ns]").astype("int64")
+        values = fresh.to_numpy(dtype="float64")
+    else:
+        new_index = fresh.index.values.astype("datetime64[ns]").astype("int64")
+        index = np.concatenate([old_index[keep], new_index])
+        values = np.concatenate([old_values[keep], fresh.to_numpy(dtype="float64")])
+    # solta os memmaps antes do os.replace (no Windows arquivo mapeado não pode ser trocado)
+    cached = old_index = old_values = None
+    _write_cache(path, index, values, {
+        "symbols": symbols, "field": field, "interval": interval, "watermark": watermark,
+        "rows": int(len(index)), "updated_at": datetime.utcnow().isoformat(),
+    })
+    logger.info("Panel cache %s: +%d rows (total %d)", path, len(fresh), len(index))
+    return path
+
+
+# ---------- API ----------
+def load_panel(pool, symbols: Sequence[str], field: str = "price_usd", interval: str = "1h",
+               start: Optional[datetime] = None, end: Optional[datetime] = None,
+               align: str = "intersection", cache_dir: Optional[str] = PANEL_CACHE_DIR,
+               refresh: bool = True) -> pd.DataFrame:
+    """
+    Retorna DataFrame (index = timestamp UTC naive, colunas = símbolos) do campo pedido.
+    Com cache_dir, lê do .npy memory-mapped (estendido antes se refresh=True);
+    refresh=False abre o cache sem tocar no MySQL (pool pode ser None).
+    Sem cache_dir, faz uma única query em lote.
+    """
+    if interval not in INTERVAL_SECONDS:
+        raise ValueError("interval não suportado: %s" % interval)
+    symbols = list(symbols)
+    if not symbols:
+        return _empty_panel(symbols)
+    if cache_dir is None:
+        return align_panel(_query(pool, symbols, field, interval, start, end), align)
+
+    path = _cache_path(cache_dir, symbols, field, interval)
+    cached = None if refresh else _read_cache(path)
+    if cached is None:
+        refresh_cache(pool, symbols, field, interval, cache_dir)
+        cached = _read_cache(path)
+    index, values, _ = cached
+    lo = 0 if start is None else int(np.searchsorted(index, pd.Timestamp(start).value, side="left"))
+    hi = len(index) if end is None else int(np.searchsorted(index, pd.Timestamp(end).value, side="left"))
+    wide = pd.DataFrame(values[lo:hi], index=pd.DatetimeIndex(index[lo:hi].astype("datetime64[ns]"), name="timestamp"),
+                        columns=symbols, copy=False)
+    return align_panel(wide, align)
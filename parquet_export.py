@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+parquet_export.py
+
+Export incremental de `raw_crypto` para um dataset Parquet local, particionado
+no estilo Hive por símbolo e dia:
+
+    <PARQUET_EXPORT_DIR>/symbol=BTC-USD/date=2024-01-31/part-0.parquet
+
+- Watermark em `ingested_at` (_watermark.json): cada execução só reescreve as
+  partições (symbol, date) com linhas gravadas/alteradas desde o último export.
+  O horário é o da gravação, não o do run: replay do spool e linhas que ganham
+  run_id depois (runs.adopt_rows) entram no export seguinte. O limite superior
+  fica EXPORT_SETTLE_SEC no passado para não pular transações ainda abertas
+- Cada partição alterada é reescrita inteira num único arquivo (tmp + rename),
+  então leitores nunca veem duplicatas nem arquivos parciais, e não se acumulam
+  arquivos pequenos (não há o que compactar)
+- Partição alterada que ficou sem linhas é apagada, assim como as anteriores à
+  primeira barra do símbolo (dias removidos pela retenção); --full apaga todas
+  as que não existem mais no banco
+
+Power BI / Grafana / notebooks passam a ler o Parquet em vez de varrer o MySQL.
+Pode rodar depois de scrape_and_store / run_backfill (flag --export-parquet)
+ou sozinho: python parquet_export.py
+"""
+
+import os
+import glob
+import json
+import shutil
+import logging
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# -------------------- Config (ENV-friendly) --------------------
+PARQUET_EXPORT_DIR = os.getenv("PARQUET_EXPORT_DIR", "exports/raw_crypto")
+# folga do watermark: maior que a transação de escrita mais longa (um flush)
+EXPORT_SETTLE_SEC = int(os.getenv("EXPORT_SETTLE_SEC", "300"))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+# --------------------------------------------------------------
+
+WATERMARK_FILE = "_watermark.json"
+EXPORT_COLUMNS = ["timestamp", "name", "price_usd", "change_24h_percent", "volume_24h_usd",
+                  "is_valid", "quality_bits", "run_id"]
+
+logger = logging.getLogger("pipeline.parquet_export")
+
+
+# ---------- Watermark ----------
+def read_watermark(root: str) -> Optional[datetime]:
+    """Último ingested_at exportado. Watermarks antigos (created_at, run_id) contam como ausentes: reexporta tudo uma vez."""
+    path = os.path.join(root, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        value = json.load(f).get("ingested_at")
+    return datetime.fromisoformat(value) if value else None
+
+def write_watermark(root: str, value: datetime) -> None:
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, WATERMARK_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"ingested_at": value.isoformat(), "exported_at": datetime.utcnow().isoformat()}, f)
+    os.replace(tmp, os.path.join(root, WATERMARK_FILE))
+
+
+# ---------- Escrita de partições ----------
+def partition_dir(root: str, symbol: str, day: date) -> str:
+    return os.path.join(root, "symbol=%s" % symbol, "date=%s" % day.isoformat())
+
+def _to_frame(rows: List[tuple]) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+    for c in ("price_usd", "change_24h_percent"):
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    df["volume_24h_usd"] = pd.to_numeric(df["volume_24h_usd"], errors="coerce").astype("Int64")
+    df["is_valid"] = df["is_valid"].astype("bool")
+    df["quality_bits"] = df["quality_bits"].astype("uint16")
+    df["run_id"] = df["run_id"].astype("uint32")
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df
+
+def write_partition(root: str, symbol: str, day: date, df: pd.DataFrame) -> str:
+    """Substitui o conteúdo da partição por um único arquivo (e apaga sobras de outros nomes)."""
+    path = partition_dir(root, symbol, day)
+    os.makedirs(path, exist_ok=True)
+    df = df.sort_values("timestamp").drop_duplicates("timestamp", keep="last")
+    target = os.path.join(path, "part-0.parquet")
+    tmp = os.path.join(path, ".part-0.parquet.tmp")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp, compression=PARQUET_COMPRESSION)
+    os.replace(tmp, target)
+    for old in glob.glob(os.path.join(path, "*.parquet")):
+        if old != target:
+            os.remove(old)
+    return target
+
+def remove_partition(root: str, symbol: str, day: date) -> bool:
+    """Apaga a partição (symbol, day) e o diretório do símbolo se ficar vazio. True se existia."""
+    path = partition_dir(root, symbol, day)
+    if not os.path.isdir(path):
+        return False
+    shutil.rmtree(path)
+    parent = os.path.dirname(path)
+    if not os.listdir(parent):
+        os.rmdir(parent)
+    return True
+
+def existing_partitions(root: str) -> Set[Tuple[str, date]]:
+    """(symbol, day) de todas as partições já exportadas em root."""
+    out = set()
+    for path in glob.glob(os.path.join(root, "symbol=*", "date=*")):
+        symbol = os.path.basename(os.path.dirname(path))[len("symbol="):]
+        out.add((symbol, date.fromisoformat(os.path.basename(path)[len("date="):])))
+    return out
+
+def day_runs(days: List[date]) -> List[Tuple[date, date]]:
+    """Dias ordenados -> intervalos [início, fim exclusivo) de dias consecutivos."""
+    runs: List[Tuple[date, date]] = []
+    for day in sorted(set(days)):
+        if runs and runs[-1][1] == day:
+            runs[-1] = (runs[-1][0], day + timedelta(days=1))
+        else:
+            runs.append((day, day + timedelta(days=1)))
+    return runs
+
+
+# ---------- Export incremental ----------
+def export_incremental(pool, root: str = PARQUET_EXPORT_DIR, full: bool = False) -> Dict:
+    """
+    Exporta as partições (symbol, date) alteradas desde o watermark.
+    full=True ignora o watermark e reexporta tudo.
+    Retorna {"partitions": n, "removed": n, "rows": n, "watermark": iso}.
+    """
+    watermark = None if full else read_watermark(root)
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    written_rows = 0
+    partitions = 0
+    removed = 0
+    try:
+        # limite superior fixo e no passado (relógio do MySQL, o mesmo de ingested_at):
+        # uma transação aberta agora comita com ingested_at > safe e entra no próximo export
+        cursor.execute("SELECT NOW(6) - INTERVAL %s SECOND", (EXPORT_SETTLE_SEC,))
+        (safe,) = cursor.fetchone()
+        if watermark is None:
+            cursor.execute("SELECT DISTINCT symbol, DATE(`timestamp`) FROM raw_crypto WHERE ingested_at <= %s",
+                           (safe,))
+        else:
+            cursor.execute(
+                "SELECT DISTINCT symbol, DATE(`timestamp`) FROM raw_crypto WHERE ingested_at > %s AND ingested_at <= %s",
+                (watermark, safe),
+            )
+        changed: Dict[str, List[date]] = {}
+        for symbol, day in cursor.fetchall():
+            changed.setdefault(symbol, []).append(day)
+
+        cols = ", ".join("`%s`" % c for c in EXPORT_COLUMNS)
+        for symbol, days in changed.items():
+            # uma query por símbolo, só com os dias alterados (um range por sequência de dias)
+            days = sorted(set(days))
+            ranges = day_runs(days)
+            cursor.execute(
+                "SELECT %s FROM raw_crypto WHERE symbol = %%s AND (%s)"
+                % (cols, " OR ".join(["(`timestamp` >= %s AND `timestamp` < %s)"] * len(ranges))),
+                (symbol, *[d for r in ranges for d in r]),
+            )
+            df = _to_frame(cursor.fetchall())
+            df_days = df["timestamp"].dt.date
+            for day in days:
+                part = df[df_days == day]
+                if part.empty:
+                    # linhas apagadas entre as duas consultas: a partição não pode sobrar
+                    removed += remove_partition(root, symbol, day)
+                    continue
+                write_partition(root, symbol, day, part)
+                partitions += 1
+                written_rows += len(part)
+        if watermark is None:
+            # export completo = espelho: partições que não existem mais no banco saem
+            exported = {(symbol, day) for symbol, days in changed.items() for day in days}
+            for symbol, day in existing_partitions(root) - exported:
+                removed += remove_partition(root, symbol, day)
+        else:
+            # a retenção apaga o começo do histórico sem mexer em ingested_at
+            cursor.execute("SELECT symbol, MIN(`timestamp`) FROM raw_crypto GROUP BY symbol")
+            first_day = {symbol: ts.date() for symbol, ts in cursor.fetchall()}
+            for symbol, day in existing_partitions(root):
+                if symbol not in first_day or day < first_day[symbol]:
+                    removed += remove_partition(root, symbol, day)
+    finally:
+        cursor.close()
+        conn.close()
+
+    # nunca recua (ex.: EXPORT_SETTLE_SEC aumentado entre execuções)
+    if watermark is not None:
+        safe = max(safe, watermark)
+    write_watermark(root, safe)
+    logger.info("Parquet export root=%s partitions=%d removed=%d rows=%d watermark=%s",
+                root, partitions, removed, written_rows, safe)
+    return {"partitions": partitions, "removed": removed, "rows": written_rows, "watermark": safe.isoformat()}
+
+
+# ------------------ CLI ------------------
+if __name__ == "__main__":
+    import argparse
+    from mysql.connector import pooling
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Incremental Parquet export of raw_crypto (symbol/date partitions)")
+    parser.add_argument("--root", default=PARQUET_EXPORT_DIR)
+    parser.add_argument("--full", action="store_true", help="Ignora o watermark e reexporta tudo")
+    args = parser.parse_args()
+
+    pool = pooling.MySQLConnectionPool(
+        pool_name="export_pool", pool_size=1,
+        host=os.getenv("MYSQL_HOST", "db"), port=int(os.getenv("MYSQL_PORT", "3306")),
+        user=os.getenv("MYSQL_USER", "Acelino"), password=os.getenv("MYSQL_PASSWORD", "senha123"),
+        database=os.getenv("MYSQL_DB", "projet_crypto"), autocommit=False,
+    )
+    print(export_incremental(pool, args.root, full=args.full))
@@ -0,0 +1,190 @@
+"""
+profiling.py
+
+Modo de profiling embutido (--profile) para yahoo_scraper.py e run_once.py:
+- cProfile separado por etapa do pipeline (fetch, prepare, write, features...)
+- tracemalloc: pico de memória e principais pontos de alocação
+- Tempo de parede gasto em chamadas ao banco vs HTTP (io("db") / io("http"))
+- Relatório JSON em PROFILE_DIR/profile_<scrape_id>.json (+ um .prof por etapa,
+  abrível com snakeviz / pstats)
+
+Pensado para ficar ligado em execuções amostradas de produção
+(PROFILE_SAMPLE_RATE): sem profiler ativo, stage() e io() são no-ops baratos.
+O cProfile só cobre a thread que chamou start(); nas outras threads (ex.: janelas
+paralelas do fetch_range) só o tempo de parede de io() é contabilizado.
+"""
+
+import os
+import json
+import time
+import random
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# -------------------- Config (ENV-friendly) --------------------
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "15"))
+# 1 frame por alocação mantém o overhead do tracemalloc baixo
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))
+PROFILE_CPU = os.getenv("PROFILE_CPU", "1") == "1"
+# --------------------------------------------------------------
+
+logger = logging.getLogger("pipeline.profiling")
+
+
+class RunProfiler:
+
+    def __init__(self, scrape_id: str, directory: str = PROFILE_DIR, top_n: int = PROFILE_TOP_N,
+                 frames: int = PROFILE_TRACEMALLOC_FRAMES, cpu: bool = PROFILE_CPU):
+        self.scrape_id = scrape_id
+        self.directory = directory
+        self.top_n = top_n
+        self.frames = frames
+        self.cpu = cpu
+        self.started_at = datetime.utcnow()
+        self._t0 = time.perf_counter()
+        self._thread = threading.get_ident()
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._stages: Dict[str, Dict] = {}
+        self._io: Dict[str, Dict] = {}
+        self._stack: List[str] = []
+        self._lock = threading.Lock()
+        self._own_tracemalloc = not tracemalloc.is_tracing()
+        if self._own_tracemalloc:
+            tracemalloc.start(frames)
+
+    # ---------- etapas ----------
+    @contextmanager
+    def stage(self, name: str):
+        if threading.get_ident() != self._thread:
+            # cProfile é por thread: fora da thread principal não há o que medir
+            yield
+            return
+        # o cProfile não aceita dois perfis ativos: pausa a etapa externa
+        if self.cpu and self._stack:
+            self._profiles[self._stack[-1]].disable()
+        self._stack.append(name)
+        prof = self._profiles.setdefault(name, cProfile.Profile()) if self.cpu else None
+        start = time.perf_counter()
+        if prof is not None:
+            prof.enable()
+        try:
+            yield
+        finally:
+            if prof is not None:
+                prof.disable()
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            entry = self._stages.setdefault(name, {"calls": 0, "wall_sec": 0.0})
+            entry["calls"] += 1
+            entry["wall_sec"] += elapsed
+            if self.cpu and self._stack:
+                self._profiles[self._stack[-1]].enable()
+
+    @contextmanager
+    def io(self, kind: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                entry = self._io.setdefault(kind, {"calls": 0, "wall_sec": 0.0})
+                entry["calls"] += 1
+                entry["wall_sec"] += elapsed
+
+    # ---------- relatório ----------
+    def _cpu_top(self, prof: cProfile.Profile) -> List[Dict]:
+        stats = pstats.Stats(prof)
+        rows = []
+        for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+            rows.append({"function": "%s:%d(%s)" % (os.path.basename(filename), line, func),
+                         "ncalls": nc, "tottime": round(tt, 6), "cumtime": round(ct, 6)})
+        rows.sort(key=lambda r: r["tottime"], reverse=True)
+        return rows[:self.top_n]
+
+    def _memory(self) -> Dict:
+        if not tracemalloc.is_tracing():
+            return {}
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        top = [{"site": "%s:%d" % (s.traceback[0].filename, s.traceback[0].lineno),
+                "size_bytes": s.size, "count": s.count}
+               for s in snapshot.statistics("lineno")[:self.top_n]]
+        return {"peak_bytes": peak, "current_bytes": current, "top_allocations": top}
+
+    def report(self) -> Dict:
+        wall = time.perf_counter() - self._t0
+        stages = {}
+        for name, entry in self._stages.items():
+            stages[name] = {"calls": entry["calls"], "wall_sec": round(entry["wall_sec"], 6)}
+            if name in self._profiles:
+                stages[name]["cpu_top"] = self._cpu_top(self._profiles[name])
+        with self._lock:
+            io = {k: {"calls": v["calls"], "wall_sec": round(v["wall_sec"], 6)} for k, v in self._io.items()}
+        return {
+            "scrape_id": self.scrape_id,
+            "started_at": self.started_at.isoformat(),
+            "wall_sec": round(wall, 6),
+            "stages": stages,
+            "io": io,
+            "memory": self._memory(),
+        }
+
+    def finish(self) -> str:
+        """Grava o relatório JSON (e um .prof por etapa). Retorna o caminho do JSON."""
+        report = self.report()
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, "profile_%s" % self.scrape_id)
+        for name, prof in self._profiles.items():
+            prof.dump_stats("%s.%s.prof" % (base, name))
+        path = base + ".json"
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(report, f, indent=1)
+        os.replace(tmp, path)
+        logger.info("Profile written to %s (wall=%.2fs io=%s)", path, report["wall_sec"], report["io"])
+        return path
+
+
+_ACTIVE: Optional[RunProfiler] = None
+
+
+def sampled() -> bool:
+    """True para a fração PROFILE_SAMPLE_RATE das execuções."""
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def start(scrape_id: str, **kwargs) -> RunProfiler:
+    global _ACTIVE
+    _ACTIVE = RunProfiler(scrape_id, **kwargs)
+    logger.info("Profiling run %s", scrape_id)
+    return _ACTIVE
+
+def finish() -> Optional[str]:
+    global _ACTIVE
+    prof, _ACTIVE = _ACTIVE, None
+    return prof.finish() if prof is not None else None
+
+@contextmanager
+def _noop():
+    yield
+
+def stage(name: str):
+    """Etapa do pipeline (cProfile + tempo de parede); no-op sem profiler ativo."""
+    return _ACTIVE.stage(name) if _ACTIVE is not None else _noop()
+
+def io(kind: str):
+    """Chamada externa ("db" / "http"); no-op sem profiler ativo."""
+    return _ACTIVE.io(kind) if _ACTIVE is not None else _noop()
@@ -0,0 +1,205 @@
+"""
+ratelimit.py
+
+Controle de taxa adaptativo para as chamadas ao Yahoo Finance:
+- AdaptiveRateLimiter (AIMD): +ADDITIVE_STEP req/s a cada sucesso,
+  x MULTIPLICATIVE_DECREASE em 429 / timeout / erro
+- CircuitBreaker por host: após BREAKER_FAILURES falhas seguidas abre e
+  rejeita chamadas por BREAKER_COOLDOWN_SEC; depois deixa passar uma sonda
+  (half-open) e fecha de novo se ela der certo
+- classify_failure(): separa throttle / timeout / erro
+- yf_history() / capture_yf_errors(): o yf.download (yfinance >= 0.2.5x)
+  engole 429 e timeouts e só loga; estes tornam a falha visível para o limiter
+
+Thread-safe: o mesmo limiter pode ser compartilhado por vários workers.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# -------------------- Config (ENV-friendly) --------------------
+MIN_RPS = float(os.getenv("RATE_MIN_RPS", "0.2"))
+MAX_RPS = float(os.getenv("RATE_MAX_RPS", "10.0"))
+ADDITIVE_STEP = float(os.getenv("RATE_ADDITIVE_STEP", "0.1"))
+MULTIPLICATIVE_DECREASE = float(os.getenv("RATE_MULTIPLICATIVE_DECREASE", "0.5"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SEC = float(os.getenv("BREAKER_COOLDOWN_SEC", "60"))
+# --------------------------------------------------------------
+
+YAHOO_HOST = "query1.finance.yahoo.com"
+
+
+class CircuitOpenError(Exception):
+    """Upstream considerado fora do ar: a chamada nem foi feita."""
+
+
+def classify_failure(exc: Optional[BaseException] = None, message: Optional[str] = None) -> str:
+    """Retorna 'throttle', 'timeout' ou 'error'."""
+    text = "%s %s" % (type(exc).__name__ if exc else "", message or (str(exc) if exc else ""))
+    low = text.lower()
+    if "ratelimit" in low or "rate limit" in low or "429" in low or "too many requests" in low:
+        return "throttle"
+    if "timeout" in low or "timed out" in low:
+        return "timeout"
+    return "error"
+
+
+class AdaptiveRateLimiter:
+    """Aumento aditivo / redução multiplicativa da taxa de requisições."""
+
+    def __init__(self, initial_rps: float, min_rps: float = MIN_RPS, max_rps: float = MAX_RPS,
+                 step: float = ADDITIVE_STEP, decrease: float = MULTIPLICATIVE_DECREASE):
+        self.min_rps = min_rps
+        self.max_rps = max(max_rps, min_rps)
+        self.rate = min(self.max_rps, max(self.min_rps, initial_rps))
+        self.step = step
+        self.decrease = decrease
+        self.counts = {"success": 0, "throttle": 0, "timeout": 0, "error": 0}
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Bloqueia até o próximo slot livre. Retorna o tempo dormido (s)."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rps, self.rate + self.step)
+            self.counts["success"] += 1
+
+    def on_failure(self, kind: str = "error") -> None:
+        with self._lock:
+            self.rate = max(self.min_rps, self.rate * self.decrease)
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            # a próxima chamada respeita imediatamente a nova taxa
+            self._next_slot = max(self._next_slot, time.monotonic() + 1.0 / self.rate)
+
+    def snapshot(self) -> Dict:
+        """Taxa e contadores com prefixo rate_ (não colidem com o stats da execução)."""
+        with self._lock:
+            return {"rate_rps": round(self.rate, 3), **{"rate_" + k: v for k, v in self.counts.items()}}
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, cooldown_sec: float = BREAKER_COOLDOWN_SEC):
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec = cooldown_sec
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_inflight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown_sec:
+                self.state = self.HALF_OPEN
+                self._probe_inflight = False
+            if self.state == self.HALF_OPEN and not self._probe_inflight:
+                self._probe_inflight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self) -> None:
+        """Como allow(), mas levanta CircuitOpenError."""
+        if not self.allow():
+            raise CircuitOpenError("circuit open (failures=%d)" % self.failures)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_inflight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_inflight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"breaker_state": self.state, "breaker_failures": self.failures,
+                    "breaker_rejected": self.rejected}
+
+
+_HOSTS: Dict[str, Tuple[AdaptiveRateLimiter, CircuitBreaker]] = {}
+_HOSTS_LOCK = threading.Lock()
+
+
+def for_host(host: str = YAHOO_HOST, initial_rps: float = 1.0) -> Tuple[AdaptiveRateLimiter, CircuitBreaker]:
+    """Par (limiter, breaker) compartilhado por processo para o host."""
+    with _HOSTS_LOCK:
+        if host not in _HOSTS:
+            _HOSTS[host] = (AdaptiveRateLimiter(initial_rps), CircuitBreaker())
+        return _HOSTS[host]
+
+
+def snapshot(host: str = YAHOO_HOST) -> Dict:
+    """Estado atual (taxa + breaker) para o dict de stats da execução."""
+    limiter, breaker = _HOSTS.get(host, (None, None))
+    if limiter is None:
+        return {}
+    return {**limiter.snapshot(), **breaker.snapshot()}
+
+
+def yf_history(ticker: str, **kwargs):
+    """
+    yf.Ticker(ticker).history(**kwargs) com as falhas como exceção: 429
+    (YFRateLimitError), timeout e erro de rede levantam; ticker/intervalo sem
+    dados (YFTickerMissingError: sem preços ou sem timezone) vira DataFrame vazio.
+    """
+    import pandas as pd
+    import yfinance as yf
+    from yfinance.exceptions import YFTickerMissingError
+
+    # com hide_exceptions (padrão) o history só loga o erro e devolve vazio
+    yf.config.debug.hide_exceptions = False
+    try:
+        return yf.Ticker(ticker).history(**kwargs)
+    except YFTickerMissingError:
+        return pd.DataFrame()
+
+
+class _ErrorCapture(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+@contextmanager
+def capture_yf_errors() -> Iterator[List[str]]:
+    """
+    Coleta as mensagens de erro que o yfinance loga durante o bloco (é o único
+    rastro que o yf.download deixa das falhas por ticker). Uso:
+        with capture_yf_errors() as errors: yf.download(...)
+    """
+    handler = _ErrorCapture()
+    yf_logger = logging.getLogger("yfinance")
+    yf_logger.addHandler(handler)
+    try:
+        yield handler.messages
+    finally:
+        yf_logger.removeHandler(handler)
@@ -0,0 +1,247 @@
+"""
+read_api.py
+
+Serviço de leitura (Flask) sobre a DW, ao lado do collector.py:
+- GET  /symbols                                   -> lista de símbolos
+- GET  /latest?symbols=BTC-USD,ETH-USD            -> última barra por símbolo
+- GET  /range?symbols=BTC-USD&start=...&end=...&interval=1h -> série no intervalo
+- POST /invalidate {"symbols": [...]}             -> chamado pelo scraper após gravar
+- GET  /cache/stats, /health
+
+Cache em processo LRU + TTL, indexado por símbolo: o scraper invalida só os
+símbolos que gravou. Pedidos multi-símbolo resolvem todos os misses numa única
+query, então o QPS no MySQL fica estável independente de quantos dashboards
+estão abertos.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from flask import Flask, request
+from mysql.connector import pooling
+
+from features import INTERVAL_SECONDS, grid_clause
+
+# -------------------- Config (ENV-friendly) --------------------
+DB_HOST = os.getenv("MYSQL_HOST", "db")
+DB_PORT = int(os.getenv("MYSQL_PORT", "3306"))
+DB_USER = os.getenv("MYSQL_USER", "Acelino")
+DB_PASSWORD = os.getenv("MYSQL_PASSWORD", "senha123")
+DB_NAME = os.getenv("MYSQL_DB", "projet_crypto")
+
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "4096"))
+READ_CACHE_TTL_SEC = float(os.getenv("READ_CACHE_TTL_SEC", "300"))
+READ_API_PORT = int(os.getenv("READ_API_PORT", "9100"))
+# --------------------------------------------------------------
+
+
+class TTLCache:
+    """LRU com expiração por TTL e invalidação por tag (símbolo). Thread-safe."""
+
+    def __init__(self, maxsize: int = READ_CACHE_SIZE, ttl: float = READ_CACHE_TTL_SEC):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, object, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "db_queries": 0}
+
+    def get(self, key: Hashable):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    self._drop(key)
+                self.stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return item[1]
+
+    def set(self, key: Hashable, value, tags: Iterable[str] = ()) -> None:
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + self.ttl, value, tags)
+            for t in tags:
+                self._tags.setdefault(t, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            for t in tags:
+                for key in list(self._tags.get(t, ())):
+                    if key in self._data:
+                        self._drop(key)
+                        removed += 1
+            self.stats["invalidations"] += removed
+        return removed
+
+    def _drop(self, key: Hashable) -> None:
+        _, _, tags = self._data.pop(key)
+        for t in tags:
+            keys = self._tags.get(t)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[t]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+app = Flask(__name__)
+CACHE = TTLCache()
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+# tag usada por chaves que dependem de todos os símbolos (ex.: /symbols)
+ALL_TAG = "*"
+
+
+def get_pool():
+    # criado sob demanda: o serviço sobe mesmo se o MySQL ainda não estiver pronto
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = pooling.MySQLConnectionPool(
+                pool_name="read_api_pool", pool_size=int(os.getenv("READ_POOL_SIZE", "5")),
+                host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, database=DB_NAME,
+                autocommit=True,
+            )
+    return _POOL
+
+def _query(sql: str, params: Iterable = ()) -> List[tuple]:
+    CACHE.stats["db_queries"] += 1
+    conn = get_pool().get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, tuple(params))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+def _json(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return v
+
+def _bar(ts, price, volume) -> Dict:
+    return {"timestamp": _json(ts), "price_usd": _json(price), "volume_24h_usd": _json(volume)}
+
+def _symbols_arg() -> List[str]:
+    raw = request.args.get("symbols") or request.args.get("symbol") or ""
+    return [s.strip() for s in raw.split(",") if s.strip()]
+
+
+# ---------- Leituras (com cache) ----------
+def latest_bars(symbols: List[str]) -> Dict[str, Optional[Dict]]:
+    out: Dict[str, Optional[Dict]] = {}
+    missing = []
+    for s in symbols:
+        hit = CACHE.get(("latest", s))
+        if hit is None:
+            missing.append(s)
+        else:
+            out[s] = hit
+    if missing:
+        ph = ", ".join(["%s"] * len(missing))
+        rows = _query(
+            "SELECT r.symbol, r.`timestamp`, r.price_usd, r.volume_24h_usd FROM raw_crypto r "
+            "JOIN (SELECT symbol, MAX(`timestamp`) AS ts FROM raw_crypto WHERE symbol IN (%s) GROUP BY symbol) m "
+            "ON r.symbol = m.symbol AND r.`timestamp` = m.ts" % ph,
+            missing,
+        )
+        found = {sym: _bar(ts, p, v) for sym, ts, p, v in rows}
+        for s in missing:
+            out[s] = found.get(s)
+            if s in found:
+                CACHE.set(("latest", s), found[s], tags=(s,))
+    return out
+
+def range_bars(symbols: List[str], start: Optional[str], end: Optional[str], interval: str) -> Dict[str, List[Dict]]:
+    out: Dict[str, List[Dict]] = {}
+    missing = []
+    for s in symbols:
+        hit = CACHE.get(("range", s, start, end, interval))
+        if hit is None:
+            missing.append(s)
+        else:
+            out[s] = hit
+    if missing:
+        where = ["symbol IN (%s)" % ", ".join(["%s"] * len(missing)), grid_clause(interval)]
+        params: List = list(missing)
+        if start:
+            where.append("`timestamp` >= %s")
+            params.append(start)
+        if end:
+            where.append("`timestamp` < %s")
+            params.append(end)
+        rows = _query(
+            "SELECT symbol, `timestamp`, price_usd, volume_24h_usd FROM raw_crypto WHERE %s "
+            "ORDER BY symbol, `timestamp`" % " AND ".join(where),
+            params,
+        )
+        grouped: Dict[str, List[Dict]] = {s: [] for s in missing}
+        for sym, ts, p, v in rows:
+            grouped[sym].append(_bar(ts, p, v))
+        for s, bars in grouped.items():
+            out[s] = bars
+            CACHE.set(("range", s, start, end, interval), bars, tags=(s,))
+    return out
+
+
+# ---------- Rotas ----------
+@app.route("/symbols")
+def symbols():
+    hit = CACHE.get(("symbols",))
+    if hit is None:
+        hit = [r[0] for r in _query("SELECT DISTINCT symbol FROM raw_crypto ORDER BY symbol")]
+        CACHE.set(("symbols",), hit, tags=(ALL_TAG,))
+    return {"symbols": hit}, 200
+
+@app.route("/latest")
+def latest():
+    syms = _symbols_arg()
+    if not syms:
+        return {"error": "parâmetro symbols obrigatório"}, 400
+    return {"data": latest_bars(syms)}, 200
+
+@app.route("/range")
+def range_():
+    syms = _symbols_arg()
+    interval = request.args.get("interval", "1h")
+    if not syms or interval not in INTERVAL_SECONDS:
+        return {"error": "symbols obrigatório e interval em %s" % sorted(INTERVAL_SECONDS)}, 400
+    return {"data": range_bars(syms, request.args.get("start"), request.args.get("end"), interval)}, 200
+
+@app.route("/invalidate", methods=["POST"])
+def invalidate():
+    data = request.get_json(force=True, silent=True) or {}
+    syms = data.get("symbols") or []
+    removed = CACHE.invalidate(list(syms) + [ALL_TAG])
+    return {"invalidated": removed}, 200
+
+@app.route("/cache/stats")
+def cache_stats():
+    return {"size": len(CACHE), **CACHE.stats}, 200
+
+@app.route("/health")
+def health():
+    return {"status": "healthy"}, 200
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=READ_API_PORT, debug=False, threaded=True)
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+reconcile.py
+
+Reconciliação de `raw_crypto` com o upstream sem reescrever o histórico inteiro:
+- Checksum por (symbol, dia) calculado no MySQL:
+  COUNT(*) + BIT_XOR(CRC32(CONCAT_WS('|', timestamp, price_usd, volume_24h_usd)))
+- O mesmo checksum da fonte (yfinance via run_once.fetch_range), com a mesma
+  forma canônica das linhas (preço arredondado como o DECIMAL(20,8) grava)
+- Os checksums sobem em hierarquia dia -> mês -> ano (XOR dos filhos + soma
+  das contagens); a comparação começa pelos anos e só desce nos que diferem
+- Nos dias divergentes, diff linha a linha: só as barras ausentes ou diferentes
+  são regravadas (UPSERT do run_once, run_id próprio em scrape_runs); barras
+  que só existem no banco são contadas em `rows_extra`, não apagadas
+- Cache local dos checksums da fonte (RECONCILE_CACHE_DIR) para dias já
+  assentados (mais velhos que RECONCILE_SETTLE_DAYS): na próxima execução
+  esses dias não são baixados de novo; só os que divergirem do cache são
+  rebaixados para confirmar antes de gravar
+
+Assim o custo de verificação (requisições + escritas) acompanha a divergência,
+não o tamanho do histórico.
+
+Granularidade: '1d' compara as barras de 00:00 UTC; intradiário compara as
+barras do grid do intervalo fora de 00:00 (que pertence às barras diárias).
+Usa o POOL do run_once (variáveis DB_*).
+
+Exemplos:
+    python reconcile.py --tickers BTC-USD,ETH-USD --days 720
+    python reconcile.py --tickers BTC-USD --interval 1h --days 60 --refresh
+"""
+
+import os
+import sys
+import json
+import zlib
+import logging
+from datetime import datetime, date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from mysql.connector import Error
+
+import ratelimit
+import features
+import runs
+import run_once
+from write_buffer import upsert_rows
+
+# -------------------- Config (ENV-friendly) --------------------
+RECONCILE_CACHE_DIR = os.getenv("RECONCILE_CACHE_DIR", "reconcile_cache")
+# dias mais novos que isso ainda podem ser revisados pelo Yahoo: nunca vão para o cache
+RECONCILE_SETTLE_DAYS = int(os.getenv("RECONCILE_SETTLE_DAYS", "3"))
+# dias divergentes separados por até N dias viram uma só requisição
+RECONCILE_MERGE_GAP_DAYS = int(os.getenv("RECONCILE_MERGE_GAP_DAYS", "7"))
+# --------------------------------------------------------------
+
+PRICE_QUANTUM = Decimal("0.00000001")  # escala de raw_crypto.price_usd (DECIMAL(20,8))
+
+# (contagem, xor) por dia
+Digest = Dict[date, Tuple[int, int]]
+
+logger = logging.getLogger("pipeline.reconcile")
+
+
+# ---------- Forma canônica / checksums ----------
+def _row_filter(interval: str) -> str:
+    grid = features.grid_clause(interval)
+    return grid if interval == "1d" else grid + " AND TIME(`timestamp`) <> '00:00:00'"
+
+def canonical(ts: datetime, price: Optional[float], volume: Optional[int]) -> str:
+    """
+    Mesma string que CONCAT_WS('|', CAST(`timestamp` AS DATETIME), COALESCE(price_usd, ''),
+    COALESCE(volume_24h_usd, '')) produz no MySQL para a linha gravada.
+    """
+    if price is None:
+        p = ""
+    else:
+        # o conector envia str(float) e o MySQL arredonda para 8 casas (half away from zero)
+        p = format(Decimal(str(price)).quantize(PRICE_QUANTUM, rounding=ROUND_HALF_UP), "f")
+    v = "" if volume is None else str(int(volume))
+    return "%s|%s|%s" % (ts.strftime("%Y-%m-%d %H:%M:%S"), p, v)
+
+def row_crc(ts: datetime, price: Optional[float], volume: Optional[int]) -> int:
+    return zlib.crc32(canonical(ts, price, volume).encode("ascii"))
+
+def source_rows(symbol: str, df: pd.DataFrame, interval: str, run_id: int) -> Dict[datetime, tuple]:
+    """Tuplas do UPSERT_SQL do run_once indexadas pelo timestamp, já no recorte comparado."""
+    out = {}
+    step = features.INTERVAL_SECONDS[interval]
+    for row in run_once.prepare_rows(symbol, symbol, df, run_id, interval=interval):
+        ts = row[5]
+        secs = int((ts - datetime(1970, 1, 1)).total_seconds())
+        if secs % step or (interval != "1d" and ts.time() == datetime.min.time()):
+            continue
+        out[ts] = row
+    return out
+
+def digest_rows(rows: Iterable[tuple]) -> Digest:
+    """Checksum diário de tuplas do UPSERT_SQL (price no índice 2, volume no 4, timestamp no 5)."""
+    out: Dict[date, List[int]] = {}
+    for r in rows:
+        acc = out.setdefault(r[5].date(), [0, 0])
+        acc[0] += 1
+        acc[1] ^= row_crc(r[5], r[2], r[4])
+    return {d: (n, x) for d, (n, x) in out.items()}
+
+def stored_digest(cursor, symbol: str, interval: str, start: date, end_incl: date) -> Digest:
+    cursor.execute(
+        "SELECT DATE(`timestamp`), COUNT(*), "
+        "BIT_XOR(CRC32(CONCAT_WS('|', CAST(`timestamp` AS DATETIME), COALESCE(price_usd, ''), "
+        "COALESCE(volume_24h_usd, '')))) "
+        "FROM raw_crypto WHERE symbol = %s AND `timestamp` >= %s AND `timestamp` < %s AND "
+        + _row_filter(interval) + " GROUP BY 1",
+        (symbol, start, end_incl + timedelta(days=1)),
+    )
+    return {d: (int(n), int(x)) for d, n, x in cursor.fetchall()}
+
+def stored_rows(cursor, symbol: str, interval: str, start: date, end_incl: date) -> Dict[datetime, int]:
+    """CRC por timestamp das linhas gravadas em [start, end_incl] (diff linha a linha)."""
+    cursor.execute(
+        "SELECT CAST(`timestamp` AS DATETIME), price_usd, volume_24h_usd FROM raw_crypto "
+        "WHERE symbol = %s AND `timestamp` >= %s AND `timestamp` < %s AND " + _row_filter(interval),
+        (symbol, start, end_incl + timedelta(days=1)),
+    )
+    return {ts: row_crc(ts, price, volume) for ts, price, volume in cursor.fetchall()}
+
+
+# ---------- Hierarquia dia -> mês -> ano ----------
+def rollup(digest: Digest, key) -> Dict:
+    out: Dict = {}
+    for d, (n, x) in digest.items():
+        k = key(d)
+        cn, cx = out.get(k, (0, 0))
+        out[k] = (cn + n, cx ^ x)
+    return out
+
+def diverging_days(stored: Digest, source: Digest) -> Tuple[List[date], Dict[str, int]]:
+    """
+    Desce ano -> mês -> dia só onde os checksums diferem.
+    Retorna (dias divergentes, nós comparados por nível).
+    """
+    compared = {"years": 0, "months": 0, "days": 0}
+
+    def children(a: Dict, b: Dict) -> List:
+        keys = sorted(set(a) | set(b))
+        return [k for k in keys if a.get(k, (0, 0)) != b.get(k, (0, 0))]
+
+    by_year = lambda d: d.year
+    by_month = lambda d: (d.year, d.month)
+    s_years, f_years = rollup(stored, by_year), rollup(source, by_year)
+    compared["years"] = len(set(s_years) | set(f_years))
+    bad_years = set(children(s_years, f_years))
+    if not bad_years:
+        return [], compared
+
+    s_months = rollup({d: v for d, v in stored.items() if d.year in bad_years}, by_month)
+    f_months = rollup({d: v for d, v in source.items() if d.year in bad_years}, by_month)
+    compared["months"] = len(set(s_months) | set(f_months))
+    bad_months = set(children(s_months, f_months))
+
+    s_days = {d: v for d, v in stored.items() if by_month(d) in bad_months}
+    f_days = {d: v for d, v in source.items() if by_month(d) in bad_months}
+    compared["days"] = len(set(s_days) | set(f_days))
+    return children(s_days, f_days), compared
+
+def merge_ranges(days: Iterable[date], gap: int = RECONCILE_MERGE_GAP_DAYS) -> List[Tuple[date, date]]:
+    """Dias -> intervalos [início, fim] inclusivos; buracos de até `gap` dias são absorvidos."""
+    ranges: List[List[date]] = []
+    for d in sorted(set(days)):
+        if ranges and (d - ranges[-1][1]).days <= gap + 1:
+            ranges[-1][1] = d
+        else:
+            ranges.append([d, d])
+    return [(a, b) for a, b in ranges]
+
+
+# ---------- Cache dos checksums da fonte ----------
+def _cache_path(root: str, symbol: str, interval: str) -> str:
+    return os.path.join(root, "%s_%s.json" % (symbol, interval))
+
+def load_cache(root: str, symbol: str, interval: str) -> Digest:
+    try:
+        with open(_cache_path(root, symbol, interval)) as f:
+            raw = json.load(f).get("days", {})
+    except (OSError, ValueError):
+        return {}
+    return {date.fromisoformat(d): (int(n), int(x)) for d, (n, x) in raw.items()}
+
+def save_cache(root: str, symbol: str, interval: str, digest: Digest) -> None:
+    os.makedirs(root, exist_ok=True)
+    path = _cache_path(root, symbol, interval)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"days": {d.isoformat(): [n, x] for d, (n, x) in sorted(digest.items())}}, f)
+    os.replace(tmp, path)
+
+
+# ---------- Reconciliação de um símbolo ----------
+def _fetch(symbol: str, ranges: List[Tuple[date, date]], interval: str, run_id: int) -> Tuple[Dict[datetime, tuple], List[Tuple[date, date]]]:
+    """Baixa os intervalos; retorna (linhas da fonte, intervalos cujo fetch falhou)."""
+    rows: Dict[datetime, tuple] = {}
+    failed = []
+    for a, b in ranges:
+        df = run_once.fetch_range(symbol, a, b, interval)
+        if df.empty and df.attrs.get("empty_reason") == "errors":
+            failed.append((a, b))
+            continue
+        rows.update(source_rows(symbol, df, interval, run_id))
+    return rows, failed
+
+def _in_ranges(d: date, ranges: List[Tuple[date, date]]) -> bool:
+    return any(a <= d <= b for a, b in ranges)
+
+def reconcile_symbol(pool, symbol: str, start: date, end_incl: date, interval: str, run_id: int,
+                     cache_dir: str = RECONCILE_CACHE_DIR, refresh: bool = False) -> Dict:
+    """
+    Compara [start, end_incl] de um símbolo com a fonte e regrava só o que diverge.
+    Retorna o resumo do símbolo (entra em scrape_run_tickers.quality_flags).
+    """
+    settled = datetime.utcnow().date() - timedelta(days=RECONCILE_SETTLE_DAYS)
+    cache = {} if refresh else load_cache(cache_dir, symbol, interval)
+    summary = {"days_cached": 0, "days_fetched": 0, "fetch_requests": 0, "fetch_failed_days": 0,
+               "days_diverged": 0, "rows_missing": 0, "rows_changed": 0, "rows_extra": 0, "rows_written": 0}
+
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    try:
+        stored = stored_digest(cursor, symbol, interval, start, end_incl)
+    finally:
+        cursor.close()
+        conn.close()
+
+    # 1) checksums da fonte: cache para dias assentados, download para o resto
+    all_days = [start + timedelta(days=i) for i in range((end_incl - start).days + 1)]
+    cached_days = [d for d in all_days if d in cache]
+    to_fetch = merge_ranges([d for d in all_days if d not in cache])
+    fresh, failed = _fetch(symbol, to_fetch, interval, run_id)
+    summary["fetch_requests"] += len(to_fetch)
+    fresh_digest = digest_rows(fresh.values())
+    source: Digest = {d: cache[d] for d in cached_days if cache[d][0]}
+    fetched_ok = [r for r in to_fetch if r not in failed]
+    for d in all_days:
+        if d in cache:
+            continue
+        if _in_ranges(d, failed):
+            stored.pop(d, None)  # sem fonte não dá para comparar: fica de fora
+            summary["fetch_failed_days"] += 1
+        elif _in_ranges(d, fetched_ok) and d in fresh_digest:
+            source[d] = fresh_digest[d]
+    summary["days_cached"] = len(cached_days)
+    summary["days_fetched"] = sum((b - a).days + 1 for a, b in fetched_ok)
+
+    # 2) descida ano -> mês -> dia
+    diverged, compared = diverging_days(stored, source)
+    summary["compared"] = compared
+
+    # 3) dias divergentes que vieram do cache: rebaixa para confirmar antes de gravar
+    from_cache = [d for d in diverged if d in cache]
+    if from_cache:
+        ranges = merge_ranges(from_cache)
+        refetched, refailed = _fetch(symbol, ranges, interval, run_id)
+        summary["fetch_requests"] += len(ranges)
+        fresh.update(refetched)
+        re_digest = digest_rows(refetched.values())
+        for d in from_cache:
+            if _in_ranges(d, refailed):
+                diverged.remove(d)
+                summary["fetch_failed_days"] += 1
+            elif re_digest.get(d, (0, 0)) == stored.get(d, (0, 0)):
+                diverged.remove(d)  # o cache estava velho (upstream revisou); o banco está certo
+                cache[d] = re_digest.get(d, (0, 0))
+            else:
+                cache[d] = re_digest.get(d, (0, 0))
+    summary["days_diverged"] = len(diverged)
+
+    # 4) diff linha a linha só nos dias divergentes
+    to_write: List[tuple] = []
+    if diverged:
+        conn = pool.get_connection()
+        cursor = conn.cursor()
+        try:
+            existing: Dict[datetime, int] = {}
+            for a, b in merge_ranges(diverged, gap=0):
+                existing.update(stored_rows(cursor, symbol, interval, a, b))
+        finally:
+            cursor.close()
+            conn.close()
+        wanted = set(diverged)
+        for ts, row in sorted(fresh.items()):
+            if ts.date() not in wanted:
+                continue
+            crc = existing.get(ts)
+            if crc is None:
+                summary["rows_missing"] += 1
+                to_write.append(row)
+            elif crc != row_crc(ts, row[2], row[4]):
+                summary["rows_changed"] += 1
+                to_write.append(row)
+        summary["rows_extra"] = sum(1 for ts in existing if ts not in fresh)
+        if summary["rows_extra"]:
+            logger.warning("%s: %d stored bars are not in the source (kept)", symbol, summary["rows_extra"])
+
+    if to_write:
+        affected, errors = upsert_rows(pool, run_once.UPSERT_SQL, to_write, run_once.BATCH_SIZE)
+        if errors:
+            raise Error("upsert of %d reconciled rows failed" % len(to_write))
+        summary["rows_written"] = len(to_write)
+
+    # 5) cache: só dias assentados, com o checksum da fonte (dias vazios também, como (0, 0))
+    for d in all_days:
+        if d >= settled or _in_ranges(d, failed):
+            continue
+        if d not in cache and _in_ranges(d, fetched_ok):
+            cache[d] = fresh_digest.get(d, (0, 0))
+    save_cache(cache_dir, symbol, interval, cache)
+    return summary
+
+
+# ---------- Execução ----------
+def run_reconcile(pool, tickers: List[str], days: int = 360, end_date: Optional[date] = None,
+                  interval: str = "1d", cache_dir: str = RECONCILE_CACHE_DIR, refresh: bool = False) -> Dict:
+    """
+    Reconcilia `days` dias até end_date (inclusive; default ontem UTC) de cada ticker.
+    As linhas regravadas ganham um run_id próprio (flow 'reconcile').
+    """
+    if interval not in run_once.INTERVAL_LIMITS:
+        raise ValueError("interval não suportado: %s (use %s)" % (interval, ", ".join(run_once.INTERVAL_LIMITS)))
+    if end_date is None:
+        # o dia corrente ainda está mudando: não há o que reconciliar
+        end_date = datetime.utcnow().date() - timedelta(days=1)
+    start_date = end_date - timedelta(days=days - 1)
+    lookback = run_once.INTERVAL_LIMITS[interval][1]
+    if lookback is not None:
+        earliest = datetime.utcnow().date() - timedelta(days=lookback - 1)
+        if start_date < earliest:
+            logger.warning("Interval %s only reaches %d days back; reconciling from %s", interval, lookback, earliest)
+            start_date = earliest
+
+    scrape_id = run_once.make_scrape_id()
+    run_id = runs.ensure_run(pool, scrape_id, "reconcile", interval)
+    logger.info("Reconcile id=%s run_id=%s tickers=%s interval=%s %s..%s",
+                scrape_id, run_id, tickers, interval, start_date, end_date)
+    stats = {"success": 0, "errors": 0, "short_circuited": 0, "rows": 0,
+             "days_diverged": 0, "fetch_requests": 0, "days_cached": 0}
+    ticker_meta: Dict[str, Dict] = {}
+    written: List[str] = []
+    for t in tickers:
+        try:
+            summary = reconcile_symbol(pool, t, start_date, end_date, interval, run_id,
+                                       cache_dir=cache_dir, refresh=refresh)
+        except ratelimit.CircuitOpenError:
+            stats["short_circuited"] += 1
+            ticker_meta[t] = {"status": "circuit_open"}
+            continue
+        except Error as e:
+            logger.warning("Reconcile failed for %s: %s", t, e)
+            stats["errors"] += 1
+            ticker_meta[t] = {"status": "error", "flags": {"exception": str(e)}}
+            continue
+        logger.info("Ticker %s reconciled: %s", t, summary)
+        stats["success"] += 1
+        stats["rows"] += summary["rows_written"]
+        for k in ("days_diverged", "fetch_requests", "days_cached"):
+            stats[k] += summary[k]
+        status = "ok" if not summary["days_diverged"] else "repaired" if summary["rows_written"] else "diverged"
+        ticker_meta[t] = {"status": status, "rows": summary["rows_written"], "flags": summary}
+        if summary["rows_written"]:
+            written.append(t)
+    run_once.invalidate_read_cache(written)
+    stats.update(ratelimit.snapshot())
+    runs.finish_run(pool, run_id, stats, ticker_meta)
+    logger.info("Reconcile finished id=%s run_id=%s stats=%s", scrape_id, run_id, stats)
+    return {"scrape_id": scrape_id, "run_id": run_id, **stats}
+
+
+# ------------------ CLI ------------------
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Checksum reconciliation of raw_crypto against yfinance")
+    parser.add_argument("--tickers", required=True, help="Comma-separated tickers, ex: BTC-USD,ETH-USD")
+    parser.add_argument("--days", type=int, default=360, help="Dias reconciliados até --end (default 360)")
+    parser.add_argument("--end", type=str, default=None, help="Data final inclusive YYYY-MM-DD (default ontem UTC)")
+    parser.add_argument("--interval", default="1d", choices=list(run_once.INTERVAL_LIMITS))
+    parser.add_argument("--cache-dir", default=RECONCILE_CACHE_DIR)
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignora o cache de checksums da fonte e baixa todo o período")
+    args = parser.parse_args()
+
+    tickers = [s.strip() for s in args.tickers.split(",") if s.strip()]
+    end_dt = None
+    if args.end:
+        try:
+            end_dt = datetime.strptime(args.end, "%Y-%m-%d").date()
+        except ValueError as e:
+            logger.error("Formato de --end inválido: %s", e)
+            sys.exit(1)
+    print(run_reconcile(run_once.POOL, tickers, days=args.days, end_date=end_dt, interval=args.interval,
+                        cache_dir=args.cache_dir, refresh=args.refresh))
@@ -4,24 +4,38 @@ backfill_run_once.py
 
 Run-once backfill script:
  - Backfill N dias (default 360) até `--end` (default hoje UTC)
- - Intervalo diário ('1d')
- - Upsert por dia (timestamp truncado para 00:00:00 UTC)
+ - Intervalo diário ('1d') ou intradiário (--interval 1m/5m/15m/1h ...)
+ - Intradiário: o período é dividido nas janelas máximas que o Yahoo aceita
+   por intervalo, baixadas em paralelo sob o mesmo rate limiter e costuradas
+   (sem duplicatas) antes do upsert
+ - Upsert por barra (00:00:00 UTC no diário). Barras sub-hora (1m/5m/15m/30m)
+   são agregadas para 1h (ohlcv.resample_ohlcv, bit QB_RESAMPLED): raw_crypto tem
+   uma barra por (symbol, hora), a mesma chave do yahoo_scraper.py
  - Grava scrape_id e quality_flags por ticker
 """
 
 import os
 import sys
-import time
-import json
 import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
+from typing import Callable, List, Tuple
 
 import pandas as pd
-import yfinance as yf
-import mysql.connector
+import requests
 from mysql.connector import pooling, Error
 
+import ratelimit
+from negative_cache import NegativeCache
+import spool
+import profiling
+import schema
+import features
+import runs
+from ohlcv import STORE_FREQ, resample_ohlcv
+from write_buffer import WriteBuffer
+
 # -------------------- Config (ENV-friendly) --------------------
 DB_HOST = os.getenv("DB_HOST", "127.0.0.1")
 DB_PORT = int(os.getenv("DB_PORT", "3307"))
@@ -31,7 +45,12 @@ DB_NAME = os.getenv("DB_NAME", "projeto_crypto")
 
 REQUESTS_PER_SECOND = float(os.getenv("RPS", "1.0"))  # diário, pode ser 1
 RETRY_MAX = int(os.getenv("RETRY_MAX", "3"))
+EMPTY_RETRY_MAX = int(os.getenv("EMPTY_RETRY_MAX", "1"))
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "500"))
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))  # janelas baixadas em paralelo
+MANAGE_PARTITIONS = os.getenv("MANAGE_PARTITIONS", "1") == "1"
+FEATURES_ENABLED = os.getenv("FEATURES_ENABLED", "1") == "1"
+READ_API_URL = os.getenv("READ_API_URL", "")  # read_api.py; vazio = não invalida
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 # --------------------------------------------------------------
@@ -41,6 +60,9 @@ logger.setLevel(LOG_LEVEL)
 h = logging.StreamHandler()
 h.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
 logger.addHandler(h)
+# módulos compartilhados (schema, write_buffer, ...) logam sob "pipeline.*"
+logging.getLogger("pipeline").setLevel(LOG_LEVEL)
+logging.getLogger("pipeline").addHandler(h)
 
 # DB pool (pequeno pool para um run_once)
 POOL = pooling.MySQLConnectionPool(
@@ -50,32 +72,37 @@ POOL = pooling.MySQLConnectionPool(
 )
 
 # UPSERT SQL (compatível com seu schema raw_crypto)
+# metadados do run ficam em scrape_runs / scrape_run_tickers (runs.py)
 UPSERT_SQL = """
 INSERT INTO raw_crypto
-(symbol, name, price_usd, change_24h_percent, volume_24h_usd, timestamp, source, scrape_id, is_valid, quality_flags, created_at)
-VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+(symbol, name, price_usd, change_24h_percent, volume_24h_usd, timestamp, run_id, is_valid, quality_bits)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
 ON DUPLICATE KEY UPDATE
     price_usd = VALUES(price_usd),
     change_24h_percent = VALUES(change_24h_percent),
     volume_24h_usd = VALUES(volume_24h_usd),
-    source = VALUES(source),
-    scrape_id = VALUES(scrape_id),
+    run_id = VALUES(run_id),
     is_valid = VALUES(is_valid),
-    quality_flags = VALUES(quality_flags),
-    created_at = VALUES(created_at)
+    quality_bits = VALUES(quality_bits)
 ;
 """
 
+# Limites do Yahoo por intervalo: (janela máxima por requisição, histórico máximo) em dias.
+# None = sem limite prático.
+INTERVAL_LIMITS = {
+    "1m": (7, 30),
+    "2m": (60, 60),
+    "5m": (60, 60),
+    "15m": (60, 60),
+    "30m": (60, 60),
+    "60m": (730, 730),
+    "1h": (730, 730),
+    "1d": (None, None),
+}
+
 def make_scrape_id():
     return uuid.uuid4().hex
 
-def sleep_rate_control(last_ts: float, rps: float) -> float:
-    min_interval = 1.0 / max(0.1, rps)
-    elapsed = time.time() - last_ts
-    if elapsed < min_interval:
-        time.sleep(min_interval - elapsed)
-    return time.time()
-
 def truncate_to_day(dt: pd.Timestamp) -> datetime:
     """Trunca para 00:00:00 UTC e retorna datetime (naive UTC)"""
     if not isinstance(dt, pd.Timestamp):
@@ -88,59 +115,177 @@ def truncate_to_day(dt: pd.Timestamp) -> datetime:
     # devolver naive (DATETIME em UTC)
     return dt.to_pydatetime().replace(tzinfo=None)
 
+def truncate_to_interval(dt: pd.Timestamp, interval: str) -> datetime:
+    """Trunca para o início da barra gravada do intervalo (UTC) e retorna datetime (naive UTC)"""
+    if stored_interval(interval) == "1d":
+        return truncate_to_day(dt)
+    if not isinstance(dt, pd.Timestamp):
+        dt = pd.Timestamp(dt)
+    if dt.tz is None:
+        dt = dt.tz_localize("UTC")
+    else:
+        dt = dt.tz_convert("UTC")
+    return dt.floor(STORE_FREQ).to_pydatetime().replace(tzinfo=None)
+
+def stored_interval(interval: str) -> str:
+    """Granularidade gravada em raw_crypto para o intervalo baixado ('1d' ou STORE_FREQ)."""
+    return "1d" if interval == "1d" else STORE_FREQ
+
+def truncate_for(interval: str) -> Callable[[pd.Timestamp], datetime]:
+    """Função de truncamento correspondente ao intervalo."""
+    if interval == "1d":
+        return truncate_to_day
+    return lambda ts: truncate_to_interval(ts, interval)
+
+def normalize_download(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas Open/High/Low/Close/Volume simples, índice tz-aware UTC e tipos numéricos."""
+    if isinstance(df.columns, pd.MultiIndex):
+        out = pd.DataFrame(index=df.index)
+        for col in ["Open","High","Low","Close","Volume"]:
+            matches = [c for c in df.columns if c[0]==col]
+            out[col] = df[matches[0]] if matches else pd.NA
+        df = out
+    else:
+        df = df.rename(columns=lambda s: s.capitalize())
+    # Ensure timezone aware UTC (daily often comes tz-naive)
+    if df.index.tz is None:
+        df.index = df.index.tz_localize("UTC")
+    else:
+        df.index = df.index.tz_convert("UTC")
+    # types
+    for c in ["Open","High","Low","Close"]:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    if "Volume" in df.columns:
+        df["Volume"] = pd.to_numeric(df["Volume"], errors="coerce").fillna(0).astype("Int64")
+    return df
+
+def _empty_frame(reason: str) -> pd.DataFrame:
+    """DataFrame vazio com o motivo em attrs: 'no_data' (upstream sem dados) ou 'errors'."""
+    df = pd.DataFrame()
+    df.attrs["empty_reason"] = reason
+    return df
+
+def _fetch_with_retries(ticker: str, call: Callable[[], pd.DataFrame], label: str,
+                        retry_max: int = RETRY_MAX, rps: float = REQUESTS_PER_SECOND) -> pd.DataFrame:
+    """
+    Executa `call` sob o limiter adaptativo e o circuit breaker do Yahoo.
+    Levanta ratelimit.CircuitOpenError se o breaker estiver aberto.
+    """
+    limiter, breaker = ratelimit.for_host(initial_rps=rps)
+    attempt = 0
+    empties = 0
+    while attempt <= retry_max:
+        attempt += 1
+        breaker.check()
+        limiter.acquire()
+        try:
+            logger.info("Fetching %s %s (attempt %d)", ticker, label, attempt)
+            with profiling.io("http"):
+                df = call()
+        except Exception as e:
+            kind = ratelimit.classify_failure(e)
+            limiter.on_failure(kind)
+            breaker.record_failure()
+            logger.warning("Error fetching %s %s (%s, attempt %d): %s", ticker, label, kind, attempt, e)
+            continue
+        if df is None or df.empty:
+            # upstream respondeu, só não há dados: não penaliza a taxa nem o breaker
+            breaker.record_success()
+            empties += 1
+            logger.warning("Empty DF for %s %s (attempt %d)", ticker, label, attempt)
+            if empties <= EMPTY_RETRY_MAX:
+                continue
+            return _empty_frame("no_data")
+        limiter.on_success()
+        breaker.record_success()
+        return normalize_download(df)
+    logger.error("Giving up fetch %s %s after %d attempts", ticker, label, attempt)
+    return _empty_frame("errors")
+
 def fetch_daily(ticker: str, start_date: date, end_date_inclusive: date, retry_max: int = RETRY_MAX, rps: float = REQUESTS_PER_SECOND) -> pd.DataFrame:
     """
     Baixa dados diários para ticker entre start (inclusive) e end_date_inclusive (inclusive).
-    Usa yf.download(start=..., end=...) onde end é exclusivo, então passa end+1.
+    Usa Ticker.history(start=..., end=...) onde end é exclusivo, então passa end+1.
     Retorna DataFrame com colunas Open/High/Low/Close/Volume e index como DatetimeIndex tz-aware UTC.
+    Ritmo controlado pelo limiter adaptativo do Yahoo (rps = taxa inicial); levanta
+    ratelimit.CircuitOpenError se o breaker estiver aberto.
     """
     start_str = start_date.strftime("%Y-%m-%d")
     end_excl = end_date_inclusive + timedelta(days=1)
     end_str = end_excl.strftime("%Y-%m-%d")
-    attempt = 0
-    last_call = 0.0
-    while attempt <= retry_max:
-        attempt += 1
-        try:
-            last_call = sleep_rate_control(last_call, rps)
-            logger.info("Fetching %s start=%s end=%s (attempt %d)", ticker, start_str, end_str, attempt)
-            df = yf.download(ticker, start=start_str, end=end_str, interval="1d", auto_adjust=False, threads=False, progress=False)
-            if df is None or df.empty:
-                logger.warning("Empty daily DF for %s (attempt %d)", ticker, attempt)
-                if attempt <= retry_max:
-                    time.sleep(2 ** attempt)
-                    continue
-                return pd.DataFrame()
-            # Normalize columns to capitalized names
-            if isinstance(df.columns, pd.MultiIndex):
-                out = pd.DataFrame(index=df.index)
-                for col in ["Open","High","Low","Close","Volume"]:
-                    matches = [c for c in df.columns if c[0]==col]
-                    out[col] = df[matches[0]] if matches else pd.NA
-                df = out
-            else:
-                df = df.rename(columns=lambda s: s.capitalize())
-            # Ensure timezone aware UTC (daily often comes tz-naive)
-            if df.index.tz is None:
-                df.index = df.index.tz_localize("UTC")
-            else:
-                df.index = df.index.tz_convert("UTC")
-            # types
-            for c in ["Open","High","Low","Close"]:
-                if c in df.columns:
-                    df[c] = pd.to_numeric(df[c], errors="coerce")
-            if "Volume" in df.columns:
-                df["Volume"] = pd.to_numeric(df["Volume"], errors="coerce").fillna(0).astype("Int64")
-            return df
-        except Exception as e:
-            logger.exception("Error fetching %s: %s", ticker, e)
-            if attempt <= retry_max:
-                wait = min(60, 2 ** attempt)
-                logger.info("Retry in %ds", wait)
-                time.sleep(wait)
-            else:
-                logger.error("Giving up fetch %s after %d attempts", ticker, attempt)
-                return pd.DataFrame()
+    return _fetch_with_retries(
+        ticker,
+        lambda: ratelimit.yf_history(ticker, start=start_str, end=end_str, interval="1d", auto_adjust=False, actions=False),
+        "start=%s end=%s" % (start_str, end_str), retry_max=retry_max, rps=rps,
+    )
+
+def split_windows(start_date: date, end_excl: date, interval: str) -> List[Tuple[date, date]]:
+    """
+    Divide [start_date, end_excl) nas janelas máximas que o Yahoo aceita para o intervalo.
+    O início é limitado ao histórico máximo do intervalo (com aviso).
+    """
+    window_days, lookback_days = INTERVAL_LIMITS[interval]
+    if lookback_days is not None:
+        # margem de 1 dia: o limite do Yahoo é contado a partir de "agora"
+        earliest = datetime.utcnow().date() - timedelta(days=lookback_days - 1)
+        if start_date < earliest:
+            logger.warning("Interval %s only reaches %d days back; clamping start %s -> %s",
+                           interval, lookback_days, start_date, earliest)
+            start_date = earliest
+    if window_days is None:
+        return [(start_date, end_excl)] if start_date < end_excl else []
+    windows = []
+    cur = start_date
+    while cur < end_excl:
+        nxt = min(end_excl, cur + timedelta(days=window_days))
+        windows.append((cur, nxt))
+        cur = nxt
+    return windows
+
+def fetch_window(ticker: str, start: date, end_excl: date, interval: str, retry_max: int = RETRY_MAX) -> pd.DataFrame:
+    """
+    Baixa uma janela via Ticker.history (seguro chamar em paralelo). Janela sem
+    preços (YFPricesMissingError) volta vazia, como "sem dados", sem penalizar a taxa.
+    """
+    return _fetch_with_retries(
+        ticker,
+        lambda: ratelimit.yf_history(ticker, start=start.isoformat(), end=end_excl.isoformat(), interval=interval,
+                                     auto_adjust=False, actions=False),
+        "interval=%s window=%s..%s" % (interval, start, end_excl), retry_max=retry_max,
+    )
+
+def stitch_windows(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatena janelas, ordena e remove barras repetidas nas bordas (última vence)."""
+    frames = [f for f in frames if f is not None and not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames).sort_index()
+    return df[~df.index.duplicated(keep="last")]
+
+def fetch_range(ticker: str, start_date: date, end_date_inclusive: date, interval: str = "1d",
+                workers: int = BACKFILL_WORKERS) -> pd.DataFrame:
+    """
+    Baixa [start_date, end_date_inclusive] em qualquer intervalo suportado.
+    '1d' = uma requisição (fetch_daily); intradiário = janelas em paralelo + costura.
+    """
+    if interval == "1d":
+        return fetch_daily(ticker, start_date, end_date_inclusive)
+    windows = split_windows(start_date, end_date_inclusive + timedelta(days=1), interval)
+    if not windows:
+        return _empty_frame("no_data")
+    logger.info("Fetching %s interval=%s in %d windows (workers=%d)", ticker, interval, len(windows), workers)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(windows)))) as pool:
+        # CircuitOpenError de qualquer janela propaga para o chamador
+        frames = list(pool.map(lambda w: fetch_window(ticker, w[0], w[1], interval), windows))
+    df = stitch_windows(frames)
+    if df.empty:
+        reasons = {f.attrs.get("empty_reason") for f in frames}
+        return _empty_frame("errors" if "errors" in reasons else "no_data")
+    failed = sum(1 for f in frames if f.empty and f.attrs.get("empty_reason") == "errors")
+    if failed:
+        logger.warning("%s: %d of %d windows failed; upserting the rest", ticker, failed, len(windows))
+    return df
 
 def compute_quality(df: pd.DataFrame) -> dict:
     flags = {"n_rows": int(len(df))}
@@ -159,85 +304,191 @@ def compute_quality(df: pd.DataFrame) -> dict:
     flags["zero_volume_rows"] = int((df.get("Volume", pd.Series([], dtype="Int64"))==0).sum())
     return flags
 
-def upsert_daily_df(ticker: str, name: str, df: pd.DataFrame, scrape_id: str, source: str = "yahoo_finance") -> tuple:
+def prepare_rows(ticker: str, name: str, df: pd.DataFrame, run_id: int, interval: str = "1d") -> list:
     """
-    Transforma DF diário em linhas com timestamp truncado para 00:00 UTC e faz upsert em lotes.
-    Retorna (rows_processed, errors)
+    Transforma o DF em tuplas do UPSERT_SQL (00:00 UTC no diário). Intradiário é
+    agregado para STORE_FREQ antes: gravar a barra de 5m das HH:00 na chave
+    horária sobrescreveria o histórico de 1h com o close/volume de 5 minutos.
     """
-    if df is None or df.empty:
-        return 0, 0
     rows = []
-    now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    if df is None or df.empty:
+        return rows
+    base_bits = 0
+    if interval != "1d":
+        bars = resample_ohlcv(df, STORE_FREQ)
+        base_bits = runs.QB_RESAMPLED if bars is not df else 0
+        df = bars
+    truncate = truncate_for(stored_interval(interval))
     for ts, row in df.iterrows():
         try:
-            ts_day = truncate_to_day(ts)
+            ts_bar = truncate(ts)
             price = None if pd.isna(row.get("Close")) else float(row.get("Close"))
             volume = 0 if pd.isna(row.get("Volume")) else int(row.get("Volume"))
             change_24h = None  # calculado downstream
-            q = {}  # por-row (vazio)
-            rows.append((ticker, name, price, change_24h, volume, ts_day, source, scrape_id, True, json.dumps(q), now))
+            bits = base_bits | (runs.QB_NULL_PRICE if price is None else 0) | (runs.QB_ZERO_VOLUME if volume == 0 else 0)
+            rows.append((ticker, name, price, change_24h, volume, ts_bar, run_id, True, bits))
         except Exception as e:
             logger.exception("Row prepare error %s %s: %s", ticker, ts, e)
             continue
+    return rows
 
-    if not rows:
-        return 0, 0
+def _apply_flush(stats: dict, result: dict, tickers: dict = None) -> list:
+    """Contabiliza um flush do WriteBuffer (todos os tickers do flush comitam juntos).
+    Marca os tickers de um flush que falhou em `tickers` (scrape_run_tickers).
+    Retorna os tickers comitados."""
+    if not result or not result["rows"]:
+        return []
+    stats["rows"] += result["affected"]
+    if result["errors"]:
+        stats["errors"] += len(result["keys"])
+        logger.warning("Flush failed for tickers=%s", list(result["keys"]))
+        for t in result["keys"]:
+            if tickers is not None and t in tickers:
+                tickers[t]["status"] = "write_error"
+        return []
+    stats["success"] += len(result["keys"])
+    invalidate_read_cache(list(result["keys"]))
+    return list(result["keys"])
 
-    conn = POOL.get_connection()
-    cur = conn.cursor()
-    inserted = 0
-    errors = 0
+def invalidate_read_cache(symbols: list) -> None:
+    """Avisa o read_api.py que esses símbolos mudaram (best-effort)."""
+    if not READ_API_URL or not symbols:
+        return
     try:
-        for i in range(0, len(rows), BATCH_SIZE):
-            batch = rows[i:i+BATCH_SIZE]
-            cur.executemany(UPSERT_SQL, batch)
-            conn.commit()
-            inserted += cur.rowcount
-    except Error as e:
-        logger.exception("DB upsert error: %s", e)
-        conn.rollback()
-        errors = 1
-    finally:
-        cur.close()
-        conn.close()
-    return inserted, errors
+        with profiling.io("http"):
+            requests.post(READ_API_URL.rstrip("/") + "/invalidate", json={"symbols": symbols}, timeout=2)
+    except Exception as e:
+        logger.warning("Read cache invalidation failed: %s", e)
 
-def run_backfill(tickers: list, days: int = 360, end_date: date = None):
+def _backfill_cycle(scrape_id: str, tickers: list, start_date: date, end_date: date, interval: str):
+    """Corpo do run_backfill: manutenção, replay, coleta/gravação, features e run."""
+    stats = {"success":0, "empty":0, "errors":0, "rows":0, "short_circuited":0, "skipped":0}
+    ticker_meta = {}
+    if MANAGE_PARTITIONS:
+        # backfill escreve no passado: garante partições mensais desde start_date
+        try:
+            with profiling.stage("maintenance"), profiling.io("db"):
+                logger.info("Partition maintenance: %s", schema.maintain_partitions(POOL, since=start_date))
+        except Error as e:
+            logger.warning("Partition maintenance failed: %s", e)
+    run_id = runs.ensure_run(POOL, scrape_id, "run_once", interval)
+    wal = (spool.Spool(resolve_run=lambda sid: runs.ensure_run(POOL, sid, "spool_replay", status="replayed"))
+           if spool.SPOOL_ENABLED else None)
+    if wal is not None:
+        try:
+            with profiling.stage("replay"):
+                wal.replay(POOL, UPSERT_SQL)
+        except Exception as e:
+            # banco/disco fora: as pendências ficam no spool para o próximo replay
+            logger.warning("Spool replay failed, segments kept for later: %s", e)
+    buffer = WriteBuffer(POOL, UPSERT_SQL, statement_rows=BATCH_SIZE, spool=wal)
+    written = []
+    earliest = {}  # barra mais antiga gravada por ticker (início do recálculo de features)
+    orphan_keys = []  # (symbol, timestamp) gravados com run_id 0
+    negative = NegativeCache()
+    # vazio num intervalo explícito do passado (ex.: antes do listing) não prova que o
+    # ticker morreu: o cache negativo só vale quando o intervalo chega até hoje
+    use_negative = end_date >= datetime.utcnow().date() - timedelta(days=1)
+    try:
+        for t in tickers:
+            if use_negative and negative.should_skip(t, interval):
+                logger.info("Skipping %s: negative-cached (repeatedly empty)", t)
+                stats["skipped"] += 1
+                ticker_meta[t] = {"status": "skipped"}
+                continue
+            logger.info("Processing ticker %s", t)
+            try:
+                with profiling.stage("fetch"):
+                    df = fetch_range(t, start_date, end_date, interval)
+            except ratelimit.CircuitOpenError:
+                stats["short_circuited"] += 1
+                ticker_meta[t] = {"status": "circuit_open"}
+                continue
+            with profiling.stage("prepare"):
+                qflags = compute_quality(df)
+            if df.empty:
+                logger.warning("Ticker %s: empty df flags=%s", t, qflags)
+                stats["empty"] += 1
+                ticker_meta[t] = {"status": "empty", "flags": qflags}
+                if use_negative and df.attrs.get("empty_reason") == "no_data":
+                    negative.record_empty(t, interval)
+                continue
+            if use_negative:
+                negative.record_hit(t, interval)
+            with profiling.stage("prepare"):
+                rows = prepare_rows(t, t, df, run_id, interval=interval)
+                if rows:
+                    earliest[t] = min(r[5] for r in rows)
+                if run_id == runs.UNREGISTERED_RUN:
+                    orphan_keys += [(t, r[5]) for r in rows]
+            logger.info("Ticker %s buffered rows=%d flags=%s", t, len(rows), qflags)
+            ticker_meta[t] = {"status": "ok", "rows": len(rows), "flags": qflags}
+            with profiling.stage("write"):
+                written += _apply_flush(stats, buffer.add(t, rows, scrape_id=scrape_id), ticker_meta)
+    finally:
+        # exceção no meio do loop: o que já se aprendeu sobre os tickers fica gravado
+        negative.save()
+    try:
+        with profiling.stage("write"):
+            written += _apply_flush(stats, buffer.flush(), ticker_meta)
+    except Exception as e:
+        # as linhas continuam no spool; o próximo run (ou replay) grava
+        logger.error("Final flush failed, rows stay spooled: %s", e)
+        stats["errors"] += 1
+    stats.update(buffer.summary())
+    if wal is not None:
+        stats.update(wal.summary())
+    stats.update(ratelimit.snapshot())
+    if FEATURES_ENABLED and written:
+        try:
+            with profiling.stage("features"):
+                features.update_features(POOL, written, interval=stored_interval(interval), changed=earliest)
+        except Error as e:
+            logger.warning("Feature update failed: %s", e)
+    profile_path = profiling.finish()
+    if profile_path:
+        stats["profile"] = profile_path
+    if run_id == runs.UNREGISTERED_RUN:
+        run_id = runs.ensure_run(POOL, scrape_id, "run_once", interval)
+        runs.adopt_rows(POOL, run_id, orphan_keys)
+    runs.finish_run(POOL, run_id, stats, ticker_meta)
+    logger.info("Backfill finished id=%s run_id=%s stats=%s", scrape_id, run_id, stats)
+    return scrape_id, stats
+def run_backfill(tickers: list, days: int = 360, end_date: date = None, interval: str = "1d",
+                 profile: bool = False):
     """
-    Run-once backfill for tickers covering `days` up to `end_date` (inclusive).
+    Run-once backfill for tickers covering `days` up to `end_date` (inclusive)
+    at any interval in INTERVAL_LIMITS. profile=True grava o relatório do profiling.py.
     """
+    if interval not in INTERVAL_LIMITS:
+        raise ValueError("interval não suportado: %s (use %s)" % (interval, ", ".join(INTERVAL_LIMITS)))
     if end_date is None:
         end_date = datetime.utcnow().date()
     start_date = end_date - timedelta(days=days)
     scrape_id = make_scrape_id()
-    logger.info("Backfill id=%s tickers=%s start=%s end=%s (inclusive)", scrape_id, tickers, start_date, end_date)
-    stats = {"success":0, "empty":0, "errors":0, "rows":0}
-    for t in tickers:
-        logger.info("Processing ticker %s", t)
-        df = fetch_daily(t, start_date, end_date)
-        qflags = compute_quality(df)
-        if df.empty:
-            logger.warning("Ticker %s: empty df flags=%s", t, qflags)
-            stats["empty"] += 1
-            continue
-        inserted, errs = upsert_daily_df(t, t, df, scrape_id)
-        stats["rows"] += inserted
-        if errs == 0:
-            stats["success"] += 1
-            logger.info("Ticker %s upserted rows=%d flags=%s", t, inserted, qflags)
-        else:
-            stats["errors"] += 1
-            logger.warning("Ticker %s upsert errors, flags=%s", t, qflags)
-    logger.info("Backfill finished id=%s stats=%s", scrape_id, stats)
-    return scrape_id, stats
+    logger.info("Backfill id=%s tickers=%s interval=%s start=%s end=%s (inclusive)",
+                scrape_id, tickers, interval, start_date, end_date)
+    if profile or profiling.sampled():
+        profiling.start(scrape_id)
+    try:
+        return _backfill_cycle(scrape_id, tickers, start_date, end_date, interval)
+    finally:
+        # exceção no meio do run: fecha o profiler mesmo assim (no-op se já fechado)
+        profiling.finish()
 
 # ------------------ CLI ------------------
 if __name__ == "__main__":
     import argparse
-    parser = argparse.ArgumentParser(description="Run-once backfill daily data via yfinance")
+    parser = argparse.ArgumentParser(description="Run-once backfill (daily or intraday) via yfinance")
     parser.add_argument("--tickers", required=True, help="Comma-separated tickers, ex: BTC-USD,ETH-USD")
     parser.add_argument("--days", type=int, default=360, help="Número de dias de backfill (default 360)")
     parser.add_argument("--end", type=str, default=None, help="Data final inclusive YYYY-MM-DD (default hoje UTC)")
+    parser.add_argument("--interval", default="1d", choices=list(INTERVAL_LIMITS),
+                        help="Granularidade (default 1d); intradiário é dividido nas janelas do Yahoo")
+    parser.add_argument("--export-parquet", action="store_true",
+                        help="Após o backfill, exporta partições alteradas para PARQUET_EXPORT_DIR")
+    parser.add_argument("--profile", action="store_true",
+                        help="Grava relatório de CPU/memória/IO por etapa em PROFILE_DIR")
     args = parser.parse_args()
 
     tickers = [s.strip() for s in args.tickers.split(",") if s.strip()]
@@ -251,4 +502,7 @@ if __name__ == "__main__":
         end_dt = None
 
     # run
-    run_backfill(tickers, days=args.days, end_date=end_dt)
+    run_backfill(tickers, days=args.days, end_date=end_dt, interval=args.interval, profile=args.profile)
+    if args.export_parquet:
+        import parquet_export  # pyarrow só é necessário com --export-parquet
+        logger.info("Parquet export: %s", parquet_export.export_incremental(POOL))
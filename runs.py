@@ -0,0 +1,194 @@
+"""
+runs.py
+
+Metadados por execução, gravados uma vez por run em vez de repetidos em cada
+linha de `raw_crypto`:
+- scrape_runs: run_id (INT, referenciado por raw_crypto.run_id), scrape_id,
+  flow, source, intervalo, início/fim, status e stats da execução
+- scrape_run_tickers: por (run_id, symbol) o status, linhas gravadas e o
+  resumo de qualidade (compute_quality_flags / compute_quality)
+
+raw_crypto guarda só run_id + quality_bits (máscara por linha, QB_*).
+run_id 0 = execução não registrada (banco fora no início do run); as linhas
+vão para o spool e ganham o run_id real no replay (ensure_run por scrape_id).
+Se o banco volta durante o run, as linhas já gravadas com 0 são reapontadas
+no fim (adopt_rows).
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from mysql.connector import Error
+
+# bits de raw_crypto.quality_bits
+QB_NULL_PRICE = 1     # Close ausente
+QB_ZERO_VOLUME = 2    # volume 0 na barra
+QB_RESAMPLED = 4      # barra agregada de barras menores (ex.: 5m -> 1h, stream 1m -> 1h)
+
+UNREGISTERED_RUN = 0
+
+_TABLES_READY = False
+
+logger = logging.getLogger("pipeline.runs")
+
+
+def ensure_run_tables(cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scrape_runs (
+            run_id INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            scrape_id CHAR(32) NOT NULL,
+            flow VARCHAR(32) NOT NULL,
+            source VARCHAR(50) NOT NULL,
+            bar_interval VARCHAR(8),
+            started_at DATETIME NOT NULL,
+            finished_at DATETIME NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'running',
+            stats JSON NULL,
+            UNIQUE KEY unique_scrape_id (scrape_id),
+            KEY idx_status_started (status, started_at)
+        ) ENGINE=InnoDB
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scrape_run_tickers (
+            run_id INT UNSIGNED NOT NULL,
+            symbol VARCHAR(20) NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            rows_written INT NOT NULL DEFAULT 0,
+            quality_flags JSON NULL,
+            PRIMARY KEY (run_id, symbol)
+        ) ENGINE=InnoDB
+        """
+    )
+
+
+def ensure_run(pool, scrape_id: str, flow: str, interval: Optional[str] = None,
+               source: str = "yahoo_finance", status: str = "running") -> int:
+    """
+    Registra (ou reencontra, pelo scrape_id) a execução e retorna o run_id.
+    status != 'running' registra um run já fechado (ex.: replay do spool).
+    Com o banco fora retorna UNREGISTERED_RUN em vez de levantar: a coleta segue
+    e as linhas esperam no spool.
+    """
+    global _TABLES_READY
+    try:
+        conn = pool.get_connection()
+    except Error as e:
+        logger.warning("Could not register run %s (%s); using run_id 0", scrape_id, e)
+        return UNREGISTERED_RUN
+    cursor = conn.cursor()
+    try:
+        if not _TABLES_READY:
+            ensure_run_tables(cursor)
+            _TABLES_READY = True
+        # LAST_INSERT_ID(expr) devolve o run_id existente quando o scrape_id já foi registrado
+        cursor.execute(
+            "INSERT INTO scrape_runs (scrape_id, flow, source, bar_interval, started_at, status) "
+            "VALUES (%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE run_id = LAST_INSERT_ID(run_id)",
+            (scrape_id, flow, source, interval, datetime.utcnow().replace(microsecond=0), status),
+        )
+        run_id = cursor.lastrowid
+        conn.commit()
+        return int(run_id)
+    except Error as e:
+        logger.warning("Could not register run %s (%s); using run_id 0", scrape_id, e)
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        return UNREGISTERED_RUN
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def adopt_rows(pool, run_id: int, keys: List[Tuple[str, datetime]], chunk: int = 500) -> int:
+    """
+    Reaponta para run_id as linhas (symbol, timestamp) que este run gravou com
+    UNREGISTERED_RUN antes de conseguir se registrar. Só toca linhas ainda com
+    run_id 0 (se outro run regravou a barra, ela já é dele). Retorna linhas alteradas.
+    """
+    if run_id == UNREGISTERED_RUN or not keys:
+        return 0
+    by_symbol: Dict[str, List[datetime]] = {}
+    for symbol, ts in keys:
+        by_symbol.setdefault(symbol, []).append(ts)
+    conn = cursor = None
+    updated = 0
+    try:
+        conn = pool.get_connection()
+        cursor = conn.cursor()
+        for symbol, stamps in by_symbol.items():
+            stamps = sorted(set(stamps))
+            for i in range(0, len(stamps), chunk):
+                part = stamps[i:i + chunk]
+                cursor.execute(
+                    "UPDATE raw_crypto SET run_id = %%s WHERE run_id = %%s AND symbol = %%s AND `timestamp` IN (%s)"
+                    % ",".join(["%s"] * len(part)),
+                    (run_id, UNREGISTERED_RUN, symbol, *part),
+                )
+                updated += cursor.rowcount
+        conn.commit()
+        if updated:
+            logger.info("Run %s adopted %d rows written before it was registered", run_id, updated)
+        return updated
+    except Error as e:
+        logger.warning("Could not adopt run_id 0 rows for run %s: %s", run_id, e)
+        if conn is not None:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        return 0
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
+
+
+def finish_run(pool, run_id: int, stats: Dict, tickers: Dict[str, Dict], status: Optional[str] = None) -> bool:
+    """
+    Fecha a execução: stats e status em scrape_runs + uma linha por ticker em
+    scrape_run_tickers ({"status", "rows", "flags"}), numa transação.
+    Retorna False (só loga) se o banco falhar.
+    """
+    if run_id == UNREGISTERED_RUN:
+        return False
+    if status is None:
+        status = "success" if not stats.get("errors") and not stats.get("short_circuited") else "failure"
+    try:
+        conn = pool.get_connection()
+    except Error as e:
+        logger.warning("Could not finish run %s: %s", run_id, e)
+        return False
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE scrape_runs SET finished_at = %s, status = %s, stats = %s WHERE run_id = %s",
+            (datetime.utcnow().replace(microsecond=0), status, json.dumps(stats, default=str), run_id),
+        )
+        if tickers:
+            cursor.executemany(
+                "INSERT INTO scrape_run_tickers (run_id, symbol, status, rows_written, quality_flags) "
+                "VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE status = VALUES(status), "
+                "rows_written = VALUES(rows_written), quality_flags = VALUES(quality_flags)",
+                [(run_id, sym, t["status"], int(t.get("rows", 0)), json.dumps(t.get("flags") or {}, default=str))
+                 for sym, t in tickers.items()],
+            )
+        conn.commit()
+        return True
+    except Error as e:
+        logger.warning("Could not finish run %s: %s", run_id, e)
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        return False
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+schema.py
+
+Gerenciamento do schema de `raw_crypto`:
+- Cria a tabela já particionada por mês (RANGE COLUMNS em `timestamp`)
+- Migra a tabela legada (sem partições) para o layout particionado
+- Pré-cria partições futuras antes que o scraper precise delas
+- Estende partições para trás quando um backfill pede datas antigas
+- Retenção por granularidade: apaga (drop) ou arquiva (archive) dados expirados
+- Migra as colunas por linha legadas (source, scrape_id, quality_flags,
+  created_at) para run_id + quality_bits, com os metadados em scrape_runs (runs.py)
+- Coluna `ingested_at` (última gravação da linha): watermark do parquet_export
+
+Idempotente: pode ser chamado a cada execução do yahoo_scraper.py e do run_once.py.
+Usa GET_LOCK para que execuções concorrentes não façam DDL ao mesmo tempo.
+
+Layout das partições:
+    p_hist   VALUES LESS THAN (<primeiro mês>)
+    pYYYYMM  VALUES LESS THAN (<mês seguinte>)     -- uma por mês
+    p_future VALUES LESS THAN (MAXVALUE)
+"""
+
+import os
+import logging
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from mysql.connector import Error
+
+import runs
+
+# -------------------- Config (ENV-friendly) --------------------
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Retenção em dias por granularidade (0 = manter para sempre; opt-in)
+RETENTION_INTRADAY_DAYS = int(os.getenv("RETENTION_INTRADAY_DAYS", "0"))
+RETENTION_DAILY_DAYS = int(os.getenv("RETENTION_DAILY_DAYS", "0"))
+# "drop" apaga os dados expirados; "archive" copia para raw_crypto_archive antes
+RETENTION_MODE = os.getenv("RETENTION_MODE", "drop")
+RETENTION_DELETE_CHUNK = int(os.getenv("RETENTION_DELETE_CHUNK", "10000"))
+# --------------------------------------------------------------
+
+TABLE = "raw_crypto"
+ARCHIVE_TABLE = "raw_crypto_archive"
+LOCK_NAME = "raw_crypto_schema"
+
+DEFAULT_RETENTION = {"intraday": RETENTION_INTRADAY_DAYS, "1d": RETENTION_DAILY_DAYS}
+
+logger = logging.getLogger("pipeline.schema")
+
+# Colunas compatíveis com o UPSERT do yahoo_scraper.py / run_once.py.
+# PRIMARY KEY inclui `timestamp` porque o MySQL exige que toda chave única
+# contenha a coluna de particionamento. Sem FOREIGN KEY para scrape_runs:
+# tabelas particionadas não suportam FKs.
+COLUMNS_SQL = """
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    symbol VARCHAR(20) NOT NULL,
+    name VARCHAR(100),
+    price_usd DECIMAL(20,8),
+    change_24h_percent DECIMAL(10,4),
+    volume_24h_usd BIGINT,
+    `timestamp` DATETIME(6) NOT NULL,
+    run_id INT UNSIGNED NOT NULL DEFAULT 0,
+    is_valid TINYINT(1) NOT NULL DEFAULT 1,
+    quality_bits SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+    ingested_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (id, `timestamp`),
+    UNIQUE KEY unique_symbol_ts (symbol, `timestamp`),
+    KEY idx_run_id (run_id),
+    KEY idx_ingested_at (ingested_at)
+"""
+LEGACY_RUN_COLUMNS = ("source", "scrape_id", "quality_flags", "created_at")
+
+
+# ---------- Helpers de data ----------
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+def add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+def partition_name(d: date) -> str:
+    return "p%04d%02d" % (d.year, d.month)
+
+def _month_defs(first: date, last_excl: date) -> List[str]:
+    """Definições `PARTITION pYYYYMM VALUES LESS THAN (...)` de first até last_excl (exclusivo)."""
+    defs = []
+    m = month_start(first)
+    while m < last_excl:
+        nxt = add_months(m, 1)
+        defs.append("PARTITION %s VALUES LESS THAN ('%s')" % (partition_name(m), nxt.isoformat()))
+        m = nxt
+    return defs
+
+def _parse_bound(description: Optional[str]) -> Optional[date]:
+    """PARTITION_DESCRIPTION vem como "'2026-11-01 00:00:00'" ou 'MAXVALUE'."""
+    if not description or description.upper() == "MAXVALUE":
+        return None
+    return datetime.strptime(description.strip("'\"")[:10], "%Y-%m-%d").date()
+
+
+# ---------- Introspecção ----------
+def list_partitions(cursor, table: str = TABLE) -> List[Tuple[Optional[str], Optional[date]]]:
+    """Retorna [(partition_name, upper_bound)] em ordem. Lista vazia = tabela não existe;
+    um único item com nome None = tabela existe mas não é particionada."""
+    cursor.execute(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY PARTITION_ORDINAL_POSITION",
+        (table,),
+    )
+    return [(name, _parse_bound(desc)) for name, desc in cursor.fetchall()]
+
+def _monthly(parts: List[Tuple[Optional[str], Optional[date]]]) -> List[Tuple[str, date]]:
+    return [(n, b) for n, b in parts if n and n not in ("p_hist", "p_future")]
+
+
+# ---------- Criação / migração ----------
+def _create_partitioned(cursor, first_month: date, months_ahead: int) -> None:
+    last_excl = add_months(month_start(datetime.utcnow().date()), months_ahead + 1)
+    defs = ["PARTITION p_hist VALUES LESS THAN ('%s')" % first_month.isoformat()]
+    defs += _month_defs(first_month, last_excl)
+    defs.append("PARTITION p_future VALUES LESS THAN (MAXVALUE)")
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS %s (%s) ENGINE=InnoDB\nPARTITION BY RANGE COLUMNS(`timestamp`) (\n    %s\n)"
+        % (TABLE, COLUMNS_SQL, ",\n    ".join(defs))
+    )
+    logger.info("Created partitioned %s with %d partitions", TABLE, len(defs))
+
+def _migrate_unpartitioned(cursor, months_ahead: int) -> None:
+    """Converte a tabela legada (PK id, UNIQUE symbol+timestamp) para o layout particionado.
+    Reescreve a tabela inteira (ALTER com cópia) — rodar numa janela sem carga."""
+    cursor.execute("SELECT MIN(`timestamp`) FROM %s" % TABLE)
+    (min_ts,) = cursor.fetchone()
+    first = month_start(min_ts.date() if min_ts else datetime.utcnow().date())
+    last_excl = add_months(month_start(datetime.utcnow().date()), months_ahead + 1)
+    logger.info("Migrating %s to monthly partitions starting %s", TABLE, first)
+    cursor.execute(
+        "ALTER TABLE %s DROP PRIMARY KEY, ADD PRIMARY KEY (id, `timestamp`)" % TABLE
+    )
+    defs = ["PARTITION p_hist VALUES LESS THAN ('%s')" % first.isoformat()]
+    defs += _month_defs(first, last_excl)
+    defs.append("PARTITION p_future VALUES LESS THAN (MAXVALUE)")
+    cursor.execute(
+        "ALTER TABLE %s PARTITION BY RANGE COLUMNS(`timestamp`) (\n    %s\n)"
+        % (TABLE, ",\n    ".join(defs))
+    )
+
+def _columns(cursor, table: str) -> List[str]:
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table,),
+    )
+    return [r[0] for r in cursor.fetchall()]
+
+def migrate_run_columns(cursor, table: str = TABLE) -> bool:
+    """
+    Layout legado -> run_id + quality_bits: registra cada scrape_id antigo em
+    scrape_runs (flow 'legacy'), aponta as linhas para o run_id e remove as
+    colunas por linha. Reescreve a tabela — rodar numa janela sem carga.
+    Retorna True se migrou.
+    """
+    cols = _columns(cursor, table)
+    if not cols or "scrape_id" not in cols:
+        return False
+    logger.info("Migrating %s per-row run metadata to scrape_runs", table)
+    runs.ensure_run_tables(cursor)
+    cursor.execute(
+        "INSERT IGNORE INTO scrape_runs (scrape_id, flow, source, started_at, finished_at, status) "
+        "SELECT scrape_id, 'legacy', COALESCE(MAX(source), 'yahoo_finance'), "
+        "COALESCE(MIN(created_at), UTC_TIMESTAMP()), MAX(created_at), 'success' "
+        "FROM %s WHERE scrape_id IS NOT NULL GROUP BY scrape_id" % table
+    )
+    if "run_id" not in cols:
+        cursor.execute(
+            "ALTER TABLE %s ADD COLUMN run_id INT UNSIGNED NOT NULL DEFAULT 0 AFTER `timestamp`, "
+            "ADD COLUMN quality_bits SMALLINT UNSIGNED NOT NULL DEFAULT 0 AFTER is_valid" % table
+        )
+    cursor.execute(
+        "UPDATE %s r LEFT JOIN scrape_runs s ON s.scrape_id = r.scrape_id "
+        "SET r.run_id = COALESCE(s.run_id, 0), "
+        "r.quality_bits = IF(r.price_usd IS NULL, %d, 0) | IF(r.volume_24h_usd = 0, %d, 0)"
+        % (table, runs.QB_NULL_PRICE, runs.QB_ZERO_VOLUME)
+    )
+    drops = ", ".join("DROP COLUMN %s" % c for c in LEGACY_RUN_COLUMNS if c in cols)
+    cursor.execute("ALTER TABLE %s %s, ADD KEY idx_run_id (run_id)" % (table, drops))
+    return True
+
+def migrate_ingest_column(cursor, table: str = TABLE) -> bool:
+    """
+    Adiciona `ingested_at` (horário da última gravação da linha, mantido pelo MySQL
+    em INSERT e em UPDATE que muda algum valor). É o watermark do parquet_export:
+    replay do spool e linhas de runs antigos ganham horário novo ao chegar.
+    Linhas existentes ficam com o horário da migração (um export completo).
+    """
+    cols = _columns(cursor, table)
+    if not cols or "ingested_at" in cols:
+        return False
+    logger.info("Adding ingested_at to %s", table)
+    cursor.execute(
+        "ALTER TABLE %s ADD COLUMN ingested_at DATETIME(6) NOT NULL "
+        "DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6) AFTER quality_bits, "
+        "ADD KEY idx_ingested_at (ingested_at)" % table
+    )
+    return True
+
+def ensure_raw_crypto_table(cursor, since: Optional[date] = None, months_ahead: int = PARTITION_MONTHS_AHEAD) -> str:
+    """Garante que `raw_crypto` existe e é particionada. Retorna 'created', 'migrated' ou 'ok'."""
+    parts = list_partitions(cursor)
+    if not parts:
+        first = month_start(since or datetime.utcnow().date())
+        _create_partitioned(cursor, first, months_ahead)
+        return "created"
+    if parts[0][0] is None:
+        _migrate_unpartitioned(cursor, months_ahead)
+        return "migrated"
+    return "ok"
+
+
+# ---------- Rotação ----------
+def ensure_future_partitions(cursor, months_ahead: int = PARTITION_MONTHS_AHEAD, today: Optional[date] = None) -> int:
+    """Divide p_future para que existam partições mensais até `months_ahead` meses à frente."""
+    today = today or datetime.utcnow().date()
+    target_excl = add_months(month_start(today), months_ahead + 1)
+    monthly = _monthly(list_partitions(cursor))
+    if monthly:
+        next_start = monthly[-1][1]
+    else:
+        hist = [b for n, b in list_partitions(cursor) if n == "p_hist"]
+        next_start = hist[0] if hist else month_start(today)
+    defs = _month_defs(next_start, target_excl)
+    if not defs:
+        return 0
+    defs.append("PARTITION p_future VALUES LESS THAN (MAXVALUE)")
+    cursor.execute(
+        "ALTER TABLE %s REORGANIZE PARTITION p_future INTO (\n    %s\n)" % (TABLE, ",\n    ".join(defs))
+    )
+    logger.info("Added %d future partitions to %s", len(defs) - 1, TABLE)
+    return len(defs) - 1
+
+def ensure_history_partitions(cursor, since: date) -> int:
+    """Divide p_hist para que um backfill a partir de `since` caia em partições mensais."""
+    parts = list_partitions(cursor)
+    hist = [b for n, b in parts if n == "p_hist"]
+    if not hist or month_start(since) >= hist[0]:
+        return 0
+    first = month_start(since)
+    defs = ["PARTITION p_hist VALUES LESS THAN ('%s')" % first.isoformat()]
+    defs += _month_defs(first, hist[0])
+    cursor.execute(
+        "ALTER TABLE %s REORGANIZE PARTITION p_hist INTO (\n    %s\n)" % (TABLE, ",\n    ".join(defs))
+    )
+    logger.info("Split p_hist of %s into %d monthly partitions from %s", TABLE, len(defs) - 1, first)
+    return len(defs) - 1
+
+
+# ---------- Retenção ----------
+def _ensure_archive_table(cursor) -> None:
+    cursor.execute("CREATE TABLE IF NOT EXISTS %s (%s) ENGINE=InnoDB" % (ARCHIVE_TABLE, COLUMNS_SQL))
+
+def _archive(cursor, partitions: List[str], where: str = "1=1") -> None:
+    _ensure_archive_table(cursor)
+    cursor.execute(
+        "INSERT IGNORE INTO %s SELECT * FROM %s PARTITION (%s) WHERE %s"
+        % (ARCHIVE_TABLE, TABLE, ", ".join(partitions), where)
+    )
+
+def _has_rows(cursor, partition: str, where: str) -> bool:
+    cursor.execute("SELECT 1 FROM %s PARTITION (%s) WHERE %s LIMIT 1" % (TABLE, partition, where))
+    return cursor.fetchone() is not None
+
+def retention_plan(monthly: List[Tuple[str, date]], policy: Dict[str, int],
+                   today: date) -> Tuple[List[str], List[str], Optional[date]]:
+    """
+    Decide o que a retenção faz, sem tocar no banco. Retorna
+    (partições a remover inteiras, partições a podar do intraday, cutoff do intraday).
+    - Remoção inteira: limite superior já expirou para TODAS as granularidades
+      (nenhuma com retenção 0); ao menos uma partição mensal fica.
+    - Poda do intraday: p_hist + meses que já cruzaram o cutoff inteiros. O mês que
+      o cutoff atravessa espera virar ao todo — não é varrido a cada execução.
+    """
+    expired: List[str] = []
+    if monthly and policy and all(days > 0 for days in policy.values()):
+        cutoff = today - timedelta(days=max(policy.values()))
+        expired = [n for n, b in monthly if b <= cutoff][: len(monthly) - 1]
+    days = policy.get("intraday", 0)
+    if days <= 0:
+        return expired, [], None
+    cutoff = today - timedelta(days=days)
+    targets = ["p_hist"] + [n for n, b in monthly if b <= cutoff and n not in expired]
+    return expired, targets, cutoff
+
+def apply_retention(conn, policy: Optional[Dict[str, int]] = None, mode: str = RETENTION_MODE,
+                    today: Optional[date] = None) -> Dict[str, int]:
+    """
+    Aplica a política de retenção (retention_plan). Granularidade é inferida pelo
+    alinhamento do timestamp: barras em 00:00:00 UTC contam como '1d', as demais como 'intraday'.
+    - Partições expiradas para todas as granularidades: DROP PARTITION (sem varrer linhas).
+    - Intraday com retenção menor: DELETE ... PARTITION (...) em blocos, só nos meses
+      que já cruzaram o cutoff (depois da primeira poda eles só têm barras diárias).
+    Retorna contagem de partições removidas e linhas podadas.
+    """
+    policy = DEFAULT_RETENTION if policy is None else policy
+    today = today or datetime.utcnow().date()
+    cursor = conn.cursor()
+    summary = {"dropped_partitions": 0, "pruned_rows": 0}
+    try:
+        expired, targets, cutoff = retention_plan(_monthly(list_partitions(cursor)), policy, today)
+
+        # 1) partições inteiras expiradas
+        if expired:
+            if mode == "archive":
+                _archive(cursor, expired)
+                conn.commit()
+            cursor.execute("ALTER TABLE %s DROP PARTITION %s" % (TABLE, ", ".join(expired)))
+            summary["dropped_partitions"] = len(expired)
+            logger.info("Retention %s partitions %s", mode, expired)
+
+        # 2) poda da granularidade intraday (retenção menor que a diária), só onde ainda há
+        # barras intraday: meses já podados (só barras diárias) não rodam o DELETE de novo
+        if targets:
+            where = "`timestamp` < '%s' AND TIME(`timestamp`) <> '00:00:00'" % cutoff.isoformat()
+            targets = [n for n in targets if _has_rows(cursor, n, where)]
+        if targets:
+            if mode == "archive":
+                _archive(cursor, targets, where)
+                conn.commit()
+            while True:
+                cursor.execute(
+                    "DELETE FROM %s PARTITION (%s) WHERE %s LIMIT %d"
+                    % (TABLE, ", ".join(targets), where, RETENTION_DELETE_CHUNK)
+                )
+                n = cursor.rowcount
+                conn.commit()
+                summary["pruned_rows"] += n
+                if n < RETENTION_DELETE_CHUNK:
+                    break
+            logger.info("Retention pruned %d intraday rows from %s", summary["pruned_rows"], targets)
+    finally:
+        cursor.close()
+    return summary
+
+
+# ---------- Entry point ----------
+def maintain_partitions(pool, since: Optional[date] = None, months_ahead: int = PARTITION_MONTHS_AHEAD,
+                        policy: Optional[Dict[str, int]] = None, mode: str = RETENTION_MODE) -> Dict:
+    """
+    Cria/migra `raw_crypto`, pré-cria partições futuras, estende o histórico até `since`
+    e aplica a retenção. Seguro para chamar em toda execução; se outro processo estiver
+    fazendo manutenção (GET_LOCK ocupado), apenas retorna {'skipped': True}.
+    """
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+        (got,) = cursor.fetchone()
+        if not got:
+            logger.info("Schema maintenance already running elsewhere; skipping")
+            return {"skipped": True}
+        try:
+            result = {"table": ensure_raw_crypto_table(cursor, since=since, months_ahead=months_ahead)}
+            runs.ensure_run_tables(cursor)
+            result["run_columns_migrated"] = migrate_run_columns(cursor)
+            migrate_run_columns(cursor, ARCHIVE_TABLE)
+            result["ingest_column_added"] = migrate_ingest_column(cursor)
+            migrate_ingest_column(cursor, ARCHIVE_TABLE)
+            result["future_added"] = ensure_future_partitions(cursor, months_ahead)
+            result["history_added"] = ensure_history_partitions(cursor, since) if since else 0
+            result.update(apply_retention(conn, policy=policy, mode=mode))
+            logger.info("Schema maintenance done: %s", result)
+            return result
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchone()
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+        conn.close()
+
+
+# ------------------ CLI ------------------
+if __name__ == "__main__":
+    import argparse
+    from mysql.connector import pooling
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Create/migrate raw_crypto partitions and apply retention")
+    parser.add_argument("--since", type=str, default=None, help="Garante partições desde YYYY-MM-DD")
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    parser.add_argument("--mode", choices=["drop", "archive"], default=RETENTION_MODE)
+    args = parser.parse_args()
+
+    pool = pooling.MySQLConnectionPool(
+        pool_name="schema_pool", pool_size=1,
+        host=os.getenv("MYSQL_HOST", "db"), port=int(os.getenv("MYSQL_PORT", "3306")),
+        user=os.getenv("MYSQL_USER", "Acelino"), password=os.getenv("MYSQL_PASSWORD", "senha123"),
+        database=os.getenv("MYSQL_DB", "projet_crypto"), autocommit=False,
+    )
+    since = datetime.strptime(args.since, "%Y-%m-%d").date() if args.since else None
+    try:
+        print(maintain_partitions(pool, since=since, months_ahead=args.months_ahead, mode=args.mode))
+    except Error as e:
+        logger.error("Schema maintenance failed: %s", e)
+        raise SystemExit(1)
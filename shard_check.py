@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+shard_check.py
+
+Verificação multi-processo do modo shard (sharding.py) contra um MySQL real:
+- Sobe N réplicas (processos) com ShardCoordinator e lease curto; cada ciclo
+  registra em shard_check_log quais shards a réplica "coletou" e o intervalo
+  (relógio do banco) em que fez isso
+- Depois de --settle segundos mata uma réplica com SIGKILL (sem release(),
+  como um crash de verdade) e espera o lease dela vencer
+- Checagens (sai com código 1 se alguma falhar):
+    * claims disjuntos: nenhum shard coletado por duas réplicas em
+      intervalos sobrepostos
+    * cobertura: todos os shards coletados antes do kill
+    * takeover: os shards da réplica morta voltam a ser coletados por
+      sobreviventes depois do kill, em até lease + folga
+    * no fim, todos os shards com dono vivo e nenhum acima da cota justa
+
+ATENÇÃO: zera scrape_shards/scrape_replicas do banco configurado. Rode num
+banco de teste ou com as réplicas de produção paradas (--force para
+ignorar a trava de réplicas vivas).
+
+Exemplos:
+    docker compose --profile check run --rm shard_check
+    MYSQL_HOST=localhost MYSQL_PORT=3307 python shard_check.py
+    python shard_check.py --replicas 5 --shards 32 --lease 4 --settle 15
+"""
+
+import os
+import sys
+import math
+import time
+import signal
+import logging
+import multiprocessing as mp
+from typing import Dict, List
+
+from mysql.connector import pooling
+
+from sharding import ShardCoordinator, ensure_shard_tables
+
+# -------------------- Config (ENV-friendly) --------------------
+MYSQL_HOST = os.getenv("MYSQL_HOST", "db")
+MYSQL_PORT = int(os.getenv("MYSQL_PORT", "3306"))
+MYSQL_USER = os.getenv("MYSQL_USER", "Acelino")
+MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "senha123")
+MYSQL_DB = os.getenv("MYSQL_DB", "projet_crypto")
+# duração do "trabalho" de cada ciclo e pausa entre ciclos (segundos)
+SHARD_CHECK_WORK_SEC = float(os.getenv("SHARD_CHECK_WORK_SEC", "0.3"))
+SHARD_CHECK_CYCLE_SEC = float(os.getenv("SHARD_CHECK_CYCLE_SEC", "0.5"))
+# --------------------------------------------------------------
+
+LOG_DDL = """
+CREATE TABLE IF NOT EXISTS shard_check_log (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    shard_id INT NOT NULL,
+    replica_id VARCHAR(128) NOT NULL,
+    started_at DATETIME(3) NOT NULL,
+    finished_at DATETIME(3) NOT NULL,
+    KEY idx_shard (shard_id, started_at)
+)
+"""
+
+
+def make_pool(name: str, size: int = 2):
+    return pooling.MySQLConnectionPool(
+        pool_name=name, pool_size=size,
+        host=MYSQL_HOST, port=MYSQL_PORT, user=MYSQL_USER, password=MYSQL_PASSWORD,
+        database=MYSQL_DB, autocommit=False,
+    )
+
+
+def query(pool, sql: str, params=None):
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params or ())
+        rows = cursor.fetchall()
+        conn.commit()
+        return rows
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ---------- Réplica ----------
+def replica(replica_id: str, shard_count: int, lease_sec: int, heartbeat_sec: float,
+            deadline: float) -> None:
+    """Processo-réplica: claim → "coleta" (registra os shards no log) → espera."""
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"),
+                        format="%(asctime)s %(levelname)s [" + replica_id + "] %(message)s")
+    pool = make_pool("shard_check_" + replica_id, 2)
+    coord = ShardCoordinator(pool, replica_id, shard_count=shard_count,
+                             lease_sec=lease_sec, heartbeat_sec=heartbeat_sec,
+                             heartbeat_pool=make_pool("shard_check_hb_" + replica_id, 1))
+    coord.start_heartbeat()
+    try:
+        while time.time() < deadline:
+            owned = coord.claim()
+            if owned:
+                started = query(pool, "SELECT NOW(3)")[0][0]
+                time.sleep(SHARD_CHECK_WORK_SEC)
+                conn = pool.get_connection()
+                cursor = conn.cursor()
+                try:
+                    cursor.executemany(
+                        "INSERT INTO shard_check_log (shard_id, replica_id, started_at, finished_at) "
+                        "VALUES (%s, %s, %s, NOW(3))",
+                        [(s, replica_id, started) for s in owned],
+                    )
+                    conn.commit()
+                finally:
+                    cursor.close()
+                    conn.close()
+            time.sleep(SHARD_CHECK_CYCLE_SEC)
+    finally:
+        coord.stop_heartbeat()
+        coord.release()
+
+
+# ---------- Checagens ----------
+def overlaps(pool) -> List[tuple]:
+    """Pares (shard, réplica A, réplica B) coletados ao mesmo tempo por réplicas diferentes."""
+    return query(pool, """
+        SELECT a.shard_id, a.replica_id, b.replica_id, a.started_at, b.started_at
+        FROM shard_check_log a
+        JOIN shard_check_log b
+          ON a.shard_id = b.shard_id AND a.replica_id < b.replica_id
+         AND a.started_at < b.finished_at AND b.started_at < a.finished_at
+        LIMIT 20
+    """)
+
+
+def shards_seen(pool, since=None, until=None, replicas=None) -> Dict[int, object]:
+    """shard_id -> primeiro started_at no intervalo (opcionalmente só destas réplicas)."""
+    sql = "SELECT shard_id, MIN(started_at) FROM shard_check_log WHERE 1=1"
+    params: List = []
+    if since is not None:
+        sql += " AND started_at >= %s"
+        params.append(since)
+    if until is not None:
+        sql += " AND started_at <= %s"
+        params.append(until)
+    if replicas:
+        sql += " AND replica_id IN (" + ",".join(["%s"] * len(replicas)) + ")"
+        params.extend(replicas)
+    return dict(query(pool, sql + " GROUP BY shard_id", params))
+
+
+def reset(pool, shard_count: int, force: bool) -> None:
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_shard_tables(cursor, shard_count)
+        cursor.execute(LOG_DDL)
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM scrape_shards WHERE owner IS NOT NULL AND lease_until >= NOW(3)")
+        live = cursor.fetchone()[0]
+        if live and not force:
+            raise SystemExit("%d shard(s) com lease vivo: pare as réplicas ou use --force" % live)
+        cursor.execute("DELETE FROM scrape_replicas")
+        cursor.execute("UPDATE scrape_shards SET owner = NULL, lease_until = NULL")
+        cursor.execute("TRUNCATE TABLE shard_check_log")
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def run_check(replicas: int, shard_count: int, lease_sec: int, settle: float, force: bool) -> int:
+    pool = make_pool("shard_check_main", 2)
+    reset(pool, shard_count, force)
+    heartbeat_sec = max(0.5, lease_sec / 3.0)
+    grace = lease_sec + heartbeat_sec + 2 * (SHARD_CHECK_WORK_SEC + SHARD_CHECK_CYCLE_SEC) + 2
+    deadline = time.time() + settle + grace + 3
+
+    ids = ["check-%d" % i for i in range(replicas)]
+    procs = {
+        rid: mp.Process(target=replica, args=(rid, shard_count, lease_sec, heartbeat_sec, deadline), daemon=True)
+        for rid in ids
+    }
+    for p in procs.values():
+        p.start()
+    failures: List[str] = []
+    try:
+        time.sleep(settle)
+        victim = ids[0]
+        victim_shards = [r[0] for r in query(pool, "SELECT shard_id FROM scrape_shards WHERE owner = %s", (victim,))]
+        killed_at = query(pool, "SELECT NOW(3)")[0][0]
+        os.kill(procs[victim].pid, signal.SIGKILL)
+        procs[victim].join()
+        print("killed %s at %s holding shards %s" % (victim, killed_at, victim_shards))
+
+        before = shards_seen(pool, until=killed_at)
+        missing = sorted(set(range(shard_count)) - set(before))
+        if missing:
+            failures.append("shards never scraped before the kill: %s" % missing)
+        if not victim_shards:
+            failures.append("victim %s held no shards at kill time (increase --settle)" % victim)
+
+        time.sleep(grace)
+        survivors = ids[1:]
+        after = shards_seen(pool, since=killed_at, replicas=survivors)
+        orphaned = sorted(set(victim_shards) - set(after))
+        if orphaned:
+            failures.append("shards not taken over within %.1fs: %s" % (grace, orphaned))
+        else:
+            takeover = max(((after[s] - killed_at).total_seconds() for s in victim_shards), default=0.0)
+            print("takeover of %d shard(s) in %.2fs (lease %ss)" % (len(victim_shards), takeover, lease_sec))
+
+        owners = query(pool, "SELECT owner, COUNT(*) FROM scrape_shards "
+                             "WHERE owner IS NOT NULL AND lease_until >= NOW(3) GROUP BY owner")
+        held = dict(owners)
+        fair = int(math.ceil(shard_count / float(len(survivors))))
+        if sum(held.values()) != shard_count:
+            failures.append("only %d/%d shards leased at the end: %s" % (sum(held.values()), shard_count, held))
+        if set(held) - set(survivors):
+            failures.append("dead replica still holds live leases: %s" % held)
+        over = {o: n for o, n in held.items() if n > fair}
+        if over:
+            failures.append("replicas above fair share %d: %s" % (fair, over))
+        print("final leases: %s" % held)
+    finally:
+        for p in procs.values():
+            p.join(timeout=max(0.0, deadline - time.time()) + lease_sec)
+            if p.is_alive():
+                p.terminate()
+
+    dup = overlaps(pool)
+    for shard_id, a, b, ta, tb in dup:
+        failures.append("shard %d scraped concurrently by %s (%s) and %s (%s)" % (shard_id, a, ta, b, tb))
+    if not dup:
+        print("claims disjoint: no shard scraped by two replicas at once")
+
+    for f in failures:
+        print("FAIL: %s" % f)
+    print("OK" if not failures else "FAILED (%d)" % len(failures))
+    return 1 if failures else 0
+
+
+# ------------------ CLI ------------------
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Multi-process check of shard claims and lease takeover")
+    parser.add_argument("--replicas", type=int, default=4, help="Processos-réplica (mín. 2)")
+    parser.add_argument("--shards", type=int, default=16, help="Número de shards")
+    parser.add_argument("--lease", type=int, default=3, help="Lease em segundos (curto para o teste)")
+    parser.add_argument("--settle", type=float, default=10.0, help="Segundos até matar uma réplica")
+    parser.add_argument("--force", action="store_true", help="Zera os leases mesmo com réplicas vivas")
+    args = parser.parse_args()
+    if args.replicas < 2:
+        parser.error("--replicas must be >= 2")
+    sys.exit(run_check(args.replicas, args.shards, args.lease, args.settle, args.force))
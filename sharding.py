@@ -0,0 +1,385 @@
+"""
+sharding.py
+
+Coordenação de várias réplicas do scraper (yahoo_scraper.py --shard-mode) sem
+gravar cada linha duas vezes:
+- O universo de tickers (o mesmo --tickers em todas as réplicas) é dividido em
+  SHARD_COUNT shards fixos por crc32(ticker) % SHARD_COUNT
+- Tabela `scrape_shards`: um lease por shard (owner, lease_until, epoch). O claim
+  usa SELECT ... FOR UPDATE SKIP LOCKED, então réplicas concorrentes pegam
+  shards diferentes sem esperar umas pelas outras
+- Tabela `scrape_replicas`: heartbeat por réplica; a fatia justa de cada uma é
+  ceil(SHARD_COUNT / réplicas vivas). Quem tem shards demais solta o excesso no
+  próximo claim e as réplicas novas assumem
+- Uma thread renova os leases a cada SHARD_HEARTBEAT_SEC durante o ciclo; lease
+  vencido (réplica morta) é retomado por outra réplica no claim seguinte
+  (epoch + 1). O heartbeat usa um pool próprio (heartbeat_pool, 1 conexão):
+  no pool do scraper ele disputaria conexão com o flush e tomaria PoolError
+  justo quando o ciclo está mais carregado
+
+Os relógios são sempre os do MySQL (NOW(3)), não os das réplicas. Todas as
+réplicas devem usar o mesmo SHARD_COUNT. Numa troca de dono no meio de um ciclo
+o pior caso é o mesmo ticker coletado por duas réplicas: o UPSERT em
+raw_crypto é idempotente.
+"""
+
+import os
+import math
+import time
+import zlib
+import socket
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from mysql.connector import Error
+
+# -------------------- Config (ENV-friendly) --------------------
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "16"))
+SHARD_LEASE_SEC = int(os.getenv("SHARD_LEASE_SEC", "90"))
+SHARD_HEARTBEAT_SEC = float(os.getenv("SHARD_HEARTBEAT_SEC", "30"))
+# intervalo entre ciclos de coleta no modo shard
+SHARD_CYCLE_SEC = float(os.getenv("SHARD_CYCLE_SEC", "300"))
+SCRAPER_REPLICA_ID = os.getenv("SCRAPER_REPLICA_ID", "")
+# --------------------------------------------------------------
+
+# réplicas sem heartbeat há mais que isso são apagadas de scrape_replicas
+REPLICA_PRUNE_FACTOR = 20
+
+logger = logging.getLogger("pipeline.sharding")
+
+
+def default_replica_id() -> str:
+    return SCRAPER_REPLICA_ID or "%s-%d" % (socket.gethostname(), os.getpid())
+
+def shard_of(ticker: str, shard_count: int = SHARD_COUNT) -> int:
+    """Shard estável do ticker (crc32; hash() do Python muda entre processos)."""
+    return zlib.crc32(ticker.encode("utf-8")) % shard_count
+
+def ensure_shard_tables(cursor, shard_count: int = SHARD_COUNT) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scrape_shards (
+            shard_id SMALLINT UNSIGNED NOT NULL PRIMARY KEY,
+            owner VARCHAR(64) NULL,
+            lease_until DATETIME(3) NULL,
+            claimed_at DATETIME(3) NULL,
+            epoch BIGINT UNSIGNED NOT NULL DEFAULT 0,
+            KEY idx_lease (lease_until)
+        ) ENGINE=InnoDB
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scrape_replicas (
+            replica_id VARCHAR(64) NOT NULL PRIMARY KEY,
+            heartbeat_at DATETIME(3) NOT NULL,
+            started_at DATETIME(3) NOT NULL
+        ) ENGINE=InnoDB
+        """
+    )
+    cursor.executemany("INSERT IGNORE INTO scrape_shards (shard_id) VALUES (%s)",
+                       [(i,) for i in range(shard_count)])
+    cursor.execute("DELETE FROM scrape_shards WHERE shard_id >= %s", (shard_count,))
+
+
+class ShardCoordinator:
+    """Leases de shards de uma réplica. claim() a cada ciclo; heartbeat em thread própria."""
+
+    def __init__(self, pool, replica_id: Optional[str] = None, shard_count: int = SHARD_COUNT,
+                 lease_sec: int = SHARD_LEASE_SEC, heartbeat_sec: float = SHARD_HEARTBEAT_SEC,
+                 heartbeat_pool=None):
+        if heartbeat_sec >= lease_sec:
+            raise ValueError("SHARD_HEARTBEAT_SEC deve ser menor que SHARD_LEASE_SEC")
+        self.pool = pool
+        # sem pool dedicado o heartbeat divide o `pool` (ok só quando nada mais o usa)
+        self.heartbeat_pool = heartbeat_pool or pool
+        self.replica_id = replica_id or default_replica_id()
+        self.shard_count = shard_count
+        self.lease_sec = lease_sec
+        self.heartbeat_sec = heartbeat_sec
+        self.owned: List[int] = []
+        self.stats = {"claims": 0, "acquired": 0, "taken_over": 0, "released": 0, "lost": 0, "heartbeat_errors": 0}
+        self._lock = threading.Lock()
+        # claim() e heartbeat() não se intercalam (senão o heartbeat conta como perdido o excesso solto)
+        self._claim_lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- banco ----------
+    def ensure_tables(self) -> None:
+        conn = self.pool.get_connection()
+        cursor = conn.cursor()
+        try:
+            ensure_shard_tables(cursor, self.shard_count)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _beat(self, cursor) -> None:
+        cursor.execute(
+            "INSERT INTO scrape_replicas (replica_id, heartbeat_at, started_at) VALUES (%s, NOW(3), NOW(3)) "
+            "ON DUPLICATE KEY UPDATE heartbeat_at = NOW(3)",
+            (self.replica_id,),
+        )
+
+    def claim(self) -> List[int]:
+        """
+        Ajusta os leases desta réplica à fatia justa: renova os que já tem, solta o
+        excesso e pega shards livres ou vencidos (SKIP LOCKED). Retorna os shards
+        em posse.
+        """
+        with self._claim_lock:
+            return self._claim()
+
+    def _claim(self) -> List[int]:
+        conn = self.pool.get_connection()
+        cursor = conn.cursor()
+        try:
+            self._beat(cursor)
+            cursor.execute("DELETE FROM scrape_replicas WHERE heartbeat_at < NOW(3) - INTERVAL %s SECOND",
+                           (self.lease_sec * REPLICA_PRUNE_FACTOR,))
+            cursor.execute("SELECT COUNT(*) FROM scrape_replicas WHERE heartbeat_at >= NOW(3) - INTERVAL %s SECOND",
+                           (self.lease_sec,))
+            live = max(1, int(cursor.fetchone()[0]))
+            conn.commit()
+            fair = math.ceil(self.shard_count / live)
+
+            # em READ COMMITTED o InnoDB solta o lock das linhas lidas que não casam
+            # com o WHERE; em REPEATABLE READ o scan travaria a tabela toda e o
+            # SKIP LOCKED das outras réplicas não acharia nada
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+
+            # os meus primeiro (mesmo vencidos, se ninguém pegou): menos troca de dono
+            cursor.execute(
+                "SELECT shard_id FROM scrape_shards WHERE owner = %s ORDER BY shard_id FOR UPDATE SKIP LOCKED",
+                (self.replica_id,),
+            )
+            mine = [r[0] for r in cursor.fetchall()]
+            keep, surplus = mine[:fair], mine[fair:]
+            if surplus:
+                cursor.execute(
+                    "UPDATE scrape_shards SET owner = NULL, lease_until = NULL WHERE owner = %s AND shard_id IN (%s)"
+                    % ("%s", ",".join(["%s"] * len(surplus))),
+                    (self.replica_id, *surplus),
+                )
+            acquired: List[int] = []
+            if len(keep) < fair:
+                cursor.execute(
+                    "SELECT shard_id, owner FROM scrape_shards "
+                    "WHERE (owner IS NULL OR lease_until < NOW(3)) AND NOT (owner <=> %s) "
+                    "ORDER BY shard_id LIMIT %s FOR UPDATE SKIP LOCKED",
+                    (self.replica_id, fair - len(keep)),
+                )
+                free = cursor.fetchall()
+                acquired = [r[0] for r in free]
+                self.stats["taken_over"] += sum(1 for _, owner in free if owner is not None)
+                if acquired:
+                    cursor.execute(
+                        "UPDATE scrape_shards SET owner = %%s, claimed_at = NOW(3), epoch = epoch + 1 "
+                        "WHERE shard_id IN (%s)" % ",".join(["%s"] * len(acquired)),
+                        (self.replica_id, *acquired),
+                    )
+            owned = sorted(keep + acquired)
+            if owned:
+                cursor.execute(
+                    "UPDATE scrape_shards SET lease_until = NOW(3) + INTERVAL %%s SECOND WHERE shard_id IN (%s)"
+                    % ",".join(["%s"] * len(owned)),
+                    (self.lease_sec, *owned),
+                )
+            conn.commit()
+        except Error:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        with self._lock:
+            self.owned = owned
+        self.stats["claims"] += 1
+        self.stats["acquired"] += len(acquired)
+        self.stats["released"] += len(surplus)
+        logger.info("Replica %s holds shards %s (live=%d fair=%d +%d -%d)",
+                    self.replica_id, owned, live, fair, len(acquired), len(surplus))
+        return owned
+
+    def heartbeat(self) -> List[int]:
+        """Renova os leases em posse; shards que outra réplica assumiu saem de `owned`."""
+        with self._claim_lock:
+            return self._heartbeat()
+
+    def _heartbeat(self) -> List[int]:
+        with self._lock:
+            owned = list(self.owned)
+        conn = self.heartbeat_pool.get_connection()
+        cursor = conn.cursor()
+        try:
+            self._beat(cursor)
+            held = owned
+            if owned:
+                marks = ",".join(["%s"] * len(owned))
+                cursor.execute(
+                    "UPDATE scrape_shards SET lease_until = NOW(3) + INTERVAL %%s SECOND "
+                    "WHERE owner = %%s AND shard_id IN (%s)" % marks,
+                    (self.lease_sec, self.replica_id, *owned),
+                )
+                if cursor.rowcount != len(owned):
+                    cursor.execute("SELECT shard_id FROM scrape_shards WHERE owner = %%s AND shard_id IN (%s)" % marks,
+                                   (self.replica_id, *owned))
+                    held = sorted(r[0] for r in cursor.fetchall())
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        lost = sorted(set(owned) - set(held))
+        if lost:
+            self.stats["lost"] += len(lost)
+            logger.warning("Replica %s lost shards %s (lease taken over)", self.replica_id, lost)
+            with self._lock:
+                self.owned = [s for s in self.owned if s not in lost]
+        return held
+
+    def release(self) -> None:
+        """Solta todos os leases (saída limpa): as outras réplicas assumem sem esperar expirar."""
+        conn = self.pool.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE scrape_shards SET owner = NULL, lease_until = NULL WHERE owner = %s",
+                           (self.replica_id,))
+            cursor.execute("DELETE FROM scrape_replicas WHERE replica_id = %s", (self.replica_id,))
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            self.owned = []
+        logger.info("Replica %s released its shards", self.replica_id)
+
+    # ---------- tickers ----------
+    def owns(self, ticker: str) -> bool:
+        with self._lock:
+            return shard_of(ticker, self.shard_count) in self.owned
+
+    def tickers_for(self, universe: List[str]) -> List[str]:
+        """Recorte do universo que cabe a esta réplica (ordem original)."""
+        return [t for t in universe if self.owns(t)]
+
+    # ---------- thread de heartbeat ----------
+    def _run_heartbeat(self) -> None:
+        while not self._done.wait(self.heartbeat_sec):
+            try:
+                self.heartbeat()
+            except Error as e:
+                # segue tentando: o lease só vence depois de SHARD_LEASE_SEC
+                self.stats["heartbeat_errors"] += 1
+                logger.warning("Shard heartbeat failed: %s", e)
+
+    def start_heartbeat(self) -> None:
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run_heartbeat, daemon=True, name="shard-heartbeat")
+        self._thread.start()
+
+    def stop_heartbeat(self) -> None:
+        self._done.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def run_sharded(pool, universe: List[str], cycle: Callable[[List[str]], Dict],
+                replica_id: Optional[str] = None, cycle_sec: float = SHARD_CYCLE_SEC,
+                max_cycles: Optional[int] = None, stop: Optional[threading.Event] = None,
+                coordinator: Optional[ShardCoordinator] = None, heartbeat_pool=None) -> Dict:
+    """
+    Loop do modo shard até `stop` ser sinalizado, Ctrl+C ou max_cycles.
+    A cada ciclo: claim() e cycle(tickers_do_shard) (ex.: scrape_and_store).
+    Na saída os leases são soltos.
+    """
+    stop = stop or threading.Event()
+    coord = coordinator or ShardCoordinator(pool, replica_id, heartbeat_pool=heartbeat_pool)
+    coord.ensure_tables()
+    stats = {"cycles": 0, "idle_cycles": 0, "claim_errors": 0, "cycle_errors": 0, "tickers": 0}
+    coord.start_heartbeat()
+    try:
+        while not stop.is_set() and (max_cycles is None or stats["cycles"] < max_cycles):
+            started = time.monotonic()
+            try:
+                coord.claim()
+            except Error as e:
+                # sem claim não há o que coletar: mantém os leases antigos até vencerem
+                stats["claim_errors"] += 1
+                logger.warning("Shard claim failed: %s", e)
+            tickers = coord.tickers_for(universe)
+            stats["cycles"] += 1
+            if tickers:
+                stats["tickers"] += len(tickers)
+                try:
+                    cycle(tickers)
+                except Exception as e:
+                    # um ciclo ruim (ex.: banco fora no flush) não derruba a réplica: segue no loop
+                    stats["cycle_errors"] += 1
+                    logger.exception("Shard cycle failed for %d tickers: %s", len(tickers), e)
+            else:
+                stats["idle_cycles"] += 1
+                logger.info("Replica %s has no tickers this cycle", coord.replica_id)
+            if max_cycles is not None and stats["cycles"] >= max_cycles:
+                break
+            stop.wait(max(0.0, cycle_sec - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        logger.info("Shard loop interrupted")
+    finally:
+        coord.stop_heartbeat()
+        try:
+            coord.release()
+        except Error as e:
+            logger.warning("Could not release shards (they expire in %ss): %s", coord.lease_sec, e)
+    stats.update({"replica_id": coord.replica_id, **coord.stats})
+    logger.info("Shard loop finished: %s", stats)
+    return stats
+
+
+def shard_status(pool) -> List[Dict]:
+    """Estado atual dos leases (para inspeção/CLI)."""
+    conn = pool.get_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT shard_id, owner, lease_until, claimed_at, epoch, lease_until >= NOW(3) AS live "
+            "FROM scrape_shards ORDER BY shard_id"
+        )
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ------------------ CLI ------------------
+if __name__ == "__main__":
+    import argparse
+    from mysql.connector import pooling
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Inspect scraper shard leases")
+    parser.add_argument("--tickers", help="Mostra também o shard de cada ticker desta lista")
+    args = parser.parse_args()
+
+    pool = pooling.MySQLConnectionPool(
+        pool_name="sharding_pool", pool_size=1,
+        host=os.getenv("MYSQL_HOST", "db"), port=int(os.getenv("MYSQL_PORT", "3306")),
+        user=os.getenv("MYSQL_USER", "Acelino"), password=os.getenv("MYSQL_PASSWORD", "senha123"),
+        database=os.getenv("MYSQL_DB", "projet_crypto"), autocommit=False,
+    )
+    rows = shard_status(pool)
+    by_shard: Dict[int, List[str]] = {}
+    if args.tickers:
+        for t in (s.strip() for s in args.tickers.split(",") if s.strip()):
+            by_shard.setdefault(shard_of(t, len(rows) or SHARD_COUNT), []).append(t)
+    for r in rows:
+        print("%3d %-30s %-8s epoch=%-5d until=%s %s" % (
+            r["shard_id"], r["owner"] or "-", "live" if r["live"] else "free", r["epoch"],
+            r["lease_until"], ",".join(by_shard.get(r["shard_id"], []))))
@@ -0,0 +1,227 @@
+"""
+spool.py
+
+Write-ahead spool local para não perder dados já baixados quando o MySQL cai:
+- Antes da escrita no banco, as linhas preparadas de cada (scrape_id, ticker)
+  viram um segmento append-only em SPOOL_DIR (tmp + fsync + rename)
+- O segmento é apagado quando o flush que o contém é comitado
+- Se o flush falha, o segmento fica; replay() reenvia os segmentos em ordem
+  (mais antigo primeiro) como upserts em lote, na inicialização e
+  periodicamente (SPOOL_REPLAY_INTERVAL_SEC) após flushes bem-sucedidos
+- Tamanho limitado (SPOOL_MAX_BYTES): ao estourar, descarta os mais antigos
+- Métricas de replay: segmentos, linhas, linhas/s, pendentes
+- Linhas com run_id 0 (run não registrado, banco fora) recebem o run_id real
+  no replay via resolve_run(scrape_id)
+
+Formato do segmento (JSON lines):
+    {"v": 2, "scrape_id": ..., "ticker": ..., "rows": n, "created": ...}
+    [valor, valor, {"$dt": "2024-01-01T10:00:00"}, ...]   # uma linha por tupla
+v1 (colunas source/scrape_id/quality_flags/created_at) é convertido no replay.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import runs
+from write_buffer import upsert_rows, WRITE_BUFFER_ROWS, WRITE_BUFFER_STATEMENT_ROWS
+
+# -------------------- Config (ENV-friendly) --------------------
+SPOOL_DIR = os.getenv("SPOOL_DIR", ".spool")
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(256 * 1024 * 1024)))
+SPOOL_REPLAY_INTERVAL_SEC = float(os.getenv("SPOOL_REPLAY_INTERVAL_SEC", "300"))
+SPOOL_ENABLED = os.getenv("SPOOL_ENABLED", "1") == "1"
+# --------------------------------------------------------------
+
+SEGMENT_VERSION = 2
+SEGMENT_SUFFIX = ".seg"
+# posição de run_id nas tuplas do UPSERT_SQL de raw_crypto
+RUN_ID_COL = 6
+
+logger = logging.getLogger("pipeline.spool")
+
+
+def _encode(v):
+    return {"$dt": v.isoformat()} if isinstance(v, datetime) else v
+
+def _decode(v):
+    return datetime.fromisoformat(v["$dt"]) if isinstance(v, dict) and "$dt" in v else v
+
+def _upgrade_v1(row: tuple) -> tuple:
+    """v1: (..., timestamp, source, scrape_id, is_valid, quality_flags, created_at) -> layout atual."""
+    bits = (runs.QB_NULL_PRICE if row[2] is None else 0) | (runs.QB_ZERO_VOLUME if row[4] == 0 else 0)
+    return row[:6] + (runs.UNREGISTERED_RUN, row[8], bits)
+
+
+class Spool:
+
+    def __init__(self, directory: str = SPOOL_DIR, max_bytes: int = SPOOL_MAX_BYTES,
+                 replay_interval_sec: float = SPOOL_REPLAY_INTERVAL_SEC,
+                 resolve_run: Optional[Callable[[str], int]] = None):
+        self.directory = directory
+        self.resolve_run = resolve_run
+        self.max_bytes = max_bytes
+        self.replay_interval_sec = replay_interval_sec
+        self.stats = {"spooled_segments": 0, "dropped_segments": 0, "replayed_segments": 0,
+                      "replayed_rows": 0, "replay_sec": 0.0}
+        self._last_replay = 0.0
+        self._run_ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # ---------- escrita ----------
+    def append(self, scrape_id: str, ticker: str, rows: Sequence[tuple]) -> Optional[str]:
+        """Grava o segmento de forma durável. Retorna o caminho (None se não coube no limite)."""
+        if not rows:
+            return None
+        header = {"v": SEGMENT_VERSION, "scrape_id": scrape_id, "ticker": ticker,
+                  "rows": len(rows), "created": datetime.utcnow().isoformat()}
+        lines = [json.dumps(header)] + [json.dumps([_encode(v) for v in r]) for r in rows]
+        payload = ("\n".join(lines) + "\n").encode()
+        if len(payload) > self.max_bytes:
+            logger.error("Segment for %s (%d bytes) exceeds SPOOL_MAX_BYTES; not spooled", ticker, len(payload))
+            return None
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", ticker)
+        name = "%020d_%s_%s%s" % (time.time_ns(), scrape_id, safe, SEGMENT_SUFFIX)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            self._enforce_bound(len(payload))
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            self._fsync_dir()
+            self.stats["spooled_segments"] += 1
+        return path
+
+    def commit(self, paths: Sequence[str]) -> None:
+        """Dados comitados no banco: remove os segmentos."""
+        for p in paths:
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def _enforce_bound(self, incoming: int) -> None:
+        segs = self.segments()
+        total = sum(os.path.getsize(p) for p in segs)
+        while segs and total + incoming > self.max_bytes:
+            oldest = segs.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            self.stats["dropped_segments"] += 1
+            logger.error("Spool full: dropped oldest segment %s", os.path.basename(oldest))
+
+    def _fsync_dir(self) -> None:
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return  # Windows não permite abrir diretórios
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # ---------- leitura / replay ----------
+    def segments(self) -> List[str]:
+        """Segmentos pendentes, mais antigo primeiro (nome começa com time_ns)."""
+        return sorted(
+            os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX)
+        )
+
+    @staticmethod
+    def read(path: str) -> Tuple[Dict, List[tuple]]:
+        with open(path) as f:
+            header = json.loads(f.readline())
+            rows = [tuple(_decode(v) for v in json.loads(line)) for line in f if line.strip()]
+        return header, rows
+
+    def replay(self, pool, sql: str, max_rows: int = WRITE_BUFFER_ROWS or 20000,
+               statement_rows: int = WRITE_BUFFER_STATEMENT_ROWS) -> Dict:
+        """
+        Reenvia segmentos pendentes, mais antigo primeiro, agrupando até max_rows
+        linhas por transação. Para no primeiro erro de banco (tenta de novo depois).
+        """
+        start = time.time()
+        self._last_replay = start
+        pending = self.segments()
+        replayed_segs = replayed_rows = 0
+        i = 0
+        while i < len(pending):
+            batch_paths, batch_rows = [], []
+            while i < len(pending) and (not batch_rows or len(batch_rows) < max_rows):
+                try:
+                    header, rows = self.read(pending[i])
+                except (OSError, ValueError) as e:
+                    logger.error("Unreadable spool segment %s skipped: %s", pending[i], e)
+                    i += 1
+                    continue
+                if header.get("v") == 1:
+                    rows = [_upgrade_v1(r) for r in rows]
+                elif header.get("v") != SEGMENT_VERSION:
+                    logger.error("Spool segment %s has unsupported version %s", pending[i], header.get("v"))
+                    i += 1
+                    continue
+                rows = self._with_run_id(header, rows)
+                batch_paths.append(pending[i])
+                batch_rows.extend(rows)
+                i += 1
+            if not batch_rows:
+                continue
+            _, errors = upsert_rows(pool, sql, batch_rows, statement_rows)
+            if errors:
+                logger.warning("Spool replay stopped: DB still failing (%d segments pending)",
+                               len(pending) - replayed_segs)
+                break
+            self.commit(batch_paths)
+            replayed_segs += len(batch_paths)
+            replayed_rows += len(batch_rows)
+        elapsed = time.time() - start
+        with self._lock:
+            self.stats["replayed_segments"] += replayed_segs
+            self.stats["replayed_rows"] += replayed_rows
+            self.stats["replay_sec"] += elapsed
+        result = {
+            "segments": replayed_segs,
+            "rows": replayed_rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(replayed_rows / elapsed, 1) if elapsed > 0 and replayed_rows else 0.0,
+            "pending": len(self.segments()),
+        }
+        if replayed_segs or result["pending"]:
+            logger.info("Spool replay: %s", result)
+        return result
+
+    def _with_run_id(self, header: Dict, rows: List[tuple]) -> List[tuple]:
+        if not rows or rows[0][RUN_ID_COL] != runs.UNREGISTERED_RUN or self.resolve_run is None:
+            return rows
+        scrape_id = header.get("scrape_id") or ""
+        run_id = self._run_ids.get(scrape_id) or self.resolve_run(scrape_id)
+        if run_id == runs.UNREGISTERED_RUN:
+            return rows
+        self._run_ids[scrape_id] = run_id
+        return [r[:RUN_ID_COL] + (run_id,) + r[RUN_ID_COL + 1:] for r in rows]
+
+    def maybe_replay(self, pool, sql: str) -> Optional[Dict]:
+        """Replay periódico: no máximo uma vez por SPOOL_REPLAY_INTERVAL_SEC e só se houver pendências."""
+        if time.time() - self._last_replay < self.replay_interval_sec or not self.segments():
+            return None
+        return self.replay(pool, sql)
+
+    def summary(self) -> Dict:
+        """Métricas para o dict de stats da execução."""
+        rows, sec = self.stats["replayed_rows"], self.stats["replay_sec"]
+        return {
+            "spool_pending": len(self.segments()),
+            "spool_segments_written": self.stats["spooled_segments"],
+            "spool_dropped": self.stats["dropped_segments"],
+            "spool_replayed_rows": rows,
+            "spool_replay_rows_per_sec": round(rows / sec, 1) if sec > 0 and rows else 0.0,
+        }
@@ -0,0 +1,285 @@
+"""
+stream.py
+
+Modo near-real-time do scraper (yahoo_scraper.py --stream):
+- Um yf.download em lote (todos os tickers, barras de 1m) a cada STREAM_POLL_SEC
+- LatestBoard: cópia em memória do último preço por símbolo, servida por um
+  HTTP mínimo (GET /latest?symbols=..., GET /health) em STREAM_PORT
+- Tabela quente `latest_prices` (uma linha por símbolo): só recebe UPSERT
+  quando preço/volume/barra mudou
+- Na virada da hora (+ STREAM_ROLLUP_GRACE_SEC para a última barra fechar), as
+  barras de 1m da hora fechada vão para o callback `rollup` (o scraper agrega
+  em 1h e grava em `raw_crypto`); o histórico não é reescrito a cada poll
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import yfinance as yf
+
+import ratelimit
+import profiling
+from write_buffer import upsert_rows
+
+# -------------------- Config (ENV-friendly) --------------------
+STREAM_POLL_SEC = float(os.getenv("STREAM_POLL_SEC", "15"))
+STREAM_INTERVAL = os.getenv("STREAM_INTERVAL", "1m")
+STREAM_PORT = int(os.getenv("STREAM_PORT", "8000"))
+# espera após a virada da hora antes de consolidar (a barra 59 ainda chega atrasada)
+STREAM_ROLLUP_GRACE_SEC = int(os.getenv("STREAM_ROLLUP_GRACE_SEC", "120"))
+# --------------------------------------------------------------
+
+TABLE = "latest_prices"
+LATEST_UPSERT_SQL = """
+INSERT INTO latest_prices (symbol, price_usd, volume, bar_timestamp, updated_at)
+VALUES (%s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    price_usd = VALUES(price_usd),
+    volume = VALUES(volume),
+    bar_timestamp = VALUES(bar_timestamp),
+    updated_at = VALUES(updated_at)
+;
+"""
+
+logger = logging.getLogger("pipeline.stream")
+
+
+def ensure_latest_table(pool) -> None:
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS latest_prices (
+                symbol VARCHAR(20) NOT NULL PRIMARY KEY,
+                price_usd DECIMAL(20,8),
+                volume BIGINT,
+                bar_timestamp DATETIME NOT NULL,
+                updated_at DATETIME(3) NOT NULL
+            ) ENGINE=InnoDB
+            """
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ---------- Board em memória ----------
+class LatestBoard:
+    """
+    Último preço por símbolo. changed() diz se algo mudou (só então grava no banco);
+    apply() efetiva no board só depois que a gravação comitou, para o board e
+    latest_prices não divergirem quando o upsert falha.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def load(self, pool) -> int:
+        """Semeia com latest_prices (após restart não regrava o que já está lá)."""
+        conn = pool.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT symbol, price_usd, volume, bar_timestamp, updated_at FROM latest_prices")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            for symbol, price, volume, bar_ts, updated in rows:
+                self._data[symbol] = {"price_usd": float(price) if isinstance(price, Decimal) else price,
+                                      "volume": volume, "bar_timestamp": bar_ts, "updated_at": updated}
+        return len(rows)
+
+    def changed(self, symbol: str, price: float, volume: int, bar_ts: datetime) -> bool:
+        with self._lock:
+            cur = self._data.get(symbol)
+            return not cur or (cur["price_usd"], cur["volume"], cur["bar_timestamp"]) != (price, volume, bar_ts)
+
+    def apply(self, rows: List[tuple]) -> None:
+        """Efetiva linhas de LATEST_UPSERT_SQL (symbol, price, volume, bar_ts, updated_at) já gravadas."""
+        with self._lock:
+            for symbol, price, volume, bar_ts, now in rows:
+                self._data[symbol] = {"price_usd": price, "volume": volume, "bar_timestamp": bar_ts, "updated_at": now}
+
+    def snapshot(self, symbols: Optional[List[str]] = None) -> Dict[str, Optional[Dict]]:
+        with self._lock:
+            keys = symbols if symbols else sorted(self._data)
+            return {s: (dict(self._data[s]) if s in self._data else None) for s in keys}
+
+
+def _json(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+def serve_board(board: LatestBoard, port: int = STREAM_PORT) -> ThreadingHTTPServer:
+    """Sobe o HTTP de leitura do board numa thread daemon."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                body, code = {"status": "healthy"}, 200
+            elif url.path == "/latest":
+                raw = ",".join(parse_qs(url.query).get("symbols", []))
+                symbols = [s.strip() for s in raw.split(",") if s.strip()]
+                data = board.snapshot(symbols or None)
+                body = {"data": {s: ({k: _json(v) for k, v in e.items()} if e else None) for s, e in data.items()}}
+                code = 200
+            else:
+                body, code = {"error": "not found"}, 404
+            payload = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, fmt, *args):
+            logger.debug("board %s", fmt % args)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="board-http").start()
+    logger.info("Latest board served on :%d", port)
+    return server
+
+
+# ---------- Fetch em lote ----------
+def fetch_batch(tickers: List[str], start: datetime, interval: str = STREAM_INTERVAL) -> Dict[str, pd.DataFrame]:
+    """
+    Uma requisição para todo o universo. Retorna {ticker: df} com colunas
+    Open/High/Low/Close/Volume e índice UTC (sem linhas totalmente vazias).
+    Respeita o limiter/breaker do Yahoo (pode levantar ratelimit.CircuitOpenError).
+    """
+    limiter, breaker = ratelimit.for_host()
+    breaker.check()
+    limiter.acquire()
+    try:
+        with profiling.io("http"), ratelimit.capture_yf_errors() as errors:
+            raw = yf.download(tickers, start=start, interval=interval, auto_adjust=False,
+                              threads=False, progress=False)
+    except Exception as e:
+        limiter.on_failure(ratelimit.classify_failure(e))
+        breaker.record_failure()
+        raise
+    # o yf.download não levanta: 429/timeout só aparecem no log dele
+    kinds = {ratelimit.classify_failure(message=m) for m in errors}
+    failure = "throttle" if "throttle" in kinds else "timeout" if "timeout" in kinds else None
+    if failure:
+        limiter.on_failure(failure)
+        breaker.record_failure()
+        logger.warning("Batch fetch %s: %s", failure, "; ".join(errors))
+    else:
+        limiter.on_success()
+        breaker.record_success()
+    if raw is None or raw.empty:
+        return {}
+    out = {}
+    for t in tickers:
+        if isinstance(raw.columns, pd.MultiIndex):
+            if t not in raw.columns.get_level_values(-1):
+                continue
+            df = raw.xs(t, axis=1, level=-1)
+        else:
+            df = raw
+        df = df.dropna(how="all")
+        if df.empty:
+            continue
+        df.index = df.index.tz_localize("UTC") if df.index.tz is None else df.index.tz_convert("UTC")
+        out[t] = df
+    return out
+
+
+# ---------- Loop ----------
+def latest_changes(board: LatestBoard, frames: Dict[str, pd.DataFrame], now: datetime) -> List[tuple]:
+    """Linhas para LATEST_UPSERT_SQL só dos símbolos cujo último valor mudou (não altera o board)."""
+    rows = []
+    for symbol, df in frames.items():
+        closes = df["Close"].dropna() if "Close" in df.columns else pd.Series(dtype="float64")
+        if closes.empty:
+            continue
+        ts = closes.index[-1]
+        price = float(closes.iloc[-1])
+        vol = df["Volume"].get(ts) if "Volume" in df.columns else None
+        volume = 0 if vol is None or pd.isna(vol) else int(vol)
+        bar_ts = ts.tz_localize(None).to_pydatetime()
+        if board.changed(symbol, price, volume, bar_ts):
+            rows.append((symbol, price, volume, bar_ts, now))
+    return rows
+
+def run_stream(pool, tickers: List[str], rollup: Callable[[Dict[str, pd.DataFrame], datetime], None],
+               poll_sec: float = STREAM_POLL_SEC, port: Optional[int] = STREAM_PORT,
+               grace_sec: int = STREAM_ROLLUP_GRACE_SEC, stop: Optional[threading.Event] = None) -> Dict:
+    """
+    Loop de streaming até `stop` ser sinalizado (ou Ctrl+C).
+    rollup(frames, hour_start) recebe as barras de 1m da hora fechada [hour_start, +1h).
+    """
+    stop = stop or threading.Event()
+    ensure_latest_table(pool)
+    board = LatestBoard()
+    logger.info("Seeded latest board with %d symbols", board.load(pool))
+    server = serve_board(board, port) if port else None
+    stats = {"polls": 0, "written": 0, "unchanged": 0, "poll_errors": 0, "rollups": 0}
+    last_rolled: Optional[datetime] = None
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            now = datetime.utcnow()
+            # última hora fechada há mais de grace_sec; a janela do fetch sempre a cobre
+            closed_hour = (now - timedelta(seconds=grace_sec)).replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+            try:
+                frames = fetch_batch(tickers, start=closed_hour)
+            except Exception as e:
+                stats["poll_errors"] += 1
+                logger.warning("Stream poll failed: %s", e)
+                frames = None
+            if frames:
+                stats["polls"] += 1
+                rows = latest_changes(board, frames, now)
+                stats["unchanged"] += len(frames) - len(rows)
+                if rows:
+                    # upsert_rows devolve erros em vez de levantar; o resto é defensivo
+                    try:
+                        _, errors = upsert_rows(pool, LATEST_UPSERT_SQL, rows)
+                    except Exception as e:
+                        logger.warning("Latest prices write failed: %s", e)
+                        errors = 1
+                    if errors:
+                        # board intocado: as mesmas linhas saem como mudança no próximo poll
+                        stats["poll_errors"] += 1
+                    else:
+                        board.apply(rows)
+                        stats["written"] += len(rows)
+                if last_rolled is None or closed_hour > last_rolled:
+                    lo, hi = pd.Timestamp(closed_hour, tz="UTC"), pd.Timestamp(closed_hour + timedelta(hours=1), tz="UTC")
+                    closed = {t: df[(df.index >= lo) & (df.index < hi)] for t, df in frames.items()}
+                    closed = {t: df for t, df in closed.items() if not df.empty}
+                    try:
+                        if closed:
+                            rollup(closed, closed_hour)
+                            stats["rollups"] += 1
+                        last_rolled = closed_hour
+                    except Exception as e:
+                        # last_rolled não avança: a janela do próximo fetch ainda cobre a hora
+                        stats["poll_errors"] += 1
+                        logger.warning("Stream rollup of %s failed, retrying next poll: %s", closed_hour, e)
+            if stats["polls"] and stats["polls"] % 20 == 0:
+                logger.info("Stream stats: %s", stats)
+            stop.wait(max(0.0, poll_sec - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        logger.info("Stream interrupted")
+    finally:
+        if server is not None:
+            server.shutdown()
+    logger.info("Stream finished: %s", stats)
+    return stats
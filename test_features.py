@@ -0,0 +1,124 @@
+# test_features.py
+# pytest: cálculo vetorizado do compute_features e início do recálculo incremental do features.py (sem MySQL)
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import features
+from features import compute_features, feature_columns, incremental_start
+
+T0 = datetime(2024, 1, 1)
+
+
+def bars(closes, volumes=None, start=T0):
+    idx = [start + timedelta(hours=i) for i in range(len(closes))]
+    volumes = volumes if volumes is not None else [10] * len(closes)
+    return pd.DataFrame({"close": closes, "volume": volumes}, index=pd.Index(idx, name="timestamp"))
+
+
+# ---------- compute_features ----------
+def test_known_values():
+    out = compute_features(bars([1.0, 2.0, 4.0, 3.0], [10, 20, 30, 60]), windows=[3])
+    assert list(out.columns) == ["close"] + feature_columns([3])
+    assert np.isnan(out["log_return"].iloc[0])
+    assert out["log_return"].iloc[2] == pytest.approx(np.log(2))
+    assert out["ma_3"].isna().tolist() == [True, True, False, False]   # min_periods = janela
+    assert out["ma_3"].iloc[3] == pytest.approx(3.0)
+    assert out["volatility_3"].iloc[3] == pytest.approx(pd.Series(np.log([2, 2, 0.75])).std())   # ddof=1
+    # ganhos 1, 2 e perda 1 na janela: RSI = 100 - 100 / (1 + 1/(1/3))
+    assert out["rsi_3"].iloc[3] == pytest.approx(75.0)
+    assert out["volume_z_3"].iloc[3] == pytest.approx((60 - 110 / 3) / pd.Series([20, 30, 60]).std())
+
+
+def test_rsi_without_losses_and_flat_volume():
+    out = compute_features(bars([1.0, 2.0, 3.0, 4.0]), windows=[2])
+    assert out["rsi_2"].iloc[-1] == 100.0
+    assert out["volume_z_2"].isna().all()                               # desvio 0 não vira inf
+
+
+def test_non_positive_close_has_no_log_return():
+    out = compute_features(bars([1.0, 0.0, 2.0]), windows=[2])
+    assert out["log_return"].isna().all()
+
+
+def test_lookback_is_enough_for_incremental_recompute():
+    rng = np.random.default_rng(7)
+    closes = list(100 + rng.standard_normal(300).cumsum())
+    volumes = list(rng.integers(1, 1000, 300))
+    full = compute_features(bars(closes, volumes), windows=[5, 24])
+    start = 250
+    lookback = 24 + 1                                                    # max(janelas) + 1, como o update_features
+    tail = compute_features(bars(closes, volumes).iloc[start - lookback:], windows=[5, 24])
+    pd.testing.assert_frame_equal(tail.iloc[lookback:], full.iloc[start:])
+
+
+# ---------- Início incremental ----------
+def test_incremental_start():
+    last, old = T0 + timedelta(hours=100), T0 + timedelta(hours=10)
+    assert incremental_start(None, old) is None                          # sem features: build completo
+    assert incremental_start(last, None) == last
+    assert incremental_start(last, old) == old                           # barra antiga reescrita
+    assert incremental_start(last, last + timedelta(hours=5)) == last    # barras novas: desde a última
+
+
+class FakeCursor:
+    """raw_crypto em memória para o _load_bars + MAX(timestamp) do features_crypto."""
+
+    def __init__(self, raw, last_feature):
+        self.raw = raw
+        self.last_feature = last_feature
+        self._result = []
+
+    def execute(self, sql, params=()):
+        if "information_schema" in sql:
+            self._result = [(c,) for c in feature_columns([3])]
+        elif "MAX(`timestamp`) FROM features_crypto" in sql:
+            self._result = [(self.last_feature,)]
+        elif "`timestamp` < %s" in sql:
+            _, since, lookback = params
+            self._result = [r for r in reversed(self.raw) if r[0] < since][:lookback]
+        elif "`timestamp` >= %s" in sql:
+            self._result = [r for r in self.raw if r[0] >= params[1]]
+        else:
+            self._result = []
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0]
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def get_connection(self):
+        pool = self
+
+        class Conn:
+            def cursor(self):
+                return pool._cursor
+
+            def close(self):
+                pass
+        return Conn()
+
+
+def test_update_recomputes_from_rewritten_bar(monkeypatch):
+    raw = [(T0 + timedelta(hours=i), 100.0 + i, 10) for i in range(48)]
+    cursor = FakeCursor(raw, last_feature=T0 + timedelta(hours=47))
+    upserts = []
+    monkeypatch.setattr(features, "upsert_rows", lambda pool, sql, rows, n: upserts.append(rows) or (len(rows), 0))
+
+    written = features.update_features(FakePool(cursor), ["BTC-USD"], interval="1h", windows=[3],
+                                       changed={"BTC-USD": T0 + timedelta(hours=40)})
+    rows = upserts[0]
+    assert [r[2] for r in rows] == [T0 + timedelta(hours=h) for h in range(40, 48)]
+    assert written == {"BTC-USD": 8}
+    assert rows[0][5] == pytest.approx(139.0)                            # ma_3 usa o lookback carregado
@@ -0,0 +1,73 @@
+# test_negative_cache.py
+# pytest: limiar, agendamento exponencial de re-sonda e persistência do NegativeCache
+import json
+
+import pytest
+
+from negative_cache import NegativeCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return NegativeCache(str(tmp_path / "neg.json"), threshold=2, base_sec=100, max_sec=350)
+
+
+def test_skips_only_after_threshold(cache):
+    cache.record_empty("DEAD-USD", "1h", now=0)
+    assert not cache.should_skip("DEAD-USD", "1h", now=1)
+    cache.record_empty("DEAD-USD", "1h", now=10)
+    assert cache.should_skip("DEAD-USD", "1h", now=11)
+    assert not cache.should_skip("DEAD-USD", "1d", now=11)   # chave inclui o intervalo
+
+
+def test_exponential_reprobe_schedule_capped(cache):
+    delays = []
+    for i in range(6):
+        entry = cache.record_empty("DEAD-USD", "1h", now=1000 * i)
+        delays.append(entry["next_probe"] - 1000 * i)
+    assert delays == [0, 100, 200, 350, 350, 350]
+
+
+def test_probe_due_after_delay(cache):
+    cache.record_empty("DEAD-USD", "1h", now=0)
+    cache.record_empty("DEAD-USD", "1h", now=0)        # next_probe = 100
+    assert cache.should_skip("DEAD-USD", "1h", now=99)
+    assert not cache.should_skip("DEAD-USD", "1h", now=100)
+
+
+def test_hit_clears_entry(cache):
+    for _ in range(3):
+        cache.record_empty("REN-USD", "1h", now=0)
+    cache.record_hit("REN-USD", "1h")
+    assert not cache.should_skip("REN-USD", "1h", now=1)
+    assert cache.entries == {}
+
+
+def test_persisted_and_reloaded(cache, tmp_path):
+    cache.record_empty("DEAD-USD", "1h", now=0)
+    cache.record_empty("DEAD-USD", "1h", now=0)
+    cache.save()
+    reloaded = NegativeCache(cache.path, threshold=2, base_sec=100, max_sec=350)
+    assert reloaded.should_skip("DEAD-USD", "1h", now=50)
+    assert not (tmp_path / "neg.json.tmp").exists()
+
+
+def test_save_is_noop_when_clean(cache, tmp_path):
+    cache.save()
+    assert not (tmp_path / "neg.json").exists()
+
+
+def test_corrupt_file_starts_empty(tmp_path):
+    path = tmp_path / "neg.json"
+    path.write_text("{not json")
+    assert NegativeCache(str(path)).entries == {}
+
+
+def test_save_error_does_not_raise(tmp_path):
+    cache = NegativeCache(str(tmp_path / "missing_dir" / "neg.json"), threshold=1)
+    cache.record_empty("DEAD-USD", "1h", now=0)
+    cache.save()                                        # OSError vira warning
+    assert cache._dirty
+    (tmp_path / "missing_dir").mkdir()
+    cache.save()
+    assert "DEAD-USD|1h" in json.loads((tmp_path / "missing_dir" / "neg.json").read_text())
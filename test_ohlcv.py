@@ -0,0 +1,72 @@
+# test_ohlcv.py
+# pytest: agregação OHLCV sub-hora -> hora do resample_ohlcv
+import pandas as pd
+import pytest
+
+from ohlcv import resample_ohlcv
+
+
+def bars(start, n, freq="5min", tz="UTC"):
+    idx = pd.date_range(start, periods=n, freq=freq, tz=tz, name="Datetime")
+    return pd.DataFrame({
+        "Open": [10.0 + i for i in range(n)],
+        "High": [20.0 + i for i in range(n)],
+        "Low": [5.0 - i for i in range(n)],
+        "Close": [11.0 + i for i in range(n)],
+        "Volume": [10] * n,
+    }, index=idx)
+
+
+def test_five_minute_bars_to_hour():
+    df = bars("2024-01-01 10:00", 24)              # 10:00..11:55
+    out = resample_ohlcv(df, "1h")
+    assert list(out.index) == [pd.Timestamp("2024-01-01 10:00", tz="UTC"), pd.Timestamp("2024-01-01 11:00", tz="UTC")]
+    first = out.iloc[0]
+    assert first["Open"] == 10.0                   # primeira
+    assert first["High"] == 31.0                   # maior
+    assert first["Low"] == -6.0                    # menor
+    assert first["Close"] == 22.0                  # última
+    assert first["Volume"] == 120                  # soma
+    assert str(out["Volume"].dtype) == "Int64"
+    assert out.index.name == "Datetime"
+
+
+def test_partial_hours_only_create_bars_with_data():
+    df = pd.concat([bars("2024-01-01 10:50", 2), bars("2024-01-01 13:05", 1)])
+    out = resample_ohlcv(df, "1h")
+    assert [t.hour for t in out.index] == [10, 13]
+    assert list(out["Volume"]) == [20, 10]
+
+
+def test_aligned_unique_bars_returned_unchanged():
+    df = bars("2024-01-01 00:00", 3, freq="1h")
+    assert resample_ohlcv(df, "1h") is df
+
+
+def test_duplicate_aligned_bars_are_collapsed():
+    df = bars("2024-01-01 00:00", 2, freq="1h")
+    df = pd.concat([df, df.iloc[[1]].assign(Close=99.0, Volume=5)])
+    out = resample_ohlcv(df, "1h")
+    assert len(out) == 2
+    assert out.iloc[1]["Close"] == 99.0
+    assert out.iloc[1]["Volume"] == 15
+
+
+def test_naive_and_non_utc_index_grouped_in_utc():
+    naive = bars("2024-01-01 10:00", 12, tz=None)
+    assert resample_ohlcv(naive, "1h").index[0] == pd.Timestamp("2024-01-01 10:00", tz="UTC")
+    # 12:30 em Kolkata (UTC+5:30) = 07:00 UTC: a hora é a do UTC, não a local
+    kolkata = bars("2024-01-01 12:30", 12, tz="Asia/Kolkata")
+    assert resample_ohlcv(kolkata, "1h").index[0] == pd.Timestamp("2024-01-01 07:00", tz="UTC")
+
+
+def test_missing_columns_are_skipped():
+    df = bars("2024-01-01 10:00", 6)[["Close", "Volume"]]
+    out = resample_ohlcv(df, "1h")
+    assert list(out.columns) == ["Close", "Volume"]
+    assert out.iloc[0]["Close"] == 16.0
+
+
+@pytest.mark.parametrize("df", [None, pd.DataFrame()])
+def test_empty_input_passthrough(df):
+    assert resample_ohlcv(df) is df
@@ -0,0 +1,99 @@
+# test_panel.py
+# pytest: troca atômica do cache memory-mapped do panel.py (versões + meta.json por último), sem MySQL
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import panel
+from panel import _read_cache, _write_cache
+
+META = {"symbols": ["BTC-USD", "ETH-USD"], "field": "price_usd", "interval": "1h", "watermark": "2024-01-01"}
+
+
+def arrays(n, offset=0.0):
+    index = pd.date_range("2024-01-01", periods=n, freq="1h").values.astype("datetime64[ns]").astype("int64")
+    values = np.arange(n * 2, dtype="float64").reshape(n, 2) + offset
+    return index, values
+
+
+def versions(path):
+    return sorted(n for n in os.listdir(path) if n.startswith("v"))
+
+
+def test_roundtrip(tmp_path):
+    path = str(tmp_path / "cache")
+    index, values = arrays(3)
+    _write_cache(path, index, values, META)
+    got_index, got_values, meta = _read_cache(path)
+    assert np.array_equal(got_index, index) and np.array_equal(got_values, values)
+    assert isinstance(got_values, np.memmap)
+    assert meta["watermark"] == "2024-01-01" and meta["version"] in versions(path)
+    assert not os.path.exists(os.path.join(path, "meta.json.tmp"))
+
+
+def test_keeps_previous_version_and_drops_older(tmp_path):
+    path = str(tmp_path / "cache")
+    for n in (1, 2, 3):
+        _write_cache(path, *arrays(n), META)
+    assert len(versions(path)) == 2                    # corrente + a anterior (leitor em andamento)
+    index, values, meta = _read_cache(path)
+    assert len(index) == 3 and values.shape == (3, 2)
+    assert meta["version"] == versions(path)[-1]
+
+
+def test_reader_of_previous_version_still_works(tmp_path):
+    path = str(tmp_path / "cache")
+    _write_cache(path, *arrays(2), META)
+    old_index, old_values, _ = _read_cache(path)       # leitor abriu a versão 1
+    _write_cache(path, *arrays(5, offset=100), META)
+    assert len(old_index) == 2 and old_values[0, 0] == 0.0
+    index, values, _ = _read_cache(path)
+    assert len(index) == len(values) == 5 and values[0, 0] == 100.0
+
+
+def test_failed_write_leaves_previous_cache_consistent(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache")
+    _write_cache(path, *arrays(2), META)
+    real_save = np.save
+    calls = []
+
+    def flaky_save(file, arr):
+        calls.append(file)
+        if len(calls) == 2:                             # index gravado, values falha
+            raise OSError("disk full")
+        real_save(file, arr)
+    monkeypatch.setattr(panel.np, "save", flaky_save)
+    with pytest.raises(OSError):
+        _write_cache(path, *arrays(5, offset=100), META)
+    index, values, _ = _read_cache(path)
+    assert len(index) == len(values) == 2 and values[0, 0] == 0.0
+
+
+def test_legacy_layout_is_ignored_and_cleaned(tmp_path):
+    path = tmp_path / "cache"
+    path.mkdir()
+    index, values = arrays(2)
+    np.save(path / "index.npy", index)
+    np.save(path / "values.npy", values)
+    (path / "meta.json").write_text(json.dumps(META))
+    assert _read_cache(str(path)) is None
+    _write_cache(str(path), *arrays(3), META)
+    assert not (path / "index.npy").exists() and not (path / "values.npy").exists()
+
+
+def test_load_panel_from_cache_without_db(tmp_path):
+    cache_dir = str(tmp_path)
+    symbols = META["symbols"]
+    index, values = arrays(4)
+    values[1, 1] = np.nan
+    _write_cache(panel._cache_path(cache_dir, symbols, "price_usd", "1h"), index, values, META)
+    out = panel.load_panel(None, symbols, cache_dir=cache_dir, refresh=False, align="intersection")
+    assert list(out.columns) == symbols
+    assert len(out) == 3                                # a barra com NaN sai na interseção
+    full = panel.load_panel(None, symbols, cache_dir=cache_dir, refresh=False, align="ffill",
+                            start=pd.Timestamp("2024-01-01 01:00"))
+    assert len(full) == 3 and np.isnan(full.iloc[0, 1])  # sem valor anterior dentro do recorte: NaN fica
+    assert full.iloc[1, 1] == 5.0
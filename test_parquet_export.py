@@ -0,0 +1,180 @@
+# test_parquet_export.py
+# pytest: escrita de partições, watermark e export incremental do parquet_export.py (cursor falso, sem MySQL)
+import json
+import os
+from datetime import date, datetime, timedelta
+
+import pyarrow.parquet as pq
+
+import parquet_export
+from parquet_export import (_to_frame, day_runs, existing_partitions, partition_dir, read_watermark,
+                            remove_partition, write_partition, write_watermark)
+
+DAY = date(2024, 1, 31)
+
+
+def row(ts, price=100.0, run_id=7):
+    # layout de EXPORT_COLUMNS
+    return (ts, "BTC-USD", price, 0.5, 10, 1, 0, run_id)
+
+
+# ---------- Partições ----------
+def test_write_partition_roundtrip_sorted_and_deduplicated(tmp_path):
+    ts = datetime(2024, 1, 31, 10)
+    df = _to_frame([row(ts + timedelta(hours=1)), row(ts, price=1.0), row(ts, price=2.0)])
+    path = write_partition(str(tmp_path), "BTC-USD", DAY, df)
+    assert path == os.path.join(partition_dir(str(tmp_path), "BTC-USD", DAY), "part-0.parquet")
+    back = pq.read_table(path).to_pandas()
+    assert list(back["timestamp"]) == [ts, ts + timedelta(hours=1)]
+    assert back["price_usd"].iloc[0] == 2.0                   # duplicata: a última vence
+    assert str(back["quality_bits"].dtype) == "uint16" and str(back["run_id"].dtype) == "uint32"
+    assert os.listdir(os.path.dirname(path)) == ["part-0.parquet"]   # sem .tmp
+
+
+def test_write_partition_replaces_stray_files(tmp_path):
+    path = partition_dir(str(tmp_path), "BTC-USD", DAY)
+    os.makedirs(path)
+    open(os.path.join(path, "part-old.parquet"), "wb").close()
+    write_partition(str(tmp_path), "BTC-USD", DAY, _to_frame([row(datetime(2024, 1, 31))]))
+    assert os.listdir(path) == ["part-0.parquet"]
+
+
+def test_remove_partition_cleans_empty_symbol_dir(tmp_path):
+    root = str(tmp_path)
+    for day in (DAY, DAY + timedelta(days=1)):
+        write_partition(root, "BTC-USD", day, _to_frame([row(datetime.combine(day, datetime.min.time()))]))
+    assert existing_partitions(root) == {("BTC-USD", DAY), ("BTC-USD", DAY + timedelta(days=1))}
+    assert remove_partition(root, "BTC-USD", DAY)
+    assert not remove_partition(root, "BTC-USD", DAY)
+    assert os.path.isdir(os.path.join(root, "symbol=BTC-USD"))
+    remove_partition(root, "BTC-USD", DAY + timedelta(days=1))
+    assert not os.path.exists(os.path.join(root, "symbol=BTC-USD"))
+
+
+# ---------- Watermark ----------
+def test_watermark_roundtrip(tmp_path):
+    root = str(tmp_path / "export")
+    assert read_watermark(root) is None
+    value = datetime(2024, 1, 31, 12, 0, 0, 123456)
+    write_watermark(root, value)
+    assert read_watermark(root) == value
+    assert not os.path.exists(os.path.join(root, parquet_export.WATERMARK_FILE + ".tmp"))
+
+
+def test_legacy_watermark_counts_as_missing(tmp_path):
+    (tmp_path / parquet_export.WATERMARK_FILE).write_text(json.dumps({"run_id": 42}))
+    assert read_watermark(str(tmp_path)) is None
+
+
+def test_day_runs():
+    d = lambda n: date(2024, 1, n)
+    assert day_runs([d(5), d(1), d(2), d(2), d(9), d(10)]) == [(d(1), d(3)), (d(5), d(6)), (d(9), d(11))]
+    assert day_runs([]) == []
+
+
+# ---------- Export incremental ----------
+class FakeCursor:
+    """raw_crypto em memória: {(symbol, ts): row}; responde às consultas do export_incremental."""
+
+    def __init__(self, raw, changed, safe):
+        self.raw = raw
+        self.changed = changed
+        self.safe = safe
+        self.sql = []
+        self._result = []
+
+    def execute(self, sql, params=()):
+        self.sql.append((sql, params))
+        if sql.startswith("SELECT NOW(6)"):
+            self._result = [(self.safe,)]
+        elif "DISTINCT" in sql:
+            self._result = self.changed
+        elif "MIN(`timestamp`)" in sql:
+            first = {}
+            for s, ts in self.raw:
+                first[s] = min(first.get(s, ts), ts)
+            self._result = sorted(first.items())
+        else:
+            symbol, bounds = params[0], params[1:]
+            ranges = list(zip(bounds[::2], bounds[1::2]))
+            self._result = [r for (s, ts), r in sorted(self.raw.items())
+                            if s == symbol and any(lo <= ts.date() < hi for lo, hi in ranges)]
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0]
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def get_connection(self):
+        pool = self
+
+        class Conn:
+            def cursor(self):
+                return pool.cursor
+
+            def close(self):
+                pass
+        return Conn()
+
+
+def _raw(days):
+    return {("BTC-USD", datetime.combine(day, datetime.min.time()) + timedelta(hours=h)):
+            row(datetime.combine(day, datetime.min.time()) + timedelta(hours=h)) for day in days for h in (0, 1)}
+
+
+def test_incremental_queries_only_changed_days(tmp_path):
+    d = lambda n: date(2024, 1, n)
+    write_watermark(str(tmp_path), datetime(2024, 2, 1))
+    raw = _raw([d(n) for n in range(1, 11)])
+    cursor = FakeCursor(raw, changed=[("BTC-USD", d(2)), ("BTC-USD", d(3)), ("BTC-USD", d(9))],
+                        safe=datetime(2024, 2, 2))
+    result = parquet_export.export_incremental(FakePool(cursor), str(tmp_path))
+    sql, params = next(q for q in cursor.sql if q[0].startswith("SELECT `timestamp`"))
+    assert sql.count("`timestamp` >= %s") == 2               # d2..d3 e d9: dois ranges, não d2..d9
+    assert params == ("BTC-USD", d(2), d(4), d(9), d(10))
+    assert result["partitions"] == 3 and result["rows"] == 6 and result["removed"] == 0
+    assert existing_partitions(str(tmp_path)) == {("BTC-USD", d(2)), ("BTC-USD", d(3)), ("BTC-USD", d(9))}
+    assert read_watermark(str(tmp_path)) == datetime(2024, 2, 2)
+
+
+def test_changed_day_without_rows_is_removed(tmp_path):
+    root = str(tmp_path)
+    write_partition(root, "BTC-USD", DAY, _to_frame([row(datetime(2024, 1, 31))]))
+    write_watermark(root, datetime(2024, 2, 1))
+    cursor = FakeCursor({}, changed=[("BTC-USD", DAY)], safe=datetime(2024, 2, 2))
+    result = parquet_export.export_incremental(FakePool(cursor), root)
+    assert result["removed"] == 1 and result["partitions"] == 0
+    assert existing_partitions(root) == set()
+
+
+def test_incremental_removes_days_dropped_by_retention(tmp_path):
+    d = lambda n: date(2024, 1, n)
+    root = str(tmp_path)
+    for day in (d(1), d(2), d(3)):
+        write_partition(root, "BTC-USD", day, _to_frame([row(datetime.combine(day, datetime.min.time()))]))
+    write_partition(root, "GONE-USD", d(3), _to_frame([row(datetime(2024, 1, 3))]))
+    write_watermark(root, datetime(2024, 2, 1))
+    cursor = FakeCursor(_raw([d(3), d(4)]), changed=[("BTC-USD", d(4))], safe=datetime(2024, 2, 2))
+    result = parquet_export.export_incremental(FakePool(cursor), root)
+    assert result["removed"] == 3 and result["partitions"] == 1
+    assert existing_partitions(root) == {("BTC-USD", d(3)), ("BTC-USD", d(4))}
+
+
+def test_full_export_removes_partitions_gone_from_db(tmp_path):
+    root = str(tmp_path)
+    stale = date(2023, 6, 1)                                  # apagado pela retenção
+    write_partition(root, "OLD-USD", stale, _to_frame([row(datetime(2023, 6, 1))]))
+    raw = _raw([DAY])
+    cursor = FakeCursor(raw, changed=[("BTC-USD", DAY)], safe=datetime(2024, 2, 2))
+    result = parquet_export.export_incremental(FakePool(cursor), root, full=True)
+    assert result == {"partitions": 1, "removed": 1, "rows": 2, "watermark": "2024-02-02T00:00:00"}
+    assert existing_partitions(root) == {("BTC-USD", DAY)}
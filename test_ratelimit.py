@@ -0,0 +1,177 @@
+# test_ratelimit.py
+# pytest: AIMD do AdaptiveRateLimiter, transições do CircuitBreaker (relógio falso) e
+# detecção de 429 com o yfinance instalado (HTTP falso, sem rede)
+from unittest import mock
+
+import pytest
+
+import ratelimit
+from ratelimit import AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError, classify_failure
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", c)
+    return c
+
+
+# ---------- AIMD ----------
+def test_additive_increase_up_to_max():
+    lim = AdaptiveRateLimiter(1.0, min_rps=0.2, max_rps=1.3, step=0.1, decrease=0.5)
+    lim.on_success()
+    lim.on_success()
+    assert lim.rate == pytest.approx(1.2)
+    for _ in range(10):
+        lim.on_success()
+    assert lim.rate == pytest.approx(1.3)
+    assert lim.counts["success"] == 12
+
+
+def test_multiplicative_decrease_down_to_min(clock):
+    lim = AdaptiveRateLimiter(4.0, min_rps=0.2, max_rps=10, step=0.1, decrease=0.5)
+    lim.on_failure("throttle")
+    assert lim.rate == pytest.approx(2.0)
+    lim.on_failure("timeout")
+    assert lim.rate == pytest.approx(1.0)
+    for _ in range(10):
+        lim.on_failure()
+    assert lim.rate == pytest.approx(0.2)
+    snap = lim.snapshot()
+    assert snap["rate_throttle"] == 1 and snap["rate_timeout"] == 1 and snap["rate_error"] == 10
+
+
+def test_failure_pushes_next_slot_to_new_rate(clock, monkeypatch):
+    slept = []
+    monkeypatch.setattr(ratelimit.time, "sleep", slept.append)
+    lim = AdaptiveRateLimiter(2.0, decrease=0.5)
+    lim.on_failure("throttle")  # 1 req/s: a próxima chamada espera 1s
+    assert lim.acquire() == pytest.approx(1.0)
+    assert slept == [pytest.approx(1.0)]
+
+
+def test_initial_rate_clamped():
+    assert AdaptiveRateLimiter(100, min_rps=0.2, max_rps=5).rate == 5
+    assert AdaptiveRateLimiter(0.01, min_rps=0.2, max_rps=5).rate == 0.2
+
+
+# ---------- Circuit breaker ----------
+def test_opens_after_threshold_and_rejects(clock):
+    br = CircuitBreaker(failure_threshold=3, cooldown_sec=60)
+    for _ in range(2):
+        br.record_failure()
+    assert br.state == CircuitBreaker.CLOSED and br.allow()
+    br.record_failure()
+    assert br.state == CircuitBreaker.OPEN
+    assert not br.allow()
+    with pytest.raises(CircuitOpenError):
+        br.check()
+    assert br.rejected == 2
+
+
+def test_half_open_lets_a_single_probe(clock):
+    br = CircuitBreaker(failure_threshold=1, cooldown_sec=60)
+    br.record_failure()
+    clock.now += 59.9
+    assert not br.allow()
+    clock.now += 0.1
+    assert br.allow()                      # a sonda
+    assert br.state == CircuitBreaker.HALF_OPEN
+    assert not br.allow()                  # enquanto a sonda não volta, o resto é rejeitado
+    br.record_success()
+    assert br.state == CircuitBreaker.CLOSED and br.failures == 0
+    assert br.allow() and br.allow()
+
+
+def test_failed_probe_reopens_for_a_new_cooldown(clock):
+    br = CircuitBreaker(failure_threshold=5, cooldown_sec=60)
+    for _ in range(5):
+        br.record_failure()
+    clock.now += 60
+    assert br.allow()
+    br.record_failure()                    # sonda falhou: reabre na hora, mesmo abaixo do limiar
+    assert br.state == CircuitBreaker.OPEN
+    clock.now += 30
+    assert not br.allow()
+    clock.now += 30
+    assert br.allow()                      # nova sonda só depois de outro cooldown inteiro
+    assert br.state == CircuitBreaker.HALF_OPEN
+
+
+def test_success_resets_failure_count(clock):
+    br = CircuitBreaker(failure_threshold=3, cooldown_sec=60)
+    br.record_failure()
+    br.record_failure()
+    br.record_success()
+    br.record_failure()
+    br.record_failure()
+    assert br.state == CircuitBreaker.CLOSED
+
+
+# ---------- classify_failure ----------
+@pytest.mark.parametrize("exc,message,kind", [
+    (None, "YFRateLimitError('Too Many Requests. Rate limited.')", "throttle"),
+    (RuntimeError("HTTP Error 429"), None, "throttle"),
+    (TimeoutError("read timed out"), None, "timeout"),
+    (ValueError("No data found, symbol may be delisted"), None, "error"),
+])
+def test_classify_failure(exc, message, kind):
+    assert classify_failure(exc, message) == kind
+
+
+# ---------- 429 do yfinance ----------
+@pytest.fixture
+def upstream_429(monkeypatch):
+    """Toda requisição do yfinance recebe 429 (YfData levanta YFRateLimitError)."""
+    from yfinance.data import YfData
+    from yfinance.exceptions import YFRateLimitError
+
+    def too_many_requests(*args, **kwargs):
+        raise YFRateLimitError()
+    monkeypatch.setattr(YfData, "_make_request", too_many_requests)
+    monkeypatch.setattr(ratelimit, "_HOSTS", {})
+
+
+def test_yf_download_swallows_429_but_capture_sees_it(upstream_429):
+    import yfinance as yf
+
+    with ratelimit.capture_yf_errors() as errors:
+        df = yf.download("BTC-USD", period="5d", interval="1h", threads=False, progress=False)
+    assert df.empty                                 # nenhuma exceção: pareceria "sem dados"
+    assert "throttle" in {classify_failure(message=m) for m in errors}
+
+
+def test_yf_history_raises_on_429(upstream_429):
+    with pytest.raises(Exception) as exc_info:
+        ratelimit.yf_history("BTC-USD", period="5d", interval="1h")
+    assert classify_failure(exc_info.value) == "throttle"
+
+
+def test_swallowed_429_lowers_the_rate(upstream_429, monkeypatch):
+    monkeypatch.setattr(ratelimit.time, "sleep", lambda s: None)
+    with mock.patch("mysql.connector.pooling.MySQLConnectionPool"):
+        import yahoo_scraper
+    limiter, breaker = ratelimit.for_host(initial_rps=2.0)
+    df = yahoo_scraper.fetch_ticker_df("BTC-USD", retry_max=1)
+    assert df.attrs["empty_reason"] == "errors"     # não vira "no_data" (nem entra no cache negativo)
+    assert limiter.counts["throttle"] == 2 and limiter.counts["success"] == 0
+    assert limiter.rate == pytest.approx(0.5)
+    assert breaker.failures == 2
+
+
+def test_snapshot_does_not_clobber_run_stats(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_HOSTS", {})
+    limiter, _ = ratelimit.for_host(initial_rps=1.0)
+    limiter.on_success()
+    stats = {"success": 7, "errors": 0}
+    stats.update(ratelimit.snapshot())
+    assert stats["success"] == 7 and stats["rate_success"] == 1
+    assert stats["breaker_state"] == CircuitBreaker.CLOSED
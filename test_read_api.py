@@ -0,0 +1,125 @@
+# test_read_api.py
+# pytest: TTLCache (TTL, LRU, invalidação por tag) e o cache das rotas do read_api.py (sem MySQL)
+from datetime import datetime
+
+import pytest
+
+import read_api
+from read_api import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    class Clock:
+        now = 1000.0
+
+        def __call__(self):
+            return self.now
+    c = Clock()
+    monkeypatch.setattr(read_api.time, "monotonic", c)
+    return c
+
+
+# ---------- TTL ----------
+def test_entry_expires_after_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("k", 1, tags=("BTC-USD",))
+    clock.now += 59.9
+    assert cache.get("k") == 1
+    clock.now += 0.2
+    assert cache.get("k") is None
+    assert len(cache) == 0 and cache._tags == {}   # expirado sai também do índice de tags
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_set_again_refreshes_ttl_and_tags(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("k", 1, tags=("A",))
+    clock.now += 50
+    cache.set("k", 2, tags=("B",))
+    clock.now += 50
+    assert cache.get("k") == 2
+    assert cache.invalidate(["A"]) == 0
+    assert cache.invalidate(["B"]) == 1
+
+
+# ---------- LRU ----------
+def test_lru_evicts_least_recently_used(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, tags=("A",))
+    cache.set("b", 2)
+    assert cache.get("a") == 1                      # "a" vira o mais recente
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats["evictions"] == 1
+
+
+def test_eviction_cleans_tag_index(clock):
+    cache = TTLCache(maxsize=1, ttl=60)
+    cache.set("a", 1, tags=("A",))
+    cache.set("b", 2, tags=("B",))
+    assert "A" not in cache._tags
+    assert cache.invalidate(["A"]) == 0
+
+
+# ---------- Tags ----------
+def test_invalidate_by_tag_only_touches_tagged_keys(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set(("latest", "BTC-USD"), 1, tags=("BTC-USD",))
+    cache.set(("range", "BTC-USD", None, None, "1h"), [1], tags=("BTC-USD",))
+    cache.set(("latest", "ETH-USD"), 2, tags=("ETH-USD",))
+    assert cache.invalidate(["BTC-USD", "DOGE-USD"]) == 2
+    assert cache.get(("latest", "ETH-USD")) == 2
+    assert cache.get(("latest", "BTC-USD")) is None
+    assert cache.stats["invalidations"] == 2
+
+
+def test_multi_tag_key_removed_once(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("pair", 1, tags=("A", "B"))
+    assert cache.invalidate(["A", "B"]) == 1
+    assert cache._tags == {}
+
+
+# ---------- Rotas ----------
+@pytest.fixture
+def api(monkeypatch, clock):
+    """Cliente Flask com cache novo e _query falso que registra cada ida ao banco."""
+    cache = TTLCache(maxsize=100, ttl=300)
+    monkeypatch.setattr(read_api, "CACHE", cache)
+    queries = []
+    ts = datetime(2024, 1, 1, 10)
+
+    def fake_query(sql, params=()):
+        queries.append((sql, list(params)))
+        cache.stats["db_queries"] += 1
+        if "DISTINCT symbol" in sql:
+            return [("BTC-USD",), ("ETH-USD",)]
+        return [(s, ts, 100.0, 5) for s in params if s in ("BTC-USD", "ETH-USD")]
+    monkeypatch.setattr(read_api, "_query", fake_query)
+    client = read_api.app.test_client()
+    client.queries = queries
+    return client
+
+
+def test_latest_resolves_all_misses_in_one_query(api):
+    body = api.get("/latest?symbols=BTC-USD,ETH-USD,NOPE-USD").get_json()
+    assert set(body["data"]) == {"BTC-USD", "ETH-USD", "NOPE-USD"}
+    assert body["data"]["NOPE-USD"] is None
+    assert len(api.queries) == 1
+    api.get("/latest?symbols=BTC-USD,ETH-USD")
+    assert len(api.queries) == 1                    # tudo do cache
+    api.get("/latest?symbols=BTC-USD,NOPE-USD")
+    assert api.queries[-1][1] == ["NOPE-USD"]       # só o miss vai ao banco (símbolo sem dados não é cacheado)
+
+
+def test_invalidate_route_drops_written_symbols_and_symbol_list(api):
+    api.get("/latest?symbols=BTC-USD,ETH-USD")
+    api.get("/symbols")
+    assert len(api.queries) == 2
+    assert api.post("/invalidate", json={"symbols": ["BTC-USD"]}).get_json() == {"invalidated": 2}
+    api.get("/latest?symbols=BTC-USD,ETH-USD")
+    assert api.queries[-1][1] == ["BTC-USD"]
+    api.get("/symbols")
+    assert len(api.queries) == 4                    # /symbols tem a tag ALL_TAG
@@ -0,0 +1,148 @@
+# test_reconcile.py
+# pytest: forma canônica/CRC das linhas, hierarquia de checksums e diverging_days do reconcile.py
+# Paridade Python x SQL contra um MySQL de verdade: defina TEST_MYSQL_HOST (usa MYSQL_PORT/USER/PASSWORD/DB).
+import os
+import zlib
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+import pytest
+
+# run_once (importado pelo reconcile) cria o POOL no import
+with mock.patch("mysql.connector.pooling.MySQLConnectionPool"):
+    import reconcile
+from reconcile import canonical, digest_rows, diverging_days, merge_ranges, rollup, row_crc
+
+TS = datetime(2024, 3, 5, 13, 0)
+
+
+def row(ts, price=100.0, volume=10):
+    # layout do UPSERT_SQL: price no índice 2, volume no 4, timestamp no 5
+    return ("BTC-USD", "BTC-USD", price, 0.0, volume, ts, 1, 1, 0)
+
+
+# ---------- Forma canônica ----------
+def test_canonical_matches_mysql_rendering():
+    # CONCAT_WS de DATETIME, DECIMAL(20,8) (sempre 8 casas) e BIGINT
+    assert canonical(TS, 0.1, 10) == "2024-03-05 13:00:00|0.10000000|10"
+    assert canonical(TS, 65000.123456789, 123456789012) == "2024-03-05 13:00:00|65000.12345679|123456789012"
+
+
+def test_canonical_nulls_keep_separator():
+    # COALESCE(..., '') mantém o separador (CONCAT_WS só pula NULL)
+    assert canonical(TS, None, 10) == "2024-03-05 13:00:00||10"
+    assert canonical(TS, 1.0, None) == "2024-03-05 13:00:00|1.00000000|"
+
+
+@pytest.mark.parametrize("price,expected", [
+    (0.123456785, "0.12345679"),    # "%.8f" daria 0.12345678 (arredonda o binário)
+    (1.000000005, "1.00000001"),
+    (2.675e-8, "0.00000003"),
+])
+def test_canonical_rounds_like_decimal_column(price, expected):
+    # o conector envia str(float); o MySQL arredonda esse decimal half away from zero
+    assert canonical(TS, price, 1).split("|")[1] == expected
+
+
+def test_crc_is_mysql_crc32():
+    # valor de exemplo da documentação do MySQL: SELECT CRC32('MySQL') = 3259397556
+    assert zlib.crc32(b"MySQL") == 3259397556
+    assert row_crc(TS, 0.1, 10) == zlib.crc32(b"2024-03-05 13:00:00|0.10000000|10")
+
+
+# ---------- Checksums ----------
+def test_digest_is_order_independent_and_counts_rows():
+    rows = [row(TS + timedelta(hours=h), price=100 + h) for h in range(5)]
+    d = digest_rows(rows)
+    assert d == digest_rows(reversed(rows))
+    assert d[TS.date()][0] == 5
+
+
+def test_rollup_xors_children_and_sums_counts():
+    digest = {date(2024, 1, 1): (2, 0b0011), date(2024, 1, 2): (3, 0b0101), date(2024, 2, 1): (1, 0b1000)}
+    assert rollup(digest, lambda d: (d.year, d.month)) == {(2024, 1): (5, 0b0110), (2024, 2): (1, 0b1000)}
+    assert rollup(digest, lambda d: d.year) == {2024: (6, 0b1110)}
+
+
+def _history(days, start=date(2022, 1, 1)):
+    rows = []
+    for i in range(days):
+        ts = datetime.combine(start + timedelta(days=i), datetime.min.time())
+        rows.append(row(ts, price=1000 + i, volume=i))
+    return rows
+
+
+def test_identical_history_stops_at_years():
+    rows = _history(800)
+    days, compared = diverging_days(digest_rows(rows), digest_rows(rows))
+    assert days == []
+    assert compared == {"years": 3, "months": 0, "days": 0}
+
+
+def test_single_changed_bar_descends_only_into_its_month():
+    source = _history(800)
+    stored = list(source)
+    i = 400                                        # 2023-02-05
+    stored[i] = row(stored[i][5], price=stored[i][2] + 0.01, volume=stored[i][4])
+    days, compared = diverging_days(digest_rows(stored), digest_rows(source))
+    assert days == [date(2023, 2, 5)]
+    assert compared == {"years": 3, "months": 12, "days": 28}
+
+
+def test_missing_and_extra_days_detected():
+    source = _history(60)
+    stored = source[:10] + source[11:] + [row(datetime(2022, 3, 15), price=1)]
+    days, _ = diverging_days(digest_rows(stored), digest_rows(source))
+    assert days == [date(2022, 1, 11), date(2022, 3, 15)]
+
+
+def test_price_rounded_away_by_decimal_column_is_not_a_divergence():
+    # fonte com mais casas que o DECIMAL(20,8) guarda: o banco devolve o valor já arredondado
+    source = [row(TS, price=0.123456785)]
+    stored = [row(TS, price=0.12345679)]
+    assert diverging_days(digest_rows(stored), digest_rows(source))[0] == []
+
+
+def test_merge_ranges_absorbs_small_gaps():
+    d = lambda n: date(2024, 1, n)
+    assert merge_ranges([d(1), d(3), d(20), d(2), d(21)], gap=7) == [(d(1), d(3)), (d(20), d(21))]
+    assert merge_ranges([d(1), d(9)], gap=7) == [(d(1), d(9))]
+    assert merge_ranges([d(1), d(10)], gap=7) == [(d(1), d(1)), (d(10), d(10))]
+    assert merge_ranges([]) == []
+
+
+def test_cache_roundtrip(tmp_path):
+    digest = digest_rows(_history(3))
+    reconcile.save_cache(str(tmp_path), "BTC-USD", "1d", digest)
+    assert reconcile.load_cache(str(tmp_path), "BTC-USD", "1d") == digest
+    assert reconcile.load_cache(str(tmp_path), "ETH-USD", "1d") == {}
+
+
+# ---------- Paridade com o MySQL ----------
+@pytest.mark.skipif(not os.getenv("TEST_MYSQL_HOST"), reason="TEST_MYSQL_HOST not set")
+def test_stored_digest_matches_python_digest():
+    import mysql.connector
+
+    conn = mysql.connector.connect(
+        host=os.getenv("TEST_MYSQL_HOST"), port=int(os.getenv("MYSQL_PORT", "3306")),
+        user=os.getenv("MYSQL_USER", "Acelino"), password=os.getenv("MYSQL_PASSWORD", "senha123"),
+        database=os.getenv("MYSQL_DB", "projet_crypto"),
+    )
+    cursor = conn.cursor()
+    try:
+        # TEMPORARY sombreia raw_crypto só nesta sessão: roda o SQL real do stored_digest
+        cursor.execute(
+            "CREATE TEMPORARY TABLE raw_crypto (symbol VARCHAR(20), price_usd DECIMAL(20,8), "
+            "volume_24h_usd BIGINT, `timestamp` DATETIME(6))"
+        )
+        rows = [row(TS, 0.123456785, 10), row(TS + timedelta(days=1), None, 5),
+                row(TS + timedelta(days=2), 65000.123456789, None), row(TS + timedelta(days=2, hours=1), 1e-9, 0)]
+        cursor.executemany(
+            "INSERT INTO raw_crypto (symbol, price_usd, volume_24h_usd, `timestamp`) VALUES (%s, %s, %s, %s)",
+            [(r[0], r[2], r[4], r[5]) for r in rows],
+        )
+        stored = reconcile.stored_digest(cursor, "BTC-USD", "1h", TS.date(), TS.date() + timedelta(days=2))
+        assert stored == digest_rows(rows)
+    finally:
+        cursor.close()
+        conn.close()
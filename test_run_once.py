@@ -0,0 +1,96 @@
+# test_run_once.py
+# pytest: janelas do backfill intradiário (split/stitch), granularidade gravada e
+# fetch_window com janela sem preços (yfinance falso, sem rede nem MySQL)
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+import pandas as pd
+import pytest
+import yfinance
+from yfinance.exceptions import YFPricesMissingError
+
+import ratelimit
+
+with mock.patch("mysql.connector.pooling.MySQLConnectionPool"):
+    import run_once
+from run_once import split_windows, stitch_windows, stored_interval, truncate_to_interval
+
+TODAY = datetime.utcnow().date()
+
+
+# ---------- Granularidade gravada ----------
+@pytest.mark.parametrize("interval,stored", [("1d", "1d"), ("1h", "1h"), ("60m", "1h"), ("5m", "1h"), ("1m", "1h")])
+def test_stored_interval(interval, stored):
+    assert stored_interval(interval) == stored
+
+
+def test_truncate_to_interval_uses_stored_granularity():
+    ts = pd.Timestamp("2024-01-01 10:35:12", tz="UTC")
+    assert truncate_to_interval(ts, "5m") == datetime(2024, 1, 1, 10, 0)
+    assert truncate_to_interval(ts, "1d") == datetime(2024, 1, 1)
+    # 12:35 em Kolkata = 07:05 UTC, devolvido naive
+    assert truncate_to_interval(pd.Timestamp("2024-01-01 12:35", tz="Asia/Kolkata"), "1h") == datetime(2024, 1, 1, 7, 0)
+
+
+# ---------- split_windows ----------
+def test_daily_is_a_single_window():
+    assert split_windows(date(2020, 1, 1), date(2024, 1, 1), "1d") == [(date(2020, 1, 1), date(2024, 1, 1))]
+    assert split_windows(date(2024, 1, 1), date(2024, 1, 1), "1d") == []
+
+
+def test_windows_are_contiguous_and_bounded():
+    start = TODAY - timedelta(days=20)
+    windows = split_windows(start, TODAY, "1m")     # janela máxima de 7 dias
+    assert windows[0][0] == start and windows[-1][1] == TODAY
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+    assert [(e - s).days for s, e in windows] == [7, 7, 6]
+
+
+def test_start_clamped_to_interval_history():
+    windows = split_windows(TODAY - timedelta(days=200), TODAY, "5m")   # histórico de 60 dias
+    assert windows[0][0] == TODAY - timedelta(days=59)
+    assert len(windows) == 1
+
+
+# ---------- stitch_windows ----------
+def _frame(start, n, close):
+    idx = pd.date_range(start, periods=n, freq="1h", tz="UTC")
+    return pd.DataFrame({"Close": [close] * n}, index=idx)
+
+
+def test_stitch_sorts_and_last_window_wins_on_overlap():
+    first = _frame("2024-01-01 00:00", 3, 1.0)         # 00..02
+    second = _frame("2024-01-01 02:00", 2, 2.0)        # 02..03
+    out = stitch_windows([second, pd.DataFrame(), None, first])
+    assert list(out.index.hour) == [0, 1, 2, 3]
+    assert out.index.is_unique
+    assert out.loc["2024-01-01 02:00", "Close"] == 1.0  # "última" = ordem da lista
+
+
+def test_stitch_all_empty():
+    assert stitch_windows([pd.DataFrame(), None]).empty
+
+
+# ---------- fetch_window ----------
+def test_window_without_prices_is_no_data_without_penalty(monkeypatch):
+    calls = []
+
+    class NoPrices:
+        def __init__(self, ticker):
+            self.ticker = ticker
+
+        def history(self, **kwargs):
+            calls.append(kwargs)
+            raise YFPricesMissingError(self.ticker, "(1h 2024-01-01 -> 2024-01-08)")
+    monkeypatch.setattr(yfinance, "Ticker", NoPrices)
+    monkeypatch.setattr(ratelimit, "_HOSTS", {})
+    monkeypatch.setattr(ratelimit.time, "sleep", lambda s: None)
+    limiter, breaker = ratelimit.for_host(initial_rps=2.0)
+
+    df = run_once.fetch_window("DEAD-USD", date(2024, 1, 1), date(2024, 1, 8), "1h")
+    assert df.empty and df.attrs["empty_reason"] == "no_data"
+    assert len(calls) == run_once.EMPTY_RETRY_MAX + 1
+    assert "raise_errors" not in calls[0]
+    assert limiter.rate == pytest.approx(2.0)
+    assert limiter.counts == {"success": 0, "throttle": 0, "timeout": 0, "error": 0}
+    assert breaker.failures == 0
@@ -0,0 +1,139 @@
+# test_schema.py
+# pytest: planejamento de partições (_month_defs, _parse_bound) e cutoffs da retenção do schema.py (sem MySQL)
+import os
+from datetime import date
+
+import pytest
+
+import schema
+from schema import _month_defs, _parse_bound, add_months, retention_plan
+
+TODAY = date(2025, 6, 15)
+
+
+def months(first, n):
+    """[(pYYYYMM, limite superior)] como o _monthly devolve."""
+    out, m = [], first
+    for _ in range(n):
+        nxt = add_months(m, 1)
+        out.append((schema.partition_name(m), nxt))
+        m = nxt
+    return out
+
+
+# ---------- Partições ----------
+def test_month_defs_cover_range_and_cross_year():
+    assert _month_defs(date(2024, 11, 20), date(2025, 2, 1)) == [
+        "PARTITION p202411 VALUES LESS THAN ('2024-12-01')",
+        "PARTITION p202412 VALUES LESS THAN ('2025-01-01')",
+        "PARTITION p202501 VALUES LESS THAN ('2025-02-01')",
+    ]
+    assert _month_defs(date(2025, 2, 1), date(2025, 2, 1)) == []
+
+
+@pytest.mark.parametrize("description,bound", [
+    ("'2026-11-01 00:00:00'", date(2026, 11, 1)),
+    ("'2026-11-01'", date(2026, 11, 1)),
+    ("MAXVALUE", None),
+    ("maxvalue", None),
+    (None, None),
+])
+def test_parse_bound(description, bound):
+    assert _parse_bound(description) == bound
+
+
+# ---------- Retenção ----------
+@pytest.mark.skipif("RETENTION_INTRADAY_DAYS" in os.environ or "RETENTION_DAILY_DAYS" in os.environ,
+                    reason="retention overridden by ENV")
+def test_default_policy_keeps_everything():
+    assert schema.DEFAULT_RETENTION == {"intraday": 0, "1d": 0}     # retenção é opt-in
+    assert retention_plan(months(date(2020, 1, 1), 60), {"intraday": 0, "1d": 0}, TODAY) == ([], [], None)
+
+
+def test_intraday_prunes_only_months_fully_past_cutoff():
+    monthly = months(date(2024, 1, 1), 18)
+    expired, targets, cutoff = retention_plan(monthly, {"intraday": 365, "1d": 0}, TODAY)
+    assert cutoff == date(2024, 6, 15)
+    assert expired == []                               # diário mantido para sempre: nada sai inteiro
+    # p202406 termina em 2024-07-01 > cutoff: só entra quando o mês inteiro expirar
+    assert targets == ["p_hist", "p202401", "p202402", "p202403", "p202404", "p202405"]
+
+
+def test_whole_partitions_dropped_when_all_granularities_expired():
+    monthly = months(date(2022, 1, 1), 42)
+    expired, targets, cutoff = retention_plan(monthly, {"intraday": 400, "1d": 730}, TODAY)
+    # cutoff diário 2023-06-16: meses com limite <= cutoff saem inteiros
+    assert expired[0] == "p202201" and expired[-1] == "p202305"
+    assert cutoff == date(2024, 5, 11)
+    assert targets[0] == "p_hist" and targets[1] == "p202306" and targets[-1] == "p202404"
+    assert not set(expired) & set(targets)
+
+
+def test_at_least_one_monthly_partition_kept():
+    monthly = months(date(2020, 1, 1), 3)
+    expired, _, _ = retention_plan(monthly, {"intraday": 30, "1d": 30}, TODAY)
+    assert expired == ["p202001", "p202002"]
+
+
+class FakeCursor:
+    """Responde ao information_schema e ao probe de linhas intraday; registra o SQL executado."""
+
+    def __init__(self, parts, pending):
+        self.parts = parts
+        self.pending = pending           # partições que ainda têm barras intraday
+        self.sql = []
+        self.rowcount = 0
+        self._result = []
+
+    def execute(self, sql, params=()):
+        self.sql.append(sql)
+        if "information_schema.PARTITIONS" in sql:
+            self._result = self.parts
+        elif sql.startswith("SELECT 1"):
+            name = sql.split("PARTITION (")[1].split(")")[0]
+            self._result = [(1,)] if name in self.pending else []
+        elif sql.startswith("DELETE"):
+            self.rowcount = 3
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        pass
+
+
+def _parts(monthly):
+    rows = [("p_hist", "'%s 00:00:00'" % add_months(monthly[0][1], -1).isoformat())]
+    rows += [(n, "'%s 00:00:00'" % b.isoformat()) for n, b in monthly]
+    return rows + [("p_future", "MAXVALUE")]
+
+
+def test_apply_retention_deletes_only_where_intraday_rows_remain():
+    monthly = months(date(2024, 1, 1), 18)
+    cursor = FakeCursor(_parts(monthly), pending={"p202405"})
+    result = schema.apply_retention(FakeConn(cursor), policy={"intraday": 365, "1d": 0}, today=TODAY)
+    deletes = [s for s in cursor.sql if s.startswith("DELETE")]
+    assert len(deletes) == 1 and "PARTITION (p202405)" in deletes[0]
+    assert "TIME(`timestamp`) <> '00:00:00'" in deletes[0]
+    assert result == {"dropped_partitions": 0, "pruned_rows": 3}
+
+
+def test_apply_retention_no_delete_when_nothing_crossed():
+    monthly = months(date(2024, 1, 1), 18)
+    cursor = FakeCursor(_parts(monthly), pending=set())
+    schema.apply_retention(FakeConn(cursor), policy={"intraday": 365, "1d": 0}, today=TODAY)
+    assert not any(s.startswith(("DELETE", "ALTER", "INSERT")) for s in cursor.sql)
@@ -0,0 +1,206 @@
+# test_sharding.py
+# pytest: divisão de shards, fatia justa, retomada de lease vencido e pool próprio do heartbeat
+# do sharding.py (banco falso em memória com relógio controlado, sem MySQL)
+import threading
+
+import pytest
+from mysql.connector.errors import PoolError
+
+import sharding
+from sharding import ShardCoordinator, run_sharded, shard_of
+
+LEASE = 10
+
+
+class FakeDB:
+    """scrape_shards/scrape_replicas em memória; `now` faz o papel do NOW(3) do MySQL."""
+
+    def __init__(self, shard_count):
+        self.now = 0.0
+        self.shards = {i: {"owner": None, "lease_until": None, "epoch": 0} for i in range(shard_count)}
+        self.replicas = {}
+
+    def owners(self):
+        return {i: s["owner"] for i, s in self.shards.items()}
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 0
+        self._result = []
+
+    def execute(self, sql, params=()):
+        db, shards = self.db, self.db.shards
+        self._result, self.rowcount = [], 0
+        if sql.startswith("INSERT INTO scrape_replicas"):
+            db.replicas[params[0]] = db.now
+        elif sql.startswith("DELETE FROM scrape_replicas WHERE heartbeat_at"):
+            db.replicas = {r: t for r, t in db.replicas.items() if t >= db.now - params[0]}
+        elif sql.startswith("DELETE FROM scrape_replicas WHERE replica_id"):
+            db.replicas.pop(params[0], None)
+        elif sql.startswith("SELECT COUNT(*)"):
+            self._result = [(sum(1 for t in db.replicas.values() if t >= db.now - params[0]),)]
+        elif sql.lstrip().startswith(("SET TRANSACTION", "CREATE TABLE", "DELETE FROM scrape_shards")):
+            pass                                                 # DDL / ajuste do SHARD_COUNT
+        elif sql.startswith("SELECT shard_id, owner"):
+            me, limit = params
+            free = [(i, s["owner"]) for i, s in sorted(shards.items())
+                    if (s["owner"] is None or s["lease_until"] < db.now) and s["owner"] != me]
+            self._result = free[:limit]
+        elif sql.startswith("SELECT shard_id FROM scrape_shards WHERE owner = %s AND shard_id IN"):
+            self._result = [(i,) for i in params[1:] if shards[i]["owner"] == params[0]]
+        elif sql.startswith("SELECT shard_id FROM scrape_shards WHERE owner = %s"):
+            self._result = [(i,) for i, s in sorted(shards.items()) if s["owner"] == params[0]]
+        elif sql.startswith("UPDATE scrape_shards SET owner = NULL") and "shard_id IN" in sql:
+            for i in params[1:]:
+                if shards[i]["owner"] == params[0]:
+                    shards[i].update(owner=None, lease_until=None)
+        elif sql.startswith("UPDATE scrape_shards SET owner = NULL"):
+            for s in shards.values():
+                if s["owner"] == params[0]:
+                    s.update(owner=None, lease_until=None)
+        elif sql.startswith("UPDATE scrape_shards SET owner = %s"):
+            for i in params[1:]:
+                shards[i]["owner"] = params[0]
+                shards[i]["epoch"] += 1
+        elif sql.startswith("UPDATE scrape_shards SET lease_until") and "owner = %s" in sql:
+            lease, me, ids = params[0], params[1], params[2:]
+            for i in ids:
+                if shards[i]["owner"] == me:
+                    shards[i]["lease_until"] = db.now + lease
+                    self.rowcount += 1
+        elif sql.startswith("UPDATE scrape_shards SET lease_until"):
+            for i in params[1:]:
+                shards[i]["lease_until"] = db.now + params[0]
+        else:
+            raise AssertionError("SQL inesperado: %s" % sql)
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0]
+
+    def executemany(self, sql, rows):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    """Conta conexões pedidas; `exhausted` simula o PoolError do pool cheio."""
+
+    def __init__(self, db):
+        self.db = db
+        self.requests = 0
+        self.exhausted = False
+
+    def get_connection(self):
+        if self.exhausted:
+            raise PoolError("Failed getting connection; pool exhausted")
+        self.requests += 1
+        return FakeConn(self.db)
+
+
+def coordinator(db, replica_id, **kwargs):
+    return ShardCoordinator(FakePool(db), replica_id, shard_count=len(db.shards),
+                            lease_sec=LEASE, heartbeat_sec=1, **kwargs)
+
+
+# ---------- Divisão em shards ----------
+def test_shard_of_is_stable_and_in_range():
+    tickers = ["BTC-USD", "ETH-USD", "SOL-USD", "ADA-USD", "XRP-USD"]
+    shards = [shard_of(t, 4) for t in tickers]
+    assert all(0 <= s < 4 for s in shards)
+    assert shards == [shard_of(t, 4) for t in tickers]        # crc32: igual em qualquer processo
+    assert shard_of("BTC-USD", 4) == 0                           # não muda entre versões do Python
+
+
+def test_replicas_split_the_universe_without_overlap():
+    db = FakeDB(8)
+    a, b = coordinator(db, "a"), coordinator(db, "b")
+    assert a.claim() == list(range(8))                           # sozinha: pega tudo
+    assert b.claim() == []                                       # leases de "a" ainda vivos
+    assert a.claim() == [0, 1, 2, 3]                             # fatia justa com 2 vivas: solta o excesso
+    assert b.claim() == [4, 5, 6, 7]
+    assert a.stats["released"] == 4 and b.stats["acquired"] == 4 and b.stats["taken_over"] == 0
+    universe = ["T%d" % i for i in range(50)]
+    mine_a, mine_b = a.tickers_for(universe), b.tickers_for(universe)
+    assert sorted(mine_a + mine_b) == sorted(universe) and not set(mine_a) & set(mine_b)
+    assert mine_a == [t for t in universe if t in mine_a]        # mantém a ordem original
+
+
+def test_expired_lease_is_taken_over_and_owner_notices():
+    db = FakeDB(4)
+    a, b = coordinator(db, "a"), coordinator(db, "b")
+    a.claim()
+    b.claim()
+    db.now += LEASE + 1                                          # "a" parou de renovar (morreu)
+    assert b.claim() == [0, 1, 2, 3]                             # "a" fora das vivas: fatia = tudo
+    assert b.stats["taken_over"] == 4
+    assert all(s["epoch"] == 2 for s in db.shards.values())
+    assert a.heartbeat() == []                                   # "a" volta e descobre que perdeu
+    assert a.stats["lost"] == 4 and a.owned == []
+
+
+def test_heartbeat_renews_leases():
+    db = FakeDB(2)
+    a, b = coordinator(db, "a"), coordinator(db, "b")
+    a.claim()
+    for _ in range(3):
+        db.now += LEASE - 1
+        assert a.heartbeat() == [0, 1]
+    assert b.claim() == []                                       # nada vencido para retomar
+
+
+# ---------- Pool do heartbeat ----------
+def test_heartbeat_uses_its_own_pool():
+    db = FakeDB(2)
+    hb_pool = FakePool(db)
+    a = coordinator(db, "a", heartbeat_pool=hb_pool)
+    a.claim()
+    a.pool.exhausted = True                                      # flush do ciclo segurando todas as conexões
+    assert a.heartbeat() == [0, 1]
+    assert hb_pool.requests == 1
+
+
+def test_shared_pool_is_the_fallback():
+    db = FakeDB(2)
+    a = coordinator(db, "a")
+    assert a.heartbeat_pool is a.pool
+
+
+def test_run_sharded_passes_heartbeat_pool_and_releases():
+    db = FakeDB(sharding.SHARD_COUNT)
+    hb_pool = FakePool(db)
+    seen = []
+    stats = run_sharded(FakePool(db), ["BTC-USD", "ETH-USD"], seen.append, replica_id="a",
+                        cycle_sec=0, max_cycles=2, stop=threading.Event(), heartbeat_pool=hb_pool)
+    assert seen == [["BTC-USD", "ETH-USD"]] * 2
+    assert stats["cycles"] == 2 and stats["cycle_errors"] == 0
+    assert set(db.owners().values()) == {None} and db.replicas == {}   # leases soltos na saída
+
+
+@pytest.mark.parametrize("heartbeat_sec", [10, 20])
+def test_heartbeat_must_be_shorter_than_lease(heartbeat_sec):
+    with pytest.raises(ValueError):
+        ShardCoordinator(FakePool(FakeDB(1)), "a", lease_sec=10, heartbeat_sec=heartbeat_sec)
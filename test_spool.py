@@ -0,0 +1,132 @@
+# test_spool.py
+# pytest: segmentos do spool (ordem, limite de tamanho, commit), replay e upgrade v1 -> v2
+import json
+from datetime import datetime
+
+import pytest
+
+import runs
+import spool
+from spool import Spool
+
+TS = datetime(2024, 1, 1, 10, 0)
+
+
+def row(symbol="BTC-USD", price=100.0, volume=10, run_id=7, ts=TS):
+    # layout do UPSERT_SQL: (symbol, name, price, change, volume, ts, run_id, is_valid, bits)
+    return (symbol, symbol, price, 1.5, volume, ts, run_id, 1, 0)
+
+
+@pytest.fixture
+def wal(tmp_path):
+    return Spool(str(tmp_path), max_bytes=10_000, replay_interval_sec=0)
+
+
+@pytest.fixture
+def upserts(monkeypatch):
+    """Troca o upsert_rows do spool por um fake; .fail = True simula banco fora."""
+    class FakeUpsert:
+        def __init__(self):
+            self.fail = False
+            self.calls = []
+
+        def __call__(self, pool, sql, rows, statement_rows):
+            self.calls.append(list(rows))
+            return (0, 1) if self.fail else (len(rows), 0)
+    fake = FakeUpsert()
+    monkeypatch.setattr(spool, "upsert_rows", fake)
+    return fake
+
+
+def test_append_roundtrip_preserves_types(wal):
+    path = wal.append("s1", "BTC-USD", [row()])
+    header, rows = Spool.read(path)
+    assert header["v"] == spool.SEGMENT_VERSION and header["rows"] == 1 and header["ticker"] == "BTC-USD"
+    assert rows == [row()]
+    assert isinstance(rows[0][5], datetime)
+    assert not any(p.endswith(".tmp") for p in map(str, wal.segments()))
+
+
+def test_segments_oldest_first_and_commit_removes(wal):
+    paths = [wal.append("s1", t, [row(t)]) for t in ("A/B", "C", "D")]
+    assert wal.segments() == paths
+    assert "A_B" in paths[0]                       # ticker sanitizado no nome do arquivo
+    wal.commit(paths[:2])
+    wal.commit(paths[:1])                          # commit repetido não falha
+    assert wal.segments() == paths[2:]
+
+
+def test_size_bound_drops_oldest(tmp_path):
+    probe = Spool(str(tmp_path / "probe"))
+    size = len(open(probe.append("s", "X", [row()]), "rb").read())
+    wal = Spool(str(tmp_path / "bounded"), max_bytes=size * 2 + size // 2)
+    first, second, third = (wal.append("s", t, [row()]) for t in ("A", "B", "C"))
+    assert wal.segments() == [second, third]
+    assert wal.stats["dropped_segments"] == 1
+    assert wal.append("s", "BIG", [row()] * 50) is None   # maior que o limite inteiro: não grava
+    assert wal.segments() == [second, third]
+
+
+def test_replay_batches_and_commits(wal, upserts):
+    for t in ("A", "B", "C"):
+        wal.append("s1", t, [row(t), row(t, ts=datetime(2024, 1, 1, 11))])
+    result = wal.replay(None, "SQL", max_rows=4)
+    assert [len(c) for c in upserts.calls] == [4, 2]
+    assert result["segments"] == 3 and result["rows"] == 6 and result["pending"] == 0
+    assert wal.summary()["spool_replayed_rows"] == 6
+
+
+def test_replay_stops_on_db_error_and_keeps_segments(wal, upserts):
+    wal.append("s1", "A", [row("A")])
+    wal.append("s1", "B", [row("B")])
+    upserts.fail = True
+    result = wal.replay(None, "SQL", max_rows=1)
+    assert len(upserts.calls) == 1
+    assert result["segments"] == 0 and result["pending"] == 2
+
+
+def test_replay_resolves_unregistered_run_id(tmp_path, upserts):
+    resolved = []
+    wal = Spool(str(tmp_path), resolve_run=lambda sid: resolved.append(sid) or 42)
+    wal.append("scrape-x", "A", [row("A", run_id=runs.UNREGISTERED_RUN)])
+    wal.append("scrape-x", "B", [row("B", run_id=runs.UNREGISTERED_RUN)])
+    wal.replay(None, "SQL")
+    assert {r[spool.RUN_ID_COL] for r in upserts.calls[0]} == {42}
+    assert resolved == ["scrape-x"]                # resolvido uma vez por scrape_id
+
+
+def test_v1_segment_upgraded_on_replay(tmp_path, upserts):
+    wal = Spool(str(tmp_path))
+    v1_rows = [
+        # (symbol, name, price, change, volume, timestamp, source, scrape_id, is_valid, quality_flags, created_at)
+        ["BTC-USD", "BTC-USD", None, 0.1, 0, {"$dt": "2024-01-01T10:00:00"}, "yahoo", "old", 0, "{}",
+         {"$dt": "2024-01-01T10:05:00"}],
+        ["ETH-USD", "ETH-USD", 5.0, 0.2, 9, {"$dt": "2024-01-01T10:00:00"}, "yahoo", "old", 1, "{}",
+         {"$dt": "2024-01-01T10:05:00"}],
+    ]
+    lines = [json.dumps({"v": 1, "scrape_id": "old", "ticker": "MIX", "rows": 2})] + [json.dumps(r) for r in v1_rows]
+    (tmp_path / ("%020d_old_MIX%s" % (1, spool.SEGMENT_SUFFIX))).write_text("\n".join(lines) + "\n")
+    result = wal.replay(None, "SQL")
+    assert result["segments"] == 1
+    btc, eth = upserts.calls[0]
+    assert btc == ("BTC-USD", "BTC-USD", None, 0.1, 0, TS, runs.UNREGISTERED_RUN, 0,
+                   runs.QB_NULL_PRICE | runs.QB_ZERO_VOLUME)
+    assert eth == ("ETH-USD", "ETH-USD", 5.0, 0.2, 9, TS, runs.UNREGISTERED_RUN, 1, 0)
+
+
+def test_unreadable_and_unknown_version_segments_skipped(wal, upserts, tmp_path):
+    (tmp_path / ("%020d_bad_X%s" % (1, spool.SEGMENT_SUFFIX))).write_text("{broken")
+    (tmp_path / ("%020d_v9_Y%s" % (2, spool.SEGMENT_SUFFIX))).write_text(json.dumps({"v": 9}) + "\n[1]\n")
+    wal.append("s1", "A", [row("A")])
+    result = wal.replay(None, "SQL")
+    assert result["segments"] == 1 and len(upserts.calls[0]) == 1
+    assert result["pending"] == 2                  # ficam para inspeção
+
+
+def test_maybe_replay_respects_interval(tmp_path, upserts):
+    wal = Spool(str(tmp_path), replay_interval_sec=3600)
+    assert wal.maybe_replay(None, "SQL") is None   # nada pendente
+    wal.append("s1", "A", [row("A")])
+    assert wal.maybe_replay(None, "SQL")["segments"] == 1
+    wal.append("s1", "B", [row("B")])
+    assert wal.maybe_replay(None, "SQL") is None   # replay recente
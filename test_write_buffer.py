@@ -0,0 +1,139 @@
+# test_write_buffer.py
+# pytest: reescrita multi-linha do multirow_sql para cada template do pipeline e o
+# upsert_rows (lotes, rollback, fallback para executemany) com pool falso
+import re
+from unittest import mock
+
+import pytest
+from mysql.connector import Error
+
+import features
+import stream
+from write_buffer import multirow_sql, upsert_rows
+
+with mock.patch("mysql.connector.pooling.MySQLConnectionPool"):
+    import run_once
+    import yahoo_scraper
+
+TEMPLATES = {
+    "raw_crypto": (yahoo_scraper.UPSERT_SQL, 9),
+    "raw_crypto_backfill": (run_once.UPSERT_SQL, 9),
+    "features": (features._upsert_sql(features.feature_columns([24, 168])), 4 + 1 + 4 * 2 + 1),
+    "latest_prices": (stream.LATEST_UPSERT_SQL, 5),
+}
+
+
+# ---------- multirow_sql ----------
+@pytest.mark.parametrize("name", sorted(TEMPLATES))
+def test_rewrites_each_template(name):
+    sql, n_cols = TEMPLATES[name]
+    out = multirow_sql(sql, 3)
+    row = "(" + ", ".join(["%s"] * n_cols) + ")"
+    assert out.count(row) == 3
+    assert out.count("%s") == 3 * n_cols
+    assert ", ".join([row] * 3) in out
+    head, tail = out.split(", ".join([row] * 3))
+    assert head.rstrip().upper().endswith("VALUES")
+    assert "ON DUPLICATE KEY UPDATE" in tail                       # cláusula de update preservada
+    assert not out.rstrip().endswith(";")
+
+
+def test_single_row_is_the_template_without_semicolon():
+    sql, _ = TEMPLATES["raw_crypto"]
+    assert multirow_sql(sql, 1).strip() == sql.strip().rstrip(";").strip()
+
+
+def test_features_tail_keeps_values_references():
+    sql, _ = TEMPLATES["features"]
+    out = multirow_sql(sql, 2)
+    assert "`close` = VALUES(`close`)" in out and "`updated_at` = VALUES(`updated_at`)" in out
+
+
+@pytest.mark.parametrize("sql", [
+    "INSERT INTO t (a, b) VALUES (%s, NOW())",                     # função dentro da tupla
+    "INSERT INTO t (a) SELECT %s",
+    "UPDATE t SET a = %s",
+])
+def test_unparsable_template_raises(sql):
+    with pytest.raises(ValueError):
+        multirow_sql(sql, 2)
+
+
+# ---------- upsert_rows ----------
+class FakeCursor:
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.rowcount = 0
+        self.fail_on = fail_on
+
+    def execute(self, sql, params):
+        if self.fail_on is not None and len(self.calls) == self.fail_on:
+            raise Error("boom")
+        self.calls.append(("execute", sql, list(params)))
+        self.rowcount = len(re.findall(r"\(%s", sql))
+
+    def executemany(self, sql, rows):
+        self.calls.append(("executemany", sql, list(rows)))
+        self.rowcount = len(rows)
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = self.rolled_back = False
+
+    def cursor(self):
+        return self._cursor
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, cursor):
+        self.conn = FakeConn(cursor)
+
+    def get_connection(self):
+        return self.conn
+
+
+SQL = "INSERT INTO t (a, b) VALUES (%s, %s) ON DUPLICATE KEY UPDATE b = VALUES(b)"
+ROWS = [(i, i * 10) for i in range(5)]
+
+
+def test_batches_into_multirow_statements_in_one_transaction():
+    cursor = FakeCursor()
+    pool = FakePool(cursor)
+    assert upsert_rows(pool, SQL, ROWS, statement_rows=2) == (5, 0)
+    assert [c[2] for c in cursor.calls] == [[0, 0, 1, 10], [2, 20, 3, 30], [4, 40]]
+    assert cursor.calls[0][1] == multirow_sql(SQL, 2) and cursor.calls[2][1] == multirow_sql(SQL, 1)
+    assert pool.conn.committed
+
+
+def test_db_error_rolls_back_everything():
+    cursor = FakeCursor(fail_on=1)
+    pool = FakePool(cursor)
+    assert upsert_rows(pool, SQL, ROWS, statement_rows=2) == (0, 1)
+    assert pool.conn.rolled_back and not pool.conn.committed
+
+
+def test_unparsable_template_falls_back_to_executemany():
+    cursor = FakeCursor()
+    pool = FakePool(cursor)
+    sql = "INSERT INTO t (a, b, seen_at) VALUES (%s, %s, NOW())"
+    assert upsert_rows(pool, sql, ROWS, statement_rows=2) == (5, 0)
+    assert [(c[0], c[1]) for c in cursor.calls] == [("executemany", sql)] * 3
+    assert [len(c[2]) for c in cursor.calls] == [2, 2, 1]
+    assert pool.conn.committed
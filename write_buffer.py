@@ -0,0 +1,193 @@
+"""
+write_buffer.py
+
+Buffer de escrita compartilhado entre tickers:
+- Acumula linhas já preparadas de vários tickers
+- Faz flush quando atinge WRITE_BUFFER_ROWS linhas ou WRITE_BUFFER_MAX_AGE_SEC segundos
+- Cada flush = UMA transação (tudo ou nada) com INSERTs multi-linha de
+  WRITE_BUFFER_STATEMENT_ROWS linhas cada
+- Registra tamanho e latência de cada flush
+- Opcional: com um spool.Spool, cada lote adicionado vira um segmento durável
+  antes da escrita e só é apagado depois do commit do flush
+
+Com os defaults, um ciclo do scraper (poucos tickers x poucas barras novas) vira
+um único commit em vez de um commit por ticker.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from mysql.connector import Error
+
+import profiling
+
+# -------------------- Config (ENV-friendly) --------------------
+# 0 desativa o gatilho correspondente (flush só no final do ciclo)
+WRITE_BUFFER_ROWS = int(os.getenv("WRITE_BUFFER_ROWS", "20000"))
+WRITE_BUFFER_MAX_AGE_SEC = float(os.getenv("WRITE_BUFFER_MAX_AGE_SEC", "60"))
+WRITE_BUFFER_STATEMENT_ROWS = int(os.getenv("WRITE_BUFFER_STATEMENT_ROWS", os.getenv("BATCH_SIZE", "500")))
+# --------------------------------------------------------------
+
+logger = logging.getLogger("pipeline.write_buffer")
+
+# a tupla do VALUES só pode ter placeholders: `VALUES (%s, NOW())` não é reescrito
+_VALUES_RE = re.compile(
+    r"^(?P<head>.*?\bVALUES\s*)(?P<row>\((?:\s*%s\s*,)*\s*%s\s*\))(?P<tail>.*?);?\s*$", re.S | re.I
+)
+
+
+def multirow_sql(sql: str, n_rows: int) -> str:
+    """Transforma `INSERT ... VALUES (%s, ...) ON DUPLICATE ...` num INSERT com n_rows tuplas.
+    Levanta ValueError se o template não tiver um VALUES só com placeholders."""
+    m = _VALUES_RE.match(sql)
+    if not m:
+        raise ValueError("SQL sem cláusula VALUES (%%s, ...): %r" % sql[:80])
+    return m.group("head") + ", ".join([m.group("row")] * n_rows) + m.group("tail")
+
+
+def upsert_rows(pool, sql: str, rows: Sequence[tuple], statement_rows: int = WRITE_BUFFER_STATEMENT_ROWS) -> Tuple[int, int]:
+    """
+    Grava `rows` numa única transação usando INSERTs multi-linha.
+    Retorna (affected_rows, error_count); erros de banco (inclusive sem conexão)
+    nunca propagam, voltam em error_count. Template que o multirow_sql não reescreve
+    cai para executemany.
+    """
+    if not rows:
+        return 0, 0
+    with profiling.io("db"):
+        statement_rows = max(1, statement_rows)
+        conn = cursor = None
+        inserted = 0
+        errors = 0
+        try:
+            full_sql = multirow_sql(sql, statement_rows)
+        except ValueError:
+            # template que não dá para reescrever: executemany com o SQL original
+            logger.warning("Cannot build multi-row INSERT, falling back to executemany: %r", sql[:80])
+            full_sql = None
+        try:
+            # pool esgotado / banco fora (PoolError, InterfaceError) também é um flush falho
+            conn = pool.get_connection()
+            cursor = conn.cursor()
+            conn.start_transaction()
+            for i in range(0, len(rows), statement_rows):
+                batch = rows[i:i + statement_rows]
+                if full_sql is None:
+                    cursor.executemany(sql, list(batch))
+                else:
+                    stmt = full_sql if len(batch) == statement_rows else multirow_sql(sql, len(batch))
+                    cursor.execute(stmt, [v for r in batch for v in r])
+                inserted += cursor.rowcount
+            conn.commit()
+        except Error as e:
+            logger.exception("DB error during flush (transaction will be rolled back): %s", e)
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception as e2:
+                    logger.exception("Error during rollback: %s", e2)
+            errors = 1
+            inserted = 0
+        finally:
+            for closable in (cursor, conn):
+                if closable is None:
+                    continue
+                try:
+                    closable.close()
+                except Exception:
+                    pass
+    return inserted, errors
+
+
+class WriteBuffer:
+    """
+    Coleta linhas de vários tickers e grava em flushes atômicos.
+
+    add() retorna o resultado do flush quando um gatilho (linhas/idade) dispara,
+    senão None. O chamador deve sempre chamar flush() no final do ciclo.
+    Resultado de flush():
+        {"rows": n, "affected": n, "errors": 0|1, "latency_ms": x,
+         "statements": n, "keys": {ticker: n_rows}}
+    """
+
+    def __init__(self, pool, sql: str, max_rows: int = WRITE_BUFFER_ROWS,
+                 max_age_sec: float = WRITE_BUFFER_MAX_AGE_SEC,
+                 statement_rows: int = WRITE_BUFFER_STATEMENT_ROWS, spool=None):
+        self.pool = pool
+        self.spool = spool
+        self.sql = sql
+        self.max_rows = max_rows
+        self.max_age_sec = max_age_sec
+        self.statement_rows = max(1, statement_rows)
+        self.flushes: List[Dict] = []
+        self._rows: List[tuple] = []
+        self._keys: Dict[str, int] = {}
+        self._first_ts: Optional[float] = None
+        self._segments: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def should_flush(self) -> bool:
+        if not self._rows:
+            return False
+        if self.max_rows and len(self._rows) >= self.max_rows:
+            return True
+        return bool(self.max_age_sec) and time.time() - self._first_ts >= self.max_age_sec
+
+    def add(self, key: str, rows: Sequence[tuple], scrape_id: str = "") -> Optional[Dict]:
+        if not rows:
+            return None
+        segment = self.spool.append(scrape_id, key, rows) if self.spool is not None else None
+        with self._lock:
+            if segment:
+                self._segments.append(segment)
+            if self._first_ts is None:
+                self._first_ts = time.time()
+            self._rows.extend(rows)
+            self._keys[key] = self._keys.get(key, 0) + len(rows)
+        return self.flush() if self.should_flush() else None
+
+    def flush(self) -> Dict:
+        with self._lock:
+            rows, keys, segments = self._rows, self._keys, self._segments
+            self._rows, self._keys, self._first_ts, self._segments = [], {}, None, []
+        start = time.time()
+        affected, errors = upsert_rows(self.pool, self.sql, rows, self.statement_rows)
+        if self.spool is not None and not errors:
+            # comitado: os segmentos deste flush não são mais necessários;
+            # banco respondendo também é a hora de drenar pendências antigas
+            try:
+                self.spool.commit(segments)
+                self.spool.maybe_replay(self.pool, self.sql)
+            except (OSError, Error) as e:
+                # o flush já comitou; segmentos que sobrarem só são regravados (upsert idempotente)
+                logger.warning("Spool maintenance after flush failed: %s", e)
+        result = {
+            "rows": len(rows),
+            "affected": affected,
+            "errors": errors,
+            "latency_ms": (time.time() - start) * 1000,
+            "statements": -(-len(rows) // self.statement_rows),
+            "keys": keys,
+        }
+        if rows:
+            self.flushes.append({k: v for k, v in result.items() if k != "keys"})
+            logger.info("Flush rows=%d tickers=%d statements=%d latency_ms=%.1f errors=%d",
+                        result["rows"], len(keys), result["statements"], result["latency_ms"], errors)
+        return result
+
+    def summary(self) -> Dict:
+        """Agregado dos flushes do ciclo (para o dict de stats)."""
+        lat = [f["latency_ms"] for f in self.flushes]
+        return {
+            "flushes": len(self.flushes),
+            "flush_rows_max": max((f["rows"] for f in self.flushes), default=0),
+            "flush_ms_total": round(sum(lat), 1),
+            "flush_ms_max": round(max(lat, default=0.0), 1),
+        }
@@ -4,10 +4,15 @@ yahoo_scraper.py
 
 Versão simplificada do scraper:
 - Sem Prometheus / métricas externas
-- Retry/backoff no fetch (yfinance)
-- Trunca timestamps para hora (idempotência)
-- Validação básica + quality_flags armazenadas (JSON)
-- Upsert em lote para `raw_crypto`
+- Retry no fetch (yfinance) com limiter adaptativo (AIMD) + circuit breaker
+- Trunca timestamps para hora (idempotência); barras sub-hora são reamostradas (OHLCV)
+- Validação básica: quality_flags por ticker em scrape_run_tickers (runs.py),
+  só uma máscara quality_bits por linha em raw_crypto
+- Upsert em lote para `raw_crypto` (WriteBuffer: um commit por ciclo/flush)
+- --stream: polling de barras de 1m com tabela quente `latest_prices` (stream.py)
+  e consolidação horária em `raw_crypto`
+- --shard-mode: várias réplicas dividem o --tickers por leases em MySQL
+  (sharding.py); cada uma coleta só os próprios shards a cada SHARD_CYCLE_SEC
 - Config via ENV vars
 
 Requisitos mínimos:
@@ -17,17 +22,24 @@ pip install pandas yfinance mysql-connector-python python-dateutil
 import os
 import time
 import uuid
-import json
 import logging
 import requests
 from datetime import datetime
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 
 import pandas as pd
-import yfinance as yf
-import mysql.connector
 from mysql.connector import pooling, Error
 
+import ratelimit
+from negative_cache import NegativeCache
+import spool
+import profiling
+import schema
+import features
+import runs
+from ohlcv import STORE_FREQ, resample_ohlcv
+from write_buffer import WriteBuffer
+
 # -----------------------
 # Config (via ENV)
 # -----------------------
@@ -39,7 +51,12 @@ DB_NAME = os.getenv("MYSQL_DB", "projet_crypto")
 
 REQUESTS_PER_SECOND = float(os.getenv("RPS", "2.0"))
 RETRY_MAX = int(os.getenv("RETRY_MAX", "3"))
+EMPTY_RETRY_MAX = int(os.getenv("EMPTY_RETRY_MAX", "1"))
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "500"))
+MANAGE_PARTITIONS = os.getenv("MANAGE_PARTITIONS", "1") == "1"
+FEATURES_ENABLED = os.getenv("FEATURES_ENABLED", "1") == "1"
+# read_api.py (cache de leitura); vazio = não invalida
+READ_API_URL = os.getenv("READ_API_URL", "")
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 # -----------------------
@@ -50,6 +67,10 @@ logger.setLevel(LOG_LEVEL)
 handler = logging.StreamHandler()
 handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
 logger.addHandler(handler)
+# módulos compartilhados (schema, write_buffer, ...) logam sob "pipeline.*"
+pipeline_logger = logging.getLogger("pipeline")
+pipeline_logger.setLevel(LOG_LEVEL)
+pipeline_logger.addHandler(handler)
 
 # ---------- DB pool ----------
 POOL = pooling.MySQLConnectionPool(
@@ -62,75 +83,73 @@ POOL = pooling.MySQLConnectionPool(
 def make_scrape_id() -> str:
     return uuid.uuid4().hex
 
-def _sleep_rate_control(last_ts: float, rps: float) -> float:
-    min_interval = 1.0 / max(1.0, rps)
-    elapsed = time.time() - last_ts
-    if elapsed < min_interval:
-        time.sleep(min_interval - elapsed)
-    return time.time()
-
-def truncate_to_hour(ts: pd.Timestamp) -> datetime:
-    """
-    Recebe um pandas Timestamp (tz-aware ou naive), converte para UTC e trunca para hora.
-    Retorna datetime (naive UTC) adequado para gravar em DATETIME(6).
-    """
-    if not isinstance(ts, pd.Timestamp):
-        ts = pd.Timestamp(ts)
-    # garantir tz-aware em UTC
-    if ts.tz is None:
-        ts = ts.tz_localize("UTC")
+# ---------- Fetch with retries ----------
+def normalize_download(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas Open/High/Low/Close/Volume simples, índice tz-aware UTC e tipos numéricos."""
+    if isinstance(df.columns, pd.MultiIndex):
+        out = pd.DataFrame(index=df.index)
+        for col in ["Open", "High", "Low", "Close", "Volume"]:
+            matches = [c for c in df.columns if c[0] == col]
+            out[col] = df[matches[0]] if matches else pd.NA
+        df = out
+    else:
+        df = df.rename(columns=lambda s: s.capitalize())
+    # ensure timezone UTC
+    if df.index.tz is None:
+        df.index = df.index.tz_localize("UTC")
     else:
-        ts = ts.tz_convert("UTC")
-    ts = ts.replace(minute=0, second=0, microsecond=0)
-    return ts.to_pydatetime().replace(tzinfo=None)
+        df.index = df.index.tz_convert("UTC")
+    # coerce types
+    for c in ["Open", "High", "Low", "Close"]:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    if "Volume" in df.columns:
+        df["Volume"] = pd.to_numeric(df["Volume"], errors="coerce").fillna(0).astype("Int64")
+    return df
+
+def _empty_frame(reason: str) -> pd.DataFrame:
+    """DataFrame vazio com o motivo em attrs: 'no_data' (upstream sem dados) ou 'errors'."""
+    df = pd.DataFrame()
+    df.attrs["empty_reason"] = reason
+    return df
 
-# ---------- Fetch with retries ----------
 def fetch_ticker_df(ticker: str, period: str = "7d", interval: str = "1h", retry_max: int = RETRY_MAX) -> pd.DataFrame:
+    """
+    Baixa o ticker respeitando o limiter adaptativo (AIMD) e o circuit breaker do Yahoo.
+    Falhas (429/timeout/erro) reduzem a taxa; resultado vazio não tem backoff — só
+    EMPTY_RETRY_MAX novas tentativas no ritmo do limiter.
+    Levanta ratelimit.CircuitOpenError se o breaker estiver aberto.
+    """
+    limiter, breaker = ratelimit.for_host(initial_rps=REQUESTS_PER_SECOND)
     attempt = 0
-    last_call = 0.0
+    empties = 0
     while attempt <= retry_max:
         attempt += 1
+        breaker.check()
+        limiter.acquire()
         try:
-            last_call = _sleep_rate_control(last_call, REQUESTS_PER_SECOND)
             logger.debug("fetching %s (period=%s interval=%s) attempt=%d", ticker, period, interval, attempt)
-            df = yf.download(ticker, period=period, interval=interval, auto_adjust=False, threads=False, progress=False)
-            if df is None or df.empty:
-                logger.warning("Empty result for %s (attempt %d)", ticker, attempt)
-                if attempt <= retry_max:
-                    time.sleep(2 ** attempt)
-                    continue
-                return pd.DataFrame()
-            # Normalize columns
-            if isinstance(df.columns, pd.MultiIndex):
-                out = pd.DataFrame(index=df.index)
-                for col in ["Open", "High", "Low", "Close", "Volume"]:
-                    matches = [c for c in df.columns if c[0] == col]
-                    out[col] = df[matches[0]] if matches else pd.NA
-                df = out
-            else:
-                df = df.rename(columns=lambda s: s.capitalize())
-            # ensure timezone UTC
-            if df.index.tz is None:
-                df.index = df.index.tz_localize("UTC")
-            else:
-                df.index = df.index.tz_convert("UTC")
-            # coerce types
-            for c in ["Open", "High", "Low", "Close"]:
-                if c in df.columns:
-                    df[c] = pd.to_numeric(df[c], errors="coerce")
-            if "Volume" in df.columns:
-                df["Volume"] = pd.to_numeric(df["Volume"], errors="coerce").fillna(0).astype("Int64")
-            return df
+            with profiling.io("http"):
+                df = ratelimit.yf_history(ticker, period=period, interval=interval, auto_adjust=False, actions=False)
         except Exception as e:
-            logger.exception("Error fetching %s: %s", ticker, e)
-            if attempt <= retry_max:
-                wait = min(60, 2 ** attempt)
-                logger.info("Retrying %s in %ds", ticker, wait)
-                time.sleep(wait)
-            else:
-                logger.error("Giving up fetching %s after %d attempts", ticker, attempt)
-                return pd.DataFrame()
-    return pd.DataFrame()
+            kind = ratelimit.classify_failure(e)
+            limiter.on_failure(kind)
+            breaker.record_failure()
+            logger.warning("Error fetching %s (%s, attempt %d): %s", ticker, kind, attempt, e)
+            continue
+        if df is None or df.empty:
+            # upstream respondeu, só não há dados: não penaliza a taxa nem o breaker
+            breaker.record_success()
+            empties += 1
+            logger.warning("Empty result for %s (attempt %d)", ticker, attempt)
+            if empties <= EMPTY_RETRY_MAX:
+                continue
+            return _empty_frame("no_data")
+        limiter.on_success()
+        breaker.record_success()
+        return normalize_download(df)
+    logger.error("Giving up fetching %s after %d attempts", ticker, attempt)
+    return _empty_frame("errors")
 
 # ---------- Basic quality checks ----------
 def compute_quality_flags(df: pd.DataFrame) -> Dict:
@@ -150,126 +169,177 @@ def compute_quality_flags(df: pd.DataFrame) -> Dict:
     return flags
 
 # ---------- Upsert (batch) ----------
+# metadados do run (scrape_id, source, flags, horário) ficam em scrape_runs;
+# cada linha leva só run_id + quality_bits (runs.QB_*)
 UPSERT_SQL = """
 INSERT INTO raw_crypto
-(symbol, name, price_usd, change_24h_percent, volume_24h_usd, timestamp, source, scrape_id, is_valid, quality_flags, created_at)
-VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+(symbol, name, price_usd, change_24h_percent, volume_24h_usd, timestamp, run_id, is_valid, quality_bits)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
 ON DUPLICATE KEY UPDATE
     price_usd = VALUES(price_usd),
     change_24h_percent = VALUES(change_24h_percent),
     volume_24h_usd = VALUES(volume_24h_usd),
-    source = VALUES(source),
-    scrape_id = VALUES(scrape_id),
+    run_id = VALUES(run_id),
     is_valid = VALUES(is_valid),
-    quality_flags = VALUES(quality_flags),
-    created_at = VALUES(created_at)
+    quality_bits = VALUES(quality_bits)
 ;
 """
 
-def upsert_dataframe_to_raw(ticker: str, name: str, df: pd.DataFrame, scrape_id: str, source: str = "yahoo_finance") -> Tuple[int,int]:
-    """Converte DataFrame em linhas com timestamp truncado e faz upsert em lote.
-    Usa transação explícita para garantir atomicidade por execução.
-    Retorna (rows_processed, error_count).
-    """
+def prepare_rows(ticker: str, name: str, df: pd.DataFrame, run_id: int) -> List[tuple]:
+    """Converte DataFrame em tuplas no formato do UPSERT_SQL.
+    Barras sub-hora (--interval 5m/15m) são agregadas para a hora antes, então cada
+    (symbol, timestamp) aparece uma única vez no lote."""
     if df is None or df.empty:
-        return 0, 0
-
+        return []
+    bars = resample_ohlcv(df, STORE_FREQ)
+    idx = bars.index.tz_localize("UTC") if bars.index.tz is None else bars.index.tz_convert("UTC")
+    timestamps = idx.floor(STORE_FREQ).tz_localize(None).to_pydatetime()  # naive UTC truncated to hour
+    closes = bars["Close"] if "Close" in bars.columns else pd.Series(None, index=bars.index, dtype="float64")
+    volumes = bars["Volume"] if "Volume" in bars.columns else pd.Series(0, index=bars.index)
+    base_bits = runs.QB_RESAMPLED if bars is not df else 0
+    change_pct = None  # calcular no ETL downstream
     rows = []
-    now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    for ts, row in df.iterrows():
-        try:
-            ts_trunc = truncate_to_hour(ts)  # datetime naive UTC truncated to hour
-            price = None if pd.isna(row.get("Close")) else float(row.get("Close"))
-            volume = 0 if pd.isna(row.get("Volume")) else int(row.get("Volume"))
-            change_pct = None  # calcular no ETL downstream
-            quality = {}  # por linha, se quiser popular
-            rows.append((ticker, name, price, change_pct, volume, ts_trunc, source, scrape_id, True, json.dumps(quality), now))
-        except Exception as e:
-            logger.exception("Row prepare error for %s %s: %s", ticker, ts, e)
-            # não aborta a preparação; apenas ignora linha que deu problema
-            continue
-
-    if not rows:
-        return 0, 0
-
-    conn = POOL.get_connection()
-    # garantir que autocommit está DESLIGADO (pool foi criado com autocommit=False, mas checamos)
-    try:
-        conn.autocommit = False
-    except Exception:
-        # se pool/connector não suportar esse atributo, ignore; usaremos start_transaction abaixo
-        pass
-
-    cursor = conn.cursor()
-    inserted = 0
-    errors = 0
-
+    for ts, price, volume in zip(timestamps, closes, volumes):
+        price = None if pd.isna(price) else float(price)
+        volume = 0 if pd.isna(volume) else int(volume)
+        bits = base_bits | (runs.QB_NULL_PRICE if price is None else 0) | (runs.QB_ZERO_VOLUME if volume == 0 else 0)
+        rows.append((ticker, name, price, change_pct, volume, ts, run_id, True, bits))
+    return rows
+
+def _apply_flush(stats: Dict, result: Dict, tickers: Optional[Dict[str, Dict]] = None) -> List[str]:
+    """Contabiliza um flush do WriteBuffer: todos os tickers do flush comitam (ou falham) juntos.
+    Marca os tickers de um flush que falhou em `tickers` (scrape_run_tickers).
+    Retorna os tickers comitados."""
+    if not result or not result["rows"]:
+        return []
+    stats["rows"] += result["affected"]
+    key = "errors" if result["errors"] else "success"
+    stats[key] += len(result["keys"])
+    if result["errors"]:
+        for t in result["keys"]:
+            if tickers is not None and t in tickers:
+                tickers[t]["status"] = "write_error"
+        return []
+    invalidate_read_cache(list(result["keys"]))
+    return list(result["keys"])
+
+def spool_for_replay() -> Optional[spool.Spool]:
+    """Spool local (None se desativado); linhas de runs não registrados ganham run_id no replay."""
+    if not spool.SPOOL_ENABLED:
+        return None
+    return spool.Spool(resolve_run=lambda sid: runs.ensure_run(POOL, sid, "spool_replay", status="replayed"))
+
+def invalidate_read_cache(symbols: List[str]) -> None:
+    """Avisa o read_api.py que esses símbolos mudaram (best-effort, não bloqueia a coleta)."""
+    if not READ_API_URL or not symbols:
+        return
     try:
-        # Inicia transação explícita que cobrirá todos os batches
-        conn.start_transaction()
-        for i in range(0, len(rows), BATCH_SIZE):
-            batch = rows[i:i+BATCH_SIZE]
-            cursor.executemany(UPSERT_SQL, batch)
-            # NÃO comitar por batch — mantemos tudo na mesma transação para atomicidade
-            inserted += cursor.rowcount
-
-        # tudo ok: comitar a transação inteira
-        conn.commit()
-    except Error as e:
-        logger.exception("DB error during upsert (transaction will be rolled back): %s", e)
-        try:
-            conn.rollback()
-        except Exception as e2:
-            logger.exception("Error during rollback: %s", e2)
-        errors = 1
-        inserted = 0  # opcional: considerar que nada foi aplicado / contabilizar como 0
-    finally:
-        try:
-            cursor.close()
-        except Exception:
-            pass
-        try:
-            conn.close()
-        except Exception:
-            pass
-
-    return inserted, errors
+        with profiling.io("http"):
+            requests.post(READ_API_URL.rstrip("/") + "/invalidate", json={"symbols": symbols}, timeout=2)
+    except Exception as e:
+        logger.warning("Read cache invalidation failed: %s", e)
 
 
 # ---------- Main flow ----------
-def scrape_and_store(tickers: List[str], period: str = "7d", interval: str = "1h") -> Dict:
-    start_time = time.time()  # mede o início da execução
-    scrape_id = make_scrape_id()
-    logger.info("Starting scrape id=%s tickers=%s period=%s interval=%s",
-                scrape_id, tickers, period, interval)
-
-    stats = {"success": 0, "empty": 0, "errors": 0, "rows": 0}
+def _scrape_cycle(scrape_id: str, tickers: List[str], period: str, interval: str, start_time: float) -> Dict:
+    """Corpo do scrape_and_store: manutenção, replay, coleta/gravação, features, NiFi e run."""
+    stats = {"success": 0, "empty": 0, "errors": 0, "rows": 0, "short_circuited": 0, "skipped": 0}
+    ticker_meta: Dict[str, Dict] = {}
 
-    for t in tickers:
+    if MANAGE_PARTITIONS:
         try:
-            df = fetch_ticker_df(t, period=period, interval=interval)
-            flags = compute_quality_flags(df)
-
-            if df.empty:
-                logger.warning("Ticker %s returned empty df. flags=%s", t, flags)
-                stats["empty"] += 1
+            with profiling.stage("maintenance"), profiling.io("db"):
+                logger.info("Partition maintenance: %s", schema.maintain_partitions(POOL))
+        except Error as e:
+            # não bloqueia a coleta: o upsert ainda funciona nas partições existentes
+            logger.warning("Partition maintenance failed: %s", e)
+    run_id = runs.ensure_run(POOL, scrape_id, "yahoo_scraper", interval)
+
+    wal = spool_for_replay()
+    if wal is not None:
+        # primeiro o que ficou de execuções anteriores (mais antigo primeiro)
+        try:
+            with profiling.stage("replay"):
+                wal.replay(POOL, UPSERT_SQL)
+        except Exception as e:
+            # banco/disco fora: as pendências ficam no spool para o próximo replay
+            logger.warning("Spool replay failed, segments kept for later: %s", e)
+    buffer = WriteBuffer(POOL, UPSERT_SQL, spool=wal)
+    negative = NegativeCache()
+    written: List[str] = []
+    # barra mais antiga gravada por ticker: o features recalcula a partir dela
+    earliest: Dict[str, datetime] = {}
+    # (symbol, timestamp) gravados com run_id 0, reapontados se o run se registrar no fim
+    orphan_keys: List[Tuple[str, datetime]] = []
+    try:
+        for t in tickers:
+            if negative.should_skip(t, interval):
+                # ticker sabidamente vazio: não conta como falha nem gasta requisições
+                stats["skipped"] += 1
+                ticker_meta[t] = {"status": "skipped"}
                 continue
-
-            inserted, errs = upsert_dataframe_to_raw(
-                ticker=t, name=t, df=df, scrape_id=scrape_id
-            )
-            stats["rows"] += inserted
-
-            if errs == 0:
-                stats["success"] += 1
-            else:
+            try:
+                with profiling.stage("fetch"):
+                    df = fetch_ticker_df(t, period=period, interval=interval)
+                with profiling.stage("prepare"):
+                    flags = compute_quality_flags(df)
+
+                if df.empty:
+                    logger.warning("Ticker %s returned empty df. flags=%s", t, flags)
+                    stats["empty"] += 1
+                    ticker_meta[t] = {"status": "empty", "flags": flags}
+                    if df.attrs.get("empty_reason") == "no_data":
+                        negative.record_empty(t, interval)
+                    continue
+                negative.record_hit(t, interval)
+
+                with profiling.stage("prepare"):
+                    rows = prepare_rows(ticker=t, name=t, df=df, run_id=run_id)
+                    if rows:
+                        earliest[t] = min(r[5] for r in rows)
+                    if run_id == runs.UNREGISTERED_RUN:
+                        orphan_keys += [(t, r[5]) for r in rows]
+                logger.info("Ticker %s buffered=%d flags=%s", t, len(rows), flags)
+                ticker_meta[t] = {"status": "ok", "rows": len(rows), "flags": flags}
+                with profiling.stage("write"):
+                    written += _apply_flush(stats, buffer.add(t, rows, scrape_id=scrape_id), ticker_meta)
+
+            except ratelimit.CircuitOpenError:
+                # upstream fora do ar: pula o resto do ciclo sem gastar requisições
+                stats["short_circuited"] += 1
+                ticker_meta[t] = {"status": "circuit_open"}
+            except Exception as e:
+                logger.exception("Unhandled error for %s: %s", t, e)
                 stats["errors"] += 1
+                ticker_meta[t] = {"status": "error", "flags": {"exception": str(e)}}
+    finally:
+        # exceção no meio do loop: o que já se aprendeu sobre os tickers fica gravado
+        negative.save()
 
-            logger.info("Ticker %s inserted=%d errs=%d flags=%s", t, inserted, errs, flags)
+    if stats["short_circuited"]:
+        logger.warning("Circuit open: %d tickers skipped this cycle", stats["short_circuited"])
 
-        except Exception as e:
-            logger.exception("Unhandled error for %s: %s", t, e)
-            stats["errors"] += 1
+    # flush final: o restante do ciclo numa única transação
+    try:
+        with profiling.stage("write"):
+            written += _apply_flush(stats, buffer.flush(), ticker_meta)
+    except Exception as e:
+        # as linhas continuam no spool; o próximo run (ou replay) grava
+        logger.error("Final flush failed, rows stay spooled: %s", e)
+        stats["errors"] += 1
+    stats.update(buffer.summary())
+    if wal is not None:
+        stats.update(wal.summary())
+    stats.update(ratelimit.snapshot())
+
+    # feature store incremental: só as barras novas + lookback dos tickers gravados
+    # (raw_crypto guarda barras de STORE_FREQ, qualquer que seja o --interval baixado)
+    if FEATURES_ENABLED and written:
+        try:
+            with profiling.stage("features"):
+                features.update_features(POOL, written, interval=STORE_FREQ, changed=earliest)
+        except Error as e:
+            logger.warning("Feature update failed: %s", e)
 
     # calcula duração em ms
     duration_sec = time.time() - start_time
@@ -280,27 +350,80 @@ def scrape_and_store(tickers: List[str], period: str = "7d", interval: str = "1h
         "flow_name": "yahoo_scraper",
         "symbol": ",".join(tickers),  # ou um por vez, se preferir granularidade
         "records_total": stats["rows"],
-        "errors": stats["errors"],
+        "errors": stats["errors"] + stats["short_circuited"],
         "latencia_ms": latencia_ms,
-        "status": "success" if stats["errors"] == 0 else "failure",
-        "error_type": "none" if stats["errors"] == 0 else "scraper_error",
+        "status": "success" if stats["errors"] + stats["short_circuited"] == 0 else "failure",
+        "error_type": ("none" if stats["errors"] + stats["short_circuited"] == 0
+                       else "circuit_open" if stats["short_circuited"] else "scraper_error"),
         "regiao_origem": "scraper"
     }
 
     # envia direto para o NiFi via HTTP POST
     try:
-        resp = requests.post(
-            "http://nifi:8080/contentListener",  # ListenHTTP em HTTP
-            json=payload,
-            timeout=5
-        )   
+        with profiling.stage("notify"), profiling.io("http"):
+            resp = requests.post(
+                "http://nifi:8080/contentListener",  # ListenHTTP em HTTP
+                json=payload,
+                timeout=5
+            )
         if resp.status_code != 200:
             logger.warning("Falha ao enviar métricas para NiFi: %s", resp.text)
     except Exception as e:
         logger.error("Erro ao conectar ao NiFi: %s", e)
 
-    logger.info("Scrape finished id=%s stats=%s", scrape_id, stats)
-    return {"scrape_id": scrape_id, **stats}
+    profile_path = profiling.finish()
+    if profile_path:
+        stats["profile"] = profile_path
+    if run_id == runs.UNREGISTERED_RUN:
+        # banco voltou durante o ciclo? registra agora; as linhas no spool acham o run pelo scrape_id
+        run_id = runs.ensure_run(POOL, scrape_id, "yahoo_scraper", interval)
+        runs.adopt_rows(POOL, run_id, orphan_keys)
+    runs.finish_run(POOL, run_id, {**stats, "latencia_ms": round(latencia_ms, 1)}, ticker_meta)
+    logger.info("Scrape finished id=%s run_id=%s stats=%s", scrape_id, run_id, stats)
+    return {"scrape_id": scrape_id, "run_id": run_id, **stats}
+
+def scrape_and_store(tickers: List[str], period: str = "7d", interval: str = "1h", profile: bool = False) -> Dict:
+    start_time = time.time()  # mede o início da execução
+    scrape_id = make_scrape_id()
+    logger.info("Starting scrape id=%s tickers=%s period=%s interval=%s",
+                scrape_id, tickers, period, interval)
+    if profile or profiling.sampled():
+        profiling.start(scrape_id)
+    try:
+        return _scrape_cycle(scrape_id, tickers, period, interval, start_time)
+    finally:
+        # exceção no meio do run: fecha o profiler mesmo assim (no-op se já fechado)
+        profiling.finish()
+
+# ---------------- Streaming (--stream) ----------------
+def rollup_stream_bars(frames: Dict[str, pd.DataFrame], hour_start: datetime) -> List[str]:
+    """Callback do stream.run_stream: agrega as barras de 1m da hora fechada em 1h
+    e grava em raw_crypto (mesmo UPSERT do ciclo normal). Retorna os tickers gravados."""
+    scrape_id = make_scrape_id()
+    run_id = runs.ensure_run(POOL, scrape_id, "stream_rollup", "1m")
+    stats = {"success": 0, "errors": 0, "rows": 0}
+    ticker_meta: Dict[str, Dict] = {}
+    buffer = WriteBuffer(POOL, UPSERT_SQL, spool=spool_for_replay())
+    written: List[str] = []
+    for t, df in frames.items():
+        rows = prepare_rows(ticker=t, name=t, df=normalize_download(df), run_id=run_id)
+        ticker_meta[t] = {"status": "ok", "rows": len(rows), "flags": {"minute_bars": int(len(df))}}
+        written += _apply_flush(stats, buffer.add(t, rows, scrape_id=scrape_id), ticker_meta)
+    try:
+        written += _apply_flush(stats, buffer.flush(), ticker_meta)
+    except Exception as e:
+        # as barras da hora ficam no spool; o stream não pode morrer por um blip do banco
+        logger.error("Stream rollup flush failed, rows stay spooled: %s", e)
+        stats["errors"] += 1
+    runs.finish_run(POOL, run_id, stats, ticker_meta)
+    if FEATURES_ENABLED and written:
+        try:
+            features.update_features(POOL, written, interval=STORE_FREQ,
+                                     changed={t: hour_start for t in written})
+        except Error as e:
+            logger.warning("Feature update failed: %s", e)
+    logger.info("Stream rollup hour=%s id=%s stats=%s", hour_start, scrape_id, stats)
+    return written
 
 # ---------------- CLI ----------------
 if __name__ == "__main__":
@@ -309,8 +432,44 @@ if __name__ == "__main__":
     parser.add_argument("--tickers", required=True, help="Comma-separated e.g. BTC-USD,ETH-USD")
     parser.add_argument("--period", default="7d")
     parser.add_argument("--interval", default="1h")
+    parser.add_argument("--export-parquet", action="store_true",
+                        help="Após o scrape, exporta partições alteradas para PARQUET_EXPORT_DIR")
+    parser.add_argument("--profile", action="store_true",
+                        help="Grava relatório de CPU/memória/IO por etapa em PROFILE_DIR")
+    parser.add_argument("--stream", action="store_true",
+                        help="Modo near-real-time: polling de 1m, latest_prices e board HTTP (STREAM_PORT)")
+    parser.add_argument("--shard-mode", action="store_true",
+                        help="Divide os tickers entre réplicas via leases (sharding.py); roda em loop")
+    parser.add_argument("--replica-id", default=None,
+                        help="Identidade estável da réplica (default: SCRAPER_REPLICA_ID ou host-pid)")
+    parser.add_argument("--cycles", type=int, default=None, help="Com --shard-mode, para após N ciclos")
     args = parser.parse_args()
 
     tickers = [s.strip() for s in args.tickers.split(",") if s.strip()]
-    result = scrape_and_store(tickers, period=args.period, interval=args.interval)
+    if args.stream:
+        import stream
+        print(stream.run_stream(POOL, tickers, rollup_stream_bars))
+        raise SystemExit(0)
+    if args.shard_mode:
+        import sharding
+
+        def shard_cycle(shard_tickers: List[str]) -> Dict:
+            res = scrape_and_store(shard_tickers, period=args.period, interval=args.interval, profile=args.profile)
+            if args.export_parquet:
+                import parquet_export
+                res["export"] = parquet_export.export_incremental(POOL)
+            return res
+
+        # conexão própria para o heartbeat: no POOL ele competiria com o flush do ciclo
+        heartbeat_pool = pooling.MySQLConnectionPool(
+            pool_name="shard_heartbeat_pool", pool_size=1,
+            host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, database=DB_NAME, autocommit=False
+        )
+        print(sharding.run_sharded(POOL, tickers, shard_cycle, replica_id=args.replica_id, max_cycles=args.cycles,
+                                   heartbeat_pool=heartbeat_pool))
+        raise SystemExit(0)
+    result = scrape_and_store(tickers, period=args.period, interval=args.interval, profile=args.profile)
+    if args.export_parquet:
+        import parquet_export  # pyarrow só é necessário com --export-parquet
+        result["export"] = parquet_export.export_incremental(POOL)
     print(result)